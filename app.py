@@ -5,6 +5,19 @@ from flask_migrate import Migrate
 from extension import db
 from models import User
 from routes import api
+import cache
+import labs
+import counters
+import live
+import outbox
+import patient_import
+import recent_vitals
+import refdata
+import rollups
+import search_index
+import typeahead
+import vital_alerts
+import vitals_ingest
 from flask_cors import CORS
 import os
 
@@ -13,11 +26,17 @@ app = Flask(__name__)
 # Configure app
 app.config['JWT_SECRET_KEY'] = 'your-jwt-secret-key'
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///healthcare.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///healthcare.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize extensions
 db.init_app(app)
+cache.init_app(app)
+outbox.init_app(app)
+vitals_ingest.init_app(app)
+rollups.init_app(app)
+vital_alerts.init_app(app)
+live.init_app(app)
 CORS(app, origins=["http://localhost:5173"])
 jwt = JWTManager(app)
 migrate = Migrate(app, db)
@@ -30,14 +49,26 @@ login_manager.login_view = 'api.login'
 # User loader
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return refdata.get().users_by_id.get(int(user_id))
 
 # Register blueprints
 app.register_blueprint(api, url_prefix='/api')
 
+# Register CLI commands
+app.cli.add_command(counters.cli)
+app.cli.add_command(labs.cli)
+app.cli.add_command(outbox.cli)
+app.cli.add_command(patient_import.cli)
+app.cli.add_command(rollups.cli)
+app.cli.add_command(search_index.cli)
+
 # Create database tables
 with app.app_context():
     db.create_all()
+    counters.ensure_initialized()
+search_index.init_app(app)
+typeahead.init_app(app)
+recent_vitals.init_app(app)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
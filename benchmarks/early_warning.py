@@ -0,0 +1,108 @@
+"""Early-warning scoring of the whole ICU census, per patient vs. vectorized.
+
+Points the app at a throwaway SQLite database holding --patients ICU
+patients with --readings vital signs each, then times a refresh done the
+obvious way (latest VitalSign per patient through the ORM, scored in a
+Python loop) against early_warning.compute(), and the NumPy scoring step on
+its own.
+
+    python -m benchmarks.early_warning --patients 5000 --readings 50
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+
+def seed(path, patients, readings):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO patient (id, patient_id, first_name, last_name, in_icu, is_active) VALUES (?, ?, ?, ?, 1, 1)",
+        [(i, f"ICU-{i:05d}", f"Bed{i}", "Patient") for i in range(1, patients + 1)]
+    )
+    random.seed(7)
+    start = datetime.now() - timedelta(minutes=readings)
+    rows = []
+    for i in range(1, patients + 1):
+        for minute in range(readings):
+            systolic = random.randint(80, 180)
+            rows.append((i, start + timedelta(minutes=minute), random.randint(35, 150), random.randint(85, 100),
+                         round(random.uniform(34.5, 40.0), 1), f"{systolic}/80", systolic, 80))
+    conn.executemany(
+        "INSERT INTO vital_sign (patient_id, timestamp, heart_rate, oxygen_saturation, temperature, "
+        "blood_pressure, systolic, diastolic) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def band_score(value, bounds, points):
+    if value is None:
+        return 0
+    for bound, point in zip(bounds, points):
+        if value <= bound:
+            return point
+    return points[-1]
+
+
+def per_patient(Patient, VitalSign, BANDS):
+    ranked = []
+    for patient in Patient.query.filter_by(in_icu=True).all():
+        vital = VitalSign.query.filter_by(patient_id=patient.id).order_by(VitalSign.timestamp.desc()).first()
+        if vital is None:
+            continue
+        total = sum(band_score(getattr(vital, name), *BANDS[name]) for name in BANDS)
+        ranked.append((total, patient.patient_id))
+    ranked.sort(reverse=True)
+    return ranked
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--readings', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench_early_warning.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from models import Patient, VitalSign
+    import early_warning
+    import numpy as np
+
+    seed(path, args.patients, args.readings)
+    with app.app_context():
+        loop, ranked = timed(lambda: per_patient(Patient, VitalSign, early_warning.BANDS), max(1, args.repeat // 2))
+        vectorized, result = timed(early_warning.compute, args.repeat)
+        rows = early_warning.latest_vitals()
+        values = {name: np.array([row[4 + i] for row in rows], dtype=float)
+                  for i, name in enumerate(early_warning.PARAMETERS)}
+        scoring, _ = timed(lambda: early_warning.score(values), args.repeat)
+
+    assert [score for score, _ in ranked] == [patient['score'] for patient in result['patients']]
+    print(f"{args.patients} ICU patients, {args.patients * args.readings} readings")
+    print(f"per-patient ORM loop:  {loop * 1000:8.1f} ms")
+    print(f"early_warning.compute: {vectorized * 1000:8.1f} ms  (summary {result['summary']})")
+    print(f"  NumPy scoring alone: {scoring * 1000:8.2f} ms")
+
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
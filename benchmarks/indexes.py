@@ -0,0 +1,178 @@
+"""Query plans and latency of the route predicates with and without indexes.
+
+Builds a throwaway SQLite database from the models, fills it with a large
+synthetic dataset, then runs each hot query twice: once with only the
+primary keys and unique constraints, and once after creating the indexes
+declared in models.py.
+
+    python -m benchmarks.indexes --patients 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from extension import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+
+
+TODAY = date.today()
+
+QUERIES = [
+    ("today's appointments",
+     "SELECT * FROM appointment WHERE date = ? ORDER BY start_time",
+     lambda: (TODAY.isoformat(),)),
+    ("upcoming appointments by status",
+     "SELECT * FROM appointment WHERE status = ? AND date >= ? ORDER BY date, start_time LIMIT 200",
+     lambda: ('scheduled', TODAY.isoformat())),
+    ("doctor's appointments in window",
+     "SELECT COUNT(DISTINCT patient_id) FROM appointment WHERE doctor_id = ? AND date BETWEEN ? AND ?",
+     lambda: (random.randint(1, 50), (TODAY - timedelta(days=30)).isoformat(), TODAY.isoformat())),
+    ("patient appointment history",
+     "SELECT * FROM appointment WHERE patient_id = ? ORDER BY date DESC",
+     lambda: (random.randint(1, ARGS.patients),)),
+    ("critical unacknowledged labs",
+     "SELECT * FROM lab_result WHERE critical_flag = 1 AND acknowledged = 0 ORDER BY date DESC",
+     lambda: ()),
+    ("patient lab results",
+     "SELECT * FROM lab_result WHERE patient_id = ? ORDER BY date DESC",
+     lambda: (random.randint(1, ARGS.patients),)),
+    ("patient vital signs",
+     "SELECT * FROM vital_sign WHERE patient_id = ? ORDER BY timestamp DESC",
+     lambda: (random.randint(1, ARGS.patients),)),
+    ("latest notifications",
+     "SELECT * FROM notification ORDER BY timestamp DESC LIMIT 100",
+     lambda: ()),
+    ("latest audit log entries",
+     "SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 100",
+     lambda: ()),
+    ("pending actions by due date",
+     "SELECT * FROM pending_action ORDER BY due_date LIMIT 100",
+     lambda: ()),
+]
+
+
+def seed(conn, args):
+    rng = random.Random(42)
+    now = datetime.now()
+
+    def day(spread):
+        return (TODAY + timedelta(days=rng.randint(-spread, spread))).isoformat()
+
+    def moment(spread_days):
+        return (now - timedelta(seconds=rng.randint(0, spread_days * 86400))).isoformat(' ')
+
+    conn.executemany(
+        "INSERT INTO user (id, username, email, role, active) VALUES (?, ?, ?, ?, 1)",
+        [(i, f"user{i}", f"user{i}@hospital.com", 'doctor' if i <= 50 else 'nurse') for i in range(1, 101)]
+    )
+    conn.executemany(
+        "INSERT INTO patient (id, patient_id, first_name, last_name, in_icu, is_active, created_at) "
+        "VALUES (?, ?, ?, ?, ?, 1, ?)",
+        [(i, f"PT-{1000 + i}", f"First{i}", f"Last{i}", rng.random() < 0.05, moment(365))
+         for i in range(1, args.patients + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO appointment (patient_id, doctor_id, date, start_time, end_time, status, reason) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(rng.randint(1, args.patients), rng.randint(1, 50), day(180),
+          f"{rng.randint(8, 16):02d}:{rng.choice((0, 30)):02d}:00.000000", None,
+          rng.choice(('scheduled', 'completed', 'cancelled')), 'Follow-up')
+         for _ in range(args.patients * 10)]
+    )
+    conn.executemany(
+        "INSERT INTO lab_result (patient_id, test_name, result_value, date, critical_flag, acknowledged) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(rng.randint(1, args.patients), 'Potassium', '4.1 mmol/L', day(365),
+          rng.random() < 0.02, rng.random() < 0.9)
+         for _ in range(args.patients * 5)]
+    )
+    conn.executemany(
+        "INSERT INTO vital_sign (patient_id, heart_rate, blood_pressure, oxygen_saturation, temperature, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(rng.randint(1, args.patients), rng.randint(55, 110), '120/80', 97.0, 36.8, moment(90))
+         for _ in range(args.patients * 20)]
+    )
+    conn.executemany(
+        "INSERT INTO notification (patient_id, message, notification_type, read, timestamp) VALUES (?, ?, ?, 0, ?)",
+        [(rng.randint(1, args.patients), 'Reminder', 'appointment', moment(180)) for _ in range(args.patients * 5)]
+    )
+    conn.executemany(
+        "INSERT INTO audit_log (action, details, patient_id, user_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+        [('Chart Viewed', '', rng.randint(1, args.patients), rng.randint(1, 100), moment(180))
+         for _ in range(args.patients * 5)]
+    )
+    conn.executemany(
+        "INSERT INTO pending_action (patient_id, assigned_user_id, action_type, due_date, status) "
+        "VALUES (?, ?, 'follow_up', ?, 'pending')",
+        [(rng.randint(1, args.patients), rng.randint(1, 100), day(60)) for _ in range(args.patients)]
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def measure(conn, sql, params, repeat):
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params())]
+    timings = []
+    for _ in range(repeat):
+        args = params()
+        start = time.perf_counter()
+        conn.execute(sql, args).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return plan, statistics.median(timings)
+
+
+def run(conn, label, repeat):
+    print(f"\n=== {label} ===")
+    results = {}
+    for name, sql, params in QUERIES:
+        plan, median_ms = measure(conn, sql, params, repeat)
+        results[name] = median_ms
+        print(f"{name:35s} {median_ms:9.3f} ms   {' / '.join(plan)}")
+    return results
+
+
+def main():
+    global ARGS
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    ARGS = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_indexes.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    for index in indexes:
+        index.drop(engine)
+
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    seed(conn, ARGS)
+    print(f"Seeded {ARGS.patients} patients in {time.perf_counter() - started:.1f}s ({path})")
+
+    before = run(conn, 'without indexes', ARGS.repeat)
+    conn.close()
+
+    for index in indexes:
+        index.create(engine)
+    conn = sqlite3.connect(path)
+    conn.execute("ANALYZE")
+    after = run(conn, 'with indexes', ARGS.repeat)
+    conn.close()
+
+    print("\n=== speedup ===")
+    for name in before:
+        print(f"{name:35s} {before[name]:9.3f} ms -> {after[name]:9.3f} ms  ({before[name] / max(after[name], 1e-6):.1f}x)")
+
+    engine.dispose()
+    shutil.rmtree(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Anomaly detection throughput under simulated monitor load.
+
+Simulates --beds monitors reporting every --interval seconds for --minutes
+of ward time. Vitals wander around each patient's baseline, and a few beds
+deteriorate partway through (heart rate climbing, SpO2 and pressure
+falling). First feeds the readings straight to a Detector, reporting
+readings/s and how many abnormal values turned into alerts. Then pushes the
+same readings through POST /vital_signs/batch on a throwaway SQLite
+database, with detection on and off, to show its share of ingest cost.
+
+    python -m benchmarks.vital_alerts --beds 1000 --minutes 30
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+
+def simulate(beds, minutes, interval, deteriorating):
+    random.seed(11)
+    start = datetime.now() - timedelta(minutes=minutes)
+    failing = set(random.sample(range(1, beds + 1), deteriorating))
+    baselines = {bed: (random.gauss(78, 8), random.gauss(97, 1), random.gauss(36.9, 0.3), random.gauss(122, 10))
+                 for bed in range(1, beds + 1)}
+    steps = int(minutes * 60 / interval)
+    readings = []
+    for step in range(steps):
+        moment = start + timedelta(seconds=step * interval)
+        for bed in range(1, beds + 1):
+            hr, spo2, temp, sbp = baselines[bed]
+            # Deteriorating beds slide over the second half of the run
+            worse = max(0.0, (step / steps - 0.5) * 2) if bed in failing else 0.0
+            systolic = round(sbp - 45 * worse + random.gauss(0, 4))
+            readings.append({
+                'patient_id': bed,
+                'timestamp': moment,
+                'heart_rate': round(hr + 70 * worse + random.gauss(0, 2)),
+                'oxygen_saturation': min(100.0, round(spo2 - 10 * worse + random.gauss(0, 0.4), 1)),
+                'temperature': round(temp + 1.8 * worse + random.gauss(0, 0.05), 1),
+                'systolic': systolic,
+                'diastolic': round(systolic * 0.65 + random.gauss(0, 2)),
+            })
+    return readings
+
+
+def seed(path, beds):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO patient (id, patient_id, first_name, last_name, in_icu, is_active) VALUES (?, ?, ?, ?, 1, 1)",
+        [(i, f"ICU-{i:05d}", f"Bed{i}", "Patient") for i in range(1, beds + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def ingest(app, client, readings, batch):
+    import vitals_ingest
+    columns = ['patient_id', 'ts', 'hr', 'spo2', 'temp', 'sbp', 'dbp']
+    started = time.perf_counter()
+    for offset in range(0, len(readings), batch):
+        rows = [[f"ICU-{r['patient_id']:05d}", r['timestamp'].isoformat(), r['heart_rate'], r['oxygen_saturation'],
+                 r['temperature'], r['systolic'], r['diastolic']] for r in readings[offset:offset + batch]]
+        while True:
+            response = client.post('/api/vital_signs/batch', json={'columns': columns, 'rows': rows})
+            if response.status_code != 503:
+                break
+            time.sleep(0.05)
+        assert response.status_code == 202, response.get_data(as_text=True)
+    vitals_ingest.writer.flush()
+    return len(readings) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--beds', type=int, default=1000)
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=15, help='Seconds between readings per bed.')
+    parser.add_argument('--deteriorating', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench_vital_alerts.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from extension import db
+    import outbox
+    import vital_alerts
+
+    readings = simulate(args.beds, args.minutes, args.interval, args.deteriorating)
+    half = len(readings) // 2
+
+    detector = vital_alerts.Detector(app.config)
+    started = time.perf_counter()
+    for offset in range(0, len(readings), args.batch):
+        alerts, staged = detector.observe_many(readings[offset:offset + args.batch])
+        detector.commit(staged)
+    elapsed = time.perf_counter() - started
+    stats = detector.stats()
+    print(f"{args.beds} beds, {len(readings)} readings, {args.deteriorating} deteriorating")
+    print(f"detector alone:        {len(readings) / elapsed:10.0f} readings/s")
+    print(f"  {stats['abnormal_values']} abnormal values -> {stats['alerts']} alerts")
+
+    seed(path, args.beds)
+    client = app.test_client()
+    enabled = vital_alerts.detector
+    vital_alerts.detector = None
+    rate_off = ingest(app, client, readings[:half], args.batch)
+    vital_alerts.detector = enabled
+    rate_on = ingest(app, client, readings[half:], args.batch)
+    with app.app_context():
+        # Let the outbox dispatcher write the notifications before the database goes away
+        while outbox.stats()['pending']:
+            time.sleep(0.1)
+        notifications = db.session.execute(
+            db.text("SELECT COUNT(*) FROM notification WHERE notification_type = 'vital_alert'")
+        ).scalar()
+    print(f"batch ingest, detection off: {rate_off:10.0f} readings/s")
+    print(f"batch ingest, detection on:  {rate_on:10.0f} readings/s ({notifications} vital_alert notifications)")
+
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Sustained vital sign ingestion rate, single readings vs. batches.
+
+Points the app at a throwaway SQLite database, registers a ward of
+patients, then drives the API through the test client: first one reading
+per POST /vital_signs, then several monitor gateways posting compact
+batches to POST /vital_signs/batch. The batch rate counts readings until
+the writer has committed all of them; 503 responses (queue full) are
+retried after a short pause, as a gateway would.
+
+    python -m benchmarks.vitals_ingest --beds 500 --seconds 10
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+ARGS = None
+
+
+def seed(path, beds):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO patient (id, patient_id, first_name, last_name, in_icu, is_active) VALUES (?, ?, ?, ?, 1, 1)",
+        [(i, f"ICU-{i:05d}", f"Bed{i}", "Patient") for i in range(1, beds + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def reading(bed, moment):
+    return [f"ICU-{bed:05d}", moment, 60 + bed % 40, 95 + bed % 5, 36.5 + (bed % 10) / 10, 110 + bed % 30, 70 + bed % 20]
+
+
+def single(client, seconds):
+    sent = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        bed = sent % ARGS.beds + 1
+        response = client.post('/api/vital_signs', json={
+            'patient_id': f"ICU-{bed:05d}", 'heart_rate': 72, 'blood_pressure': '120/80',
+            'oxygen_saturation': 98, 'temperature': 36.8
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+        sent += 1
+    return sent / (time.perf_counter() - started)
+
+
+def gateway(app, index, stop, totals):
+    client = app.test_client()
+    beds = range(index + 1, ARGS.beds + 1, ARGS.gateways)
+    accepted = rejected = 0
+    while not stop.is_set():
+        moment = time.time()
+        rows = [reading(bed, moment) for bed in beds for _ in range(ARGS.readings_per_bed)]
+        response = client.post('/api/vital_signs/batch', json={
+            'columns': ['patient_id', 'ts', 'hr', 'spo2', 'temp', 'sbp', 'dbp'], 'rows': rows
+        })
+        if response.status_code == 503:
+            rejected += 1
+            time.sleep(0.05)
+            continue
+        assert response.status_code == 202, response.get_data(as_text=True)
+        accepted += response.get_json()['accepted']
+    totals[index] = (accepted, rejected)
+
+
+def main():
+    global ARGS
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--beds', type=int, default=500)
+    parser.add_argument('--gateways', type=int, default=4)
+    parser.add_argument('--readings-per-bed', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    ARGS = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench_vitals.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    from extension import db
+    import vitals_ingest
+
+    seed(path, ARGS.beds)
+    client = app.test_client()
+
+    rate = single(client, min(ARGS.seconds, 5))
+    print(f"single readings:  {rate:10.0f} readings/s")
+
+    with app.app_context():
+        before = db.session.execute(db.text("SELECT COUNT(*) FROM vital_sign")).scalar()
+    stop = threading.Event()
+    totals = {}
+    threads = [threading.Thread(target=gateway, args=(app, i, stop, totals)) for i in range(ARGS.gateways)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(ARGS.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    vitals_ingest.writer.flush()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        written = db.session.execute(db.text("SELECT COUNT(*) FROM vital_sign")).scalar() - before
+    accepted = sum(accepted for accepted, _ in totals.values())
+    rejected = sum(rejected for _, rejected in totals.values())
+    stats = vitals_ingest.writer.stats()
+    print(f"batch ingestion:  {written / elapsed:10.0f} readings/s "
+          f"({written} written of {accepted} accepted in {elapsed:.1f}s, "
+          f"{stats['commits']} commits, {rejected} requests refused with 503)")
+
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+from collections import OrderedDict, defaultdict
+from functools import wraps
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app, request, Response
+import events
+
+# Short-lived response cache for read-heavy endpoints. Every cached view
+# declares the models it reads; a commit touching any of those models evicts
+# the view's entries. Each eviction also bumps a per-endpoint generation, and
+# a response is only stored if the generation it was computed under is still
+# current, so a slow request can't re-insert data a concurrent commit replaced.
+
+
+class LRUBackend:
+    """In-process cache, private to each worker."""
+
+    name = 'lru'
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def generation(self, endpoint):
+        with self._lock:
+            return self._generations[endpoint]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, endpoint, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, endpoint, value, ttl, generation):
+        with self._lock:
+            if self._generations[endpoint] != generation:
+                return
+            self._entries[key] = (time.time() + ttl, endpoint, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, endpoints):
+        with self._lock:
+            for endpoint in endpoints:
+                self._generations[endpoint] += 1
+            stale = [key for key, entry in self._entries.items() if entry[1] in endpoints]
+            for key in stale:
+                del self._entries[key]
+
+
+class SQLiteBackend:
+    """Cache shared by every worker on the host through a SQLite file."""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "status INTEGER NOT NULL, mimetype TEXT, body BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_endpoint ON response_cache (endpoint)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache_generation ("
+                "endpoint TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        # Connections are per thread and are not carried across a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def generation(self, endpoint):
+        row = self._connect().execute(
+            "SELECT generation FROM response_cache_generation WHERE endpoint = ?", (endpoint,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT status, mimetype, body FROM response_cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return bytes(row[2]), row[0], row[1]
+
+    def set(self, key, endpoint, value, ttl, generation):
+        body, status, mimetype = value
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, endpoint, expires_at, status, mimetype, body) "
+            "SELECT ?, ?, ?, ?, ?, ? "
+            "WHERE COALESCE((SELECT generation FROM response_cache_generation WHERE endpoint = ?), 0) = ?",
+            (key, endpoint, now + ttl, status, mimetype, body, endpoint, generation)
+        )
+        conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+
+    def invalidate(self, endpoints):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for endpoint in endpoints:
+                conn.execute(
+                    "INSERT INTO response_cache_generation (endpoint, generation) VALUES (?, 1) "
+                    "ON CONFLICT(endpoint) DO UPDATE SET generation = generation + 1",
+                    (endpoint,)
+                )
+                conn.execute("DELETE FROM response_cache WHERE endpoint = ?", (endpoint,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+BACKENDS = {
+    'lru': lambda app: LRUBackend(app.config['RESPONSE_CACHE_MAX_ENTRIES']),
+    'sqlite': lambda app: SQLiteBackend(app.config['RESPONSE_CACHE_PATH']),
+}
+
+# Endpoints to evict when a model commits, filled in by @cached.
+_dependents = defaultdict(set)
+_backend = None
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def init_app(app):
+    global _backend
+    app.config.setdefault('RESPONSE_CACHE_BACKEND', 'lru')
+    app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 512)
+    app.config.setdefault('RESPONSE_CACHE_PATH', os.path.join(app.instance_path, 'response_cache.db'))
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    os.makedirs(app.instance_path, exist_ok=True)
+    _backend = BACKENDS[app.config['RESPONSE_CACHE_BACKEND']](app)
+    app.extensions['response_cache'] = _backend
+
+
+def _count(endpoint, outcome):
+    with _stats_lock:
+        _stats[endpoint][outcome] += 1
+
+
+def stats():
+    with _stats_lock:
+        endpoints = {endpoint: dict(counts) for endpoint, counts in _stats.items()}
+    return {
+        'backend': _backend.name if _backend else None,
+        'hits': sum(counts['hits'] for counts in endpoints.values()),
+        'misses': sum(counts['misses'] for counts in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+def _cache_key(endpoint, view_args):
+    args = sorted(request.args.items(multi=True))
+    return f"{endpoint}|{sorted(view_args.items())}|{args}"
+
+
+def cached(ttl, depends_on=()):
+    """Cache a GET view's response for `ttl` seconds, evicting it when any of `depends_on` commits."""
+    def decorator(view):
+        endpoint = view.__name__
+        for model in depends_on:
+            _dependents[model].add(endpoint)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if _backend is None or request.method != 'GET' or not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return view(*args, **kwargs)
+
+            key = _cache_key(endpoint, kwargs)
+            hit = _backend.get(key)
+            if hit is not None:
+                _count(endpoint, 'hits')
+                body, status, mimetype = hit
+                return Response(body, status=status, mimetype=mimetype)
+
+            _count(endpoint, 'misses')
+            generation = _backend.generation(endpoint)
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                _backend.set(key, endpoint, (response.get_data(), response.status_code, response.mimetype),
+                             ttl, generation)
+            return response
+        return wrapper
+    return decorator
+
+
+@events.on_commit
+def _invalidate(changes):
+    if _backend is None:
+        return
+    endpoints = set()
+    for model in {change.model for change in changes}:
+        endpoints |= _dependents.get(model, set())
+    if endpoints:
+        _backend.invalidate(endpoints)
@@ -0,0 +1,229 @@
+from collections import defaultdict
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, case, insert, update, delete, and_, or_
+from models import AggregateCounter, Patient, Appointment, Prescription, LabResult, VitalSign, parse_number
+from extension import db
+import events
+
+# Running counters and sums behind /dashboard/stats. Each tracked model maps
+# a row's column values to the counters that row contributes to; flushes add
+# the difference between the new and old contributions, so the stored values
+# always match what the equivalent COUNT(*)/SUM() queries would return.
+
+MANAGED_PREFIXES = ('patients.', 'appointments.', 'prescriptions.', 'labs.', 'vitals.')
+
+
+def day_key(name, day):
+    return f"{name}:{day.isoformat()}"
+
+
+def _default(model, key):
+    column = model.__table__.columns[key]
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    return None
+
+
+def _value(model, values, key):
+    value = values.get(key)
+    return _default(model, key) if value is None else value
+
+
+def _patient_counters(values):
+    get = lambda key: _value(Patient, values, key)
+    return {
+        'patients.total': 1,
+        'patients.in_icu': 1 if get('in_icu') else 0,
+        'patients.on_ventilator': 1 if get('on_ventilator') else 0,
+        'patients.telemedicine_ready': 1 if get('telemedicine_ready') else 0,
+        'patients.isolation': 1 if get('isolation_status') is not None else 0,
+    }
+
+
+def _appointment_counters(values):
+    get = lambda key: _value(Appointment, values, key)
+    day = get('date')
+    if day is None:
+        return {}
+    status = get('status')
+    telemedicine = bool(get('telemedicine'))
+    return {
+        day_key('appointments.scheduled', day): 1 if status == 'scheduled' else 0,
+        day_key('appointments.telemedicine', day): 1 if telemedicine else 0,
+        day_key('appointments.telemedicine_completed', day): 1 if telemedicine and status == 'completed' else 0,
+    }
+
+
+def _prescription_counters(values):
+    return {'prescriptions.pending': 1 if _value(Prescription, values, 'status') == 'pending' else 0}
+
+
+def _lab_result_counters(values):
+    critical = _value(LabResult, values, 'critical_flag')
+    acknowledged = _value(LabResult, values, 'acknowledged')
+    return {'labs.critical_unacknowledged': 1 if critical and not acknowledged else 0}
+
+
+def _vital_sign_counters(values):
+    result = {}
+    for key, name in (('heart_rate', 'vitals.heart_rate'), ('oxygen_saturation', 'vitals.oxygen')):
+        value = parse_number(values.get(key))
+        if value is not None:
+            result[f'{name}.sum'] = value
+            result[f'{name}.count'] = 1
+    return result
+
+
+CONTRIBUTIONS = {
+    Patient: _patient_counters,
+    Appointment: _appointment_counters,
+    Prescription: _prescription_counters,
+    LabResult: _lab_result_counters,
+    VitalSign: _vital_sign_counters,
+}
+
+
+def apply_deltas(connection, deltas):
+    table = AggregateCounter.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(value=table.c.value + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(name=name, value=delta))
+
+
+@events.on_flush
+def _track_changes(session, changes):
+    deltas = defaultdict(float)
+    for change in changes:
+        contributions = CONTRIBUTIONS.get(change.model)
+        if contributions is None:
+            continue
+        if change.action == 'insert':
+            for name, amount in contributions(change.values).items():
+                deltas[name] += amount
+        elif change.action == 'delete':
+            for name, amount in contributions(change.values).items():
+                deltas[name] -= amount
+        else:
+            for name, amount in contributions(change.values).items():
+                deltas[name] += amount
+            for name, amount in contributions({**change.values, **change.previous}).items():
+                deltas[name] -= amount
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def read(names):
+    rows = db.session.query(AggregateCounter.name, AggregateCounter.value).filter(
+        AggregateCounter.name.in_(names)
+    ).all()
+    values = dict.fromkeys(names, 0)
+    values.update({row.name: row.value for row in rows})
+    return values
+
+
+def compute():
+    """Recompute every managed counter from the source tables."""
+    values = {}
+
+    patients = db.session.query(
+        func.count(Patient.id).label('total'),
+        func.sum(case((Patient.in_icu == True, 1), else_=0)).label('in_icu'),
+        func.sum(case((Patient.on_ventilator == True, 1), else_=0)).label('on_ventilator'),
+        func.sum(case((Patient.telemedicine_ready == True, 1), else_=0)).label('telemedicine_ready'),
+        func.sum(case((Patient.isolation_status.isnot(None), 1), else_=0)).label('isolation'),
+    ).one()
+    for key in ('total', 'in_icu', 'on_ventilator', 'telemedicine_ready', 'isolation'):
+        values[f'patients.{key}'] = getattr(patients, key) or 0
+
+    appointments = db.session.query(
+        Appointment.date,
+        func.sum(case((Appointment.status == 'scheduled', 1), else_=0)).label('scheduled'),
+        func.sum(case((Appointment.telemedicine == True, 1), else_=0)).label('telemedicine'),
+        func.sum(case((and_(Appointment.telemedicine == True, Appointment.status == 'completed'), 1),
+                      else_=0)).label('telemedicine_completed'),
+    ).group_by(Appointment.date).all()
+    for row in appointments:
+        for key in ('scheduled', 'telemedicine', 'telemedicine_completed'):
+            values[day_key(f'appointments.{key}', row.date)] = getattr(row, key) or 0
+
+    # Count ids only: selecting whole rows would name every mapped column and
+    # break app startup (and so `flask db upgrade`) before new columns exist
+    values['prescriptions.pending'] = db.session.query(func.count(Prescription.id)).filter(
+        Prescription.status == 'pending'
+    ).scalar()
+    values['labs.critical_unacknowledged'] = db.session.query(func.count(LabResult.id)).filter(
+        LabResult.critical_flag == True, LabResult.acknowledged == False
+    ).scalar()
+
+    vitals = db.session.query(
+        func.sum(VitalSign.heart_rate).label('heart_rate_sum'),
+        func.count(VitalSign.heart_rate).label('heart_rate_count'),
+        func.sum(VitalSign.oxygen_saturation).label('oxygen_sum'),
+        func.count(VitalSign.oxygen_saturation).label('oxygen_count'),
+    ).one()
+    values['vitals.heart_rate.sum'] = vitals.heart_rate_sum or 0
+    values['vitals.heart_rate.count'] = vitals.heart_rate_count or 0
+    values['vitals.oxygen.sum'] = vitals.oxygen_sum or 0
+    values['vitals.oxygen.count'] = vitals.oxygen_count or 0
+
+    return values
+
+
+def _managed():
+    return or_(*[AggregateCounter.name.startswith(prefix) for prefix in MANAGED_PREFIXES])
+
+
+def rebuild():
+    values = compute()
+    db.session.execute(delete(AggregateCounter).where(_managed()))
+    db.session.execute(insert(AggregateCounter), [
+        {'name': name, 'value': value} for name, value in values.items()
+    ])
+    db.session.commit()
+    return values
+
+
+def check():
+    """Return {name: (stored, live)} for every counter that disagrees with the live queries."""
+    live = compute()
+    stored = dict(db.session.query(AggregateCounter.name, AggregateCounter.value).filter(_managed()).all())
+    mismatches = {}
+    for name in set(live) | set(stored):
+        expected = live.get(name, 0)
+        actual = stored.get(name, 0)
+        if abs(actual - expected) > 1e-6 * max(1, abs(expected)):
+            mismatches[name] = (actual, expected)
+    return mismatches
+
+
+def ensure_initialized():
+    if db.session.query(AggregateCounter.name).first() is None:
+        rebuild()
+
+
+# CLI commands
+cli = AppGroup('counters', help='Maintain the dashboard counters table.')
+
+
+@cli.command('rebuild')
+def rebuild_command():
+    """Recompute all counters from scratch."""
+    values = rebuild()
+    click.echo(f"Rebuilt {len(values)} counters")
+
+
+@cli.command('check')
+def check_command():
+    """Compare stored counters against live queries."""
+    mismatches = check()
+    for name, (stored, live) in sorted(mismatches.items()):
+        click.echo(f"{name}: stored={stored} live={live}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} counters out of date, run 'flask counters rebuild'")
+    click.echo("All counters consistent")
@@ -0,0 +1,155 @@
+from collections import namedtuple
+import logging
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+
+# A row written by a flush. `values` holds the column values after the write
+# (the last known values for deletes); `previous` maps the columns an update
+# changed to their old values.
+Change = namedtuple('Change', ['action', 'model', 'values', 'previous'])
+
+_flush_handlers = []
+_commit_handlers = []
+
+
+def on_flush(handler):
+    """Register handler(session, changes), run inside the flushing transaction."""
+    _flush_handlers.append(handler)
+    return handler
+
+
+def on_commit(handler):
+    """Register handler(changes), run once the transaction has committed."""
+    _commit_handlers.append(handler)
+    return handler
+
+
+def after_commit(session, callback):
+    """Run callback() once the session's current transaction commits; dropped if it rolls back."""
+    session.info.setdefault('events.callbacks', []).append(callback)
+
+
+def transaction_info(session):
+    """A dict for state of the session's current transaction, discarded when it commits or rolls back."""
+    return session.info.setdefault('events.transaction', {})
+
+
+def record(session, action, model, rows, previous=None):
+    """Report rows written with bulk statements that bypass the unit of work.
+
+    For updates, `previous` maps the changed columns to their old values
+    (the same for every row).
+    """
+    changes = [Change(action, model, dict(row), dict(previous or {})) for row in rows]
+    if changes:
+        _dispatch(session, changes)
+
+
+def _column_keys(state):
+    return [attr.key for attr in state.mapper.column_attrs]
+
+
+def _stored_values(session, state):
+    """The row as it was before this flush, loading it if the instance is expired."""
+    keys = _column_keys(state)
+    committed = state.committed_state
+    values = {}
+    missing = False
+    for key in keys:
+        if key in committed:
+            if committed[key] is NO_VALUE:
+                missing = True
+                break
+            values[key] = committed[key]
+        elif key in state.dict:
+            values[key] = state.dict[key]
+        else:
+            missing = True
+            break
+    if not missing:
+        return values
+
+    mapper = state.mapper
+    table = mapper.local_table
+    identity = state.identity or ()
+    conditions = [column == value for column, value in zip(mapper.primary_key, identity)]
+    row = session.connection().execute(select(table).where(*conditions)).mappings().first()
+    if row is None:
+        return values
+    stored = {key: row[mapper.get_property(key).columns[0].key] for key in keys}
+    stored.update(values)
+    return stored
+
+
+def _dispatch(session, changes):
+    for handler in _flush_handlers:
+        handler(session, changes)
+    if _commit_handlers:
+        session.info.setdefault('events.pending', []).extend(changes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    if not (_flush_handlers or _commit_handlers):
+        return
+
+    stored = {}
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            stored[state] = ('update', _stored_values(session, state))
+    for obj in session.deleted:
+        state = inspect(obj)
+        stored[state] = ('delete', _stored_values(session, state))
+    session.info['events.stored'] = stored
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    stored = session.info.pop('events.stored', None)
+    if stored is None:
+        return
+
+    changes = []
+    for obj in session.new:
+        state = inspect(obj)
+        values = {key: state.dict.get(key) for key in _column_keys(state)}
+        changes.append(Change('insert', state.class_, values, {}))
+    for state, (action, before) in stored.items():
+        if action == 'delete':
+            changes.append(Change('delete', state.class_, before, {}))
+            continue
+        values = dict(before)
+        values.update({key: state.dict[key] for key in _column_keys(state) if key in state.dict})
+        previous = {key: before.get(key) for key in values if before.get(key) != values[key]}
+        if previous:
+            changes.append(Change('update', state.class_, values, previous))
+
+    if changes:
+        _dispatch(session, changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    session.info.pop('events.transaction', None)
+    for callback in session.info.pop('events.callbacks', ()):
+        try:
+            callback()
+        except Exception:
+            logging.exception("Commit callback %r failed", callback)
+    changes = session.info.pop('events.pending', None)
+    if not changes:
+        return
+    for handler in _commit_handlers:
+        try:
+            handler(changes)
+        except Exception:
+            logging.exception("Commit handler %s failed", handler.__name__)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('events.pending', None)
+    session.info.pop('events.callbacks', None)
+    session.info.pop('events.transaction', None)
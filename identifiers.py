@@ -0,0 +1,90 @@
+import os
+import threading
+from flask import current_app
+from sqlalchemy import select, update, insert, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+from models import IdSequence, Patient
+from extension import db
+
+# Human-readable identifier allocation. Each worker reserves a block of
+# numbers from the id_sequence table in its own short transaction and then
+# hands them out from memory, so registering a patient needs no
+# read-before-write and concurrent workers never see the same number.
+# Unused numbers in a block are lost when the worker exits; ids are unique
+# but not gapless.
+
+
+class BlockAllocator:
+    def __init__(self, name, initial_value, block_size_option, default_block_size=20):
+        self.name = name
+        self.initial_value = initial_value
+        self.block_size_option = block_size_option
+        self.default_block_size = default_block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._limit = 0
+
+    def allocate(self, count=1):
+        """Return `count` unused sequence numbers.
+
+        Reserving a block opens its own database transaction, so call this
+        before the request's session starts writing (SQLite allows a single
+        writer at a time).
+        """
+        values = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse the block its parent held.
+                self._pid = os.getpid()
+                self._next = self._limit = 0
+            while len(values) < count:
+                if self._next >= self._limit:
+                    size = max(current_app.config.get(self.block_size_option, self.default_block_size),
+                               count - len(values))
+                    self._next = self._reserve(size)
+                    self._limit = self._next + size
+                take = min(count - len(values), self._limit - self._next)
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+        return values
+
+    def _reserve(self, size):
+        table = IdSequence.__table__
+        for _ in range(3):
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(
+                        update(table).where(table.c.name == self.name)
+                        .values(next_value=table.c.next_value + size)
+                    )
+                    if result.rowcount:
+                        return conn.execute(
+                            select(table.c.next_value).where(table.c.name == self.name)
+                        ).scalar_one() - size
+                    start = self.initial_value(conn)
+                    conn.execute(insert(table).values(name=self.name, next_value=start + size))
+                    return start
+            except IntegrityError:
+                # Another worker created the sequence row first; reserve from it.
+                continue
+        raise RuntimeError(f"Could not reserve identifiers from sequence {self.name!r}")
+
+
+def _first_patient_number(conn):
+    highest = conn.execute(
+        select(func.max(cast(func.substr(Patient.patient_id, 4), Integer)))
+        .where(Patient.patient_id.like('PT-%'))
+    ).scalar()
+    return max((highest or 0) + 1, 1001)
+
+
+patient_numbers = BlockAllocator('patient_id', _first_patient_number, 'PATIENT_ID_BLOCK_SIZE')
+
+
+def next_patient_id():
+    return f"PT-{patient_numbers.allocate()[0]}"
+
+
+def patient_ids(count):
+    return [f"PT-{number}" for number in patient_numbers.allocate(count)]
@@ -0,0 +1,215 @@
+from datetime import date, datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, update
+from models import LabReferenceRange, LabResult, lab_test_key, parse_lab_value, parse_number
+from extension import db
+import events
+import outbox
+import refdata
+
+# Reference ranges and automatic flagging for lab results. A numeric value
+# and unit are parsed from result_value when it's set (see
+# LabResult._parse_result_value); at ingest the value is compared with the
+# test's LabReferenceRange, matched by lab_test_key(test_name), and gets an
+# interpretation of LL/L/N/H/HH. Results beyond a critical limit are
+# flagged critical even if the sender didn't flag them. A value whose unit
+# differs from the range's unit is left unclassified rather than compared
+# across units.
+
+# (test name, unit, low, high, critical low, critical high); adult ranges
+DEFAULT_RANGES = [
+    ('Potassium', 'mmol/L', 3.5, 5.0, 2.8, 6.2),
+    ('Sodium', 'mmol/L', 135, 145, 120, 160),
+    ('Chloride', 'mmol/L', 98, 107, None, None),
+    ('Bicarbonate', 'mmol/L', 22, 29, 10, 40),
+    ('Creatinine', 'mg/dL', 0.6, 1.3, None, None),
+    ('Blood Urea Nitrogen', 'mg/dL', 7, 20, None, 100),
+    ('Blood Glucose', 'mg/dL', 70, 99, 40, 400),
+    ('Calcium', 'mg/dL', 8.5, 10.5, 6.5, 13.0),
+    ('Magnesium', 'mg/dL', 1.7, 2.2, 1.0, 4.7),
+    ('Hemoglobin', 'g/dL', 12.0, 17.5, 7.0, 20.0),
+    ('White Blood Cell Count', 'K/uL', 4.5, 11.0, 2.0, 30.0),
+    ('Platelet Count', 'K/uL', 150, 400, 20, 1000),
+    ('Troponin I', 'ng/mL', 0, 0.04, None, 0.4),
+    ('Lactate', 'mmol/L', 0.5, 2.2, None, 4.0),
+    ('INR', None, 0.8, 1.2, None, 5.0),
+    ('Prothrombin Time', 'seconds', 11.0, 13.5, None, 30.0),
+    ('Thyroid Stimulating Hormone', 'mIU/L', 0.4, 4.0, None, None),
+    ('Vitamin D Level', 'ng/mL', 30, 100, None, None),
+    ('Hemoglobin A1C', '%', 4.0, 5.6, None, None),
+    ('Immunoglobulin E', 'IU/mL', 0, 100, None, None),
+]
+MAX_BATCH_SIZE = 5000
+MAX_ACKNOWLEDGE = 1000
+
+
+def _unit_key(unit):
+    return (unit or '').lower().replace('µ', 'u').replace('μ', 'u')
+
+
+def classify(test_name, value, unit):
+    """Return (interpretation, critical) for a numeric result; (None, False) without a usable range."""
+    if value is None:
+        return None, False
+    reference = refdata.get().lab_ranges.get(lab_test_key(test_name))
+    if reference is None:
+        return None, False
+    if unit and reference.unit and _unit_key(unit) != _unit_key(reference.unit):
+        return None, False
+    if reference.critical_low is not None and value < reference.critical_low:
+        return 'LL', True
+    if reference.critical_high is not None and value > reference.critical_high:
+        return 'HH', True
+    if reference.low is not None and value < reference.low:
+        return 'L', False
+    if reference.high is not None and value > reference.high:
+        return 'H', False
+    return 'N', False
+
+
+def apply(values):
+    """Fill value_numeric, unit, interpretation and critical_flag in a dict of LabResult values."""
+    if values.get('value_numeric') is None:
+        parsed, parsed_unit = parse_lab_value(values.get('result_value'))
+        values['value_numeric'] = parsed
+        values['unit'] = values.get('unit') or parsed_unit
+    if values.get('unit') is None and values['value_numeric'] is not None:
+        reference = refdata.get().lab_ranges.get(lab_test_key(values.get('test_name')))
+        values['unit'] = reference.unit if reference else None
+    values['interpretation'], critical = classify(values.get('test_name'), values['value_numeric'], values['unit'])
+    values['critical_flag'] = bool(values.get('critical_flag')) or critical
+    return values
+
+
+def apply_to(lab_result):
+    """apply() to a LabResult instance, setting its unit, interpretation and critical_flag."""
+    values = apply({
+        'test_name': lab_result.test_name, 'result_value': lab_result.result_value,
+        'value_numeric': lab_result.value_numeric, 'unit': lab_result.unit,
+        'critical_flag': lab_result.critical_flag
+    })
+    lab_result.unit = values['unit']
+    lab_result.interpretation = values['interpretation']
+    lab_result.critical_flag = values['critical_flag']
+    return lab_result
+
+
+def _result(record, patient_ids, default_provider):
+    """LabResult values for one batch record; raises ValueError."""
+    code = record.get('patient_id')
+    if code is not None and (not isinstance(code, (str, int)) or isinstance(code, bool)):
+        raise ValueError('patient_id must be a string')
+    pk = patient_ids.get(None if code is None else str(code))
+    if pk is None:
+        raise ValueError(f'Patient not found: {code}' if code else 'Missing patient_id')
+    if not record.get('test_name'):
+        raise ValueError('Missing test_name')
+    value = record.get('value')
+    result_value = record.get('result_value')
+    if result_value is None and value is None:
+        raise ValueError('Missing result_value or value')
+    if value is not None:
+        value = parse_number(value)
+        if value is None:
+            raise ValueError('value must be a finite number')
+        if result_value is None:
+            result_value = f"{value:g} {record['unit']}" if record.get('unit') else f"{value:g}"
+    result_date = record.get('date')
+    values = {
+        'patient_id': pk,
+        'test_name': str(record['test_name']),
+        'result_value': str(result_value),
+        'value_numeric': value,
+        'unit': record.get('unit'),
+        'date': datetime.strptime(result_date, '%Y-%m-%d').date() if result_date else date.today(),
+        'critical_flag': bool(record.get('critical_flag', False)),
+        'acknowledged': False,
+        'ordering_provider': record.get('ordering_provider') or default_provider,
+        'notes': record.get('notes', ''),
+        'created_at': datetime.utcnow(),
+    }
+    return apply(values)
+
+
+def prepare(records, patient_ids, default_provider):
+    """Validate and classify batch records; return (rows, errors)."""
+    rows = []
+    errors = []
+    for number, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError('Expected an object')
+            rows.append(_result(record, patient_ids, default_provider))
+        except (TypeError, ValueError) as e:
+            errors.append({'row': number, 'error': str(e)})
+    return rows, errors
+
+
+def insert_results(rows):
+    """Bulk-insert prepared rows with notifications for the critical ones; the caller commits."""
+    if not rows:
+        return
+    ids = db.session.execute(
+        insert(LabResult).returning(LabResult.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    for row, pk in zip(rows, ids):
+        row['id'] = pk
+    events.record(db.session, 'insert', LabResult, rows)
+    outbox.enqueue_many(db.session, 'notification', [{
+        'patient_id': row['patient_id'],
+        'user_id': None,
+        'message': f"Critical lab result for {row['test_name']}: {row['result_value']}",
+        'notification_type': 'lab_result',
+    } for row in rows if row['critical_flag']])
+
+
+def parse_cursor(value):
+    """Parse a "<date>:<id>" feed cursor into (date, id), date None for ":<id>"; raises ValueError."""
+    day, _, pk = value.partition(':')
+    return datetime.strptime(day, '%Y-%m-%d').date() if day else None, int(pk)
+
+
+def format_cursor(day, pk):
+    return f"{day.isoformat() if day else ''}:{pk}"
+
+
+def acknowledge(ids):
+    """Acknowledge the given results in one statement; return the ids that changed. The caller commits."""
+    if not ids:
+        return []
+    table = LabResult.__table__
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(ids), table.c.acknowledged.is_(False))
+        .values(acknowledged=True)
+        .returning(*table.c)
+    ).mappings().all()
+    events.record(db.session, 'update', LabResult, rows, previous={'acknowledged': False})
+    return [row['id'] for row in rows]
+
+
+def load_default_ranges():
+    """Add DEFAULT_RANGES for tests that have no range yet; return how many were added."""
+    existing = {test_name for (test_name,) in db.session.query(LabReferenceRange.test_name)}
+    added = 0
+    for test_name, unit, low, high, critical_low, critical_high in DEFAULT_RANGES:
+        if lab_test_key(test_name) in existing:
+            continue
+        db.session.add(LabReferenceRange(
+            test_name=lab_test_key(test_name), unit=unit, low=low, high=high,
+            critical_low=critical_low, critical_high=critical_high
+        ))
+        added += 1
+    db.session.commit()
+    return added
+
+
+# CLI commands
+cli = AppGroup('labs', help='Lab reference range commands.')
+
+
+@cli.command('load-ranges')
+def load_ranges_command():
+    """Add the built-in adult reference ranges for tests without one."""
+    click.echo(f"Added {load_default_ranges()} reference ranges")
@@ -0,0 +1,343 @@
+from collections import deque
+from itertools import islice
+import json
+import logging
+import os
+import threading
+import time
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import func, select
+from models import LabResult, Patient, VitalSign
+from extension import db
+import events
+
+# Live feed of new vital signs and critical lab results for the nurse
+# station screens, sent as server-sent events. Commit hooks publish rows
+# into an in-process hub: a bounded ring of recent events plus one condition
+# variable, so a publish is an append and a notify_all however many screens
+# are connected, and an idle connection is a thread parked on the condition.
+# Each connection keeps its own position in the ring and filters by its
+# patient set; an event is JSON-encoded once and shared by every connection
+# that sends it.
+#
+# Rows committed by other worker processes never pass through this
+# process's hooks, so while anyone is connected a tailer thread picks up
+# vital_sign and critical lab_result ids past the ones it has seen every
+# LIVE_POLL_SECONDS, looping until it has caught up. Rows this process
+# already published are skipped.
+#
+# Event ids are "<vital id>:<lab id>" cursors. A reconnecting EventSource
+# sends the last one back as Last-Event-ID and the stream replays newer rows
+# from the database before going live; a connection that falls further
+# behind than the ring holds is caught up the same way. Local events can
+# be published ahead of lower ids from other workers, so a cursor only moves
+# to the tailer's high-water mark: every row up to it is in the ring by the
+# end of the batch that carries it, and it is attached to the last frame of
+# that batch. A resumed stream may repeat a few events; it doesn't skip any.
+
+EVENT_TYPES = ('vital_sign', 'lab_result')
+FIELDS = {
+    'vital_sign': ('heart_rate', 'blood_pressure', 'systolic', 'diastolic', 'oxygen_saturation',
+                   'temperature', 'timestamp'),
+    'lab_result': ('test_name', 'result_value', 'date', 'critical_flag', 'acknowledged'),
+}
+MODELS = {'vital_sign': VitalSign, 'lab_result': LabResult}
+
+
+class Event:
+    __slots__ = ('seq', 'kind', 'row_id', 'patient_id', 'values', '_data')
+
+    def __init__(self, kind, values):
+        self.seq = None
+        self.kind = kind
+        self.row_id = values['id']
+        self.patient_id = values['patient_id']
+        self.values = values
+        self._data = None
+
+    def data(self, patients):
+        if self._data is None:
+            code, name = patients.get(self.patient_id, (None, None))
+            payload = {'id': self.row_id, 'patient_id': code, 'patient_name': name}
+            payload.update((field, self.values.get(field)) for field in FIELDS[self.kind])
+            self._data = json.dumps(payload, default=lambda value: value.isoformat())
+        return self._data
+
+
+class Hub:
+    def __init__(self, capacity):
+        self._events = deque(maxlen=capacity)
+        self._keys = set()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.published = 0
+        self.subscribers = 0
+        # Every row up to these ids has been published
+        self.watermark = dict.fromkeys(EVENT_TYPES, 0)
+        # Where the tailer starts or has got to; None while nobody is connected
+        self.tailed = None
+
+    def publish(self, new_events, watermark=None):
+        with self._cond:
+            if watermark:
+                for kind, pk in watermark.items():
+                    self.watermark[kind] = max(self.watermark[kind], pk)
+            added = 0
+            for event in new_events:
+                key = (event.kind, event.row_id)
+                if key in self._keys:
+                    continue
+                if len(self._events) == self._events.maxlen:
+                    oldest = self._events[0]
+                    self._keys.discard((oldest.kind, oldest.row_id))
+                self.seq += 1
+                event.seq = self.seq
+                self._events.append(event)
+                self._keys.add(key)
+                added += 1
+            if added:
+                self.published += added
+                self._cond.notify_all()
+
+    def read(self, after, timeout):
+        """Wait up to `timeout` for events past seq `after`; return (events, complete, watermark).
+
+        `complete` is False when some of them have already left the ring.
+        `watermark` holds for the ring up to the last of the events.
+        """
+        with self._cond:
+            if self.seq <= after:
+                self._cond.wait(timeout)
+            watermark = dict(self.watermark)
+            count = self.seq - after
+            if count <= 0:
+                return [], True, watermark
+            available = min(count, len(self._events))
+            return list(islice(reversed(self._events), available))[::-1], available == count, watermark
+
+    def tail_from(self, cursor):
+        """Have an idle tailer start at `cursor`, so rows a new connection expects aren't skipped."""
+        with self._lock:
+            if self.tailed is None:
+                self.tailed = dict(cursor)
+
+    def join(self, limit):
+        with self._lock:
+            if self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.subscribers -= 1
+
+
+hub = None
+_app = None
+_tailer_pid = None
+
+
+@events.on_commit
+def _publish(changes):
+    if hub is None:
+        return
+    new_events = []
+    for change in changes:
+        if change.model is VitalSign and change.action == 'insert':
+            new_events.append(Event('vital_sign', change.values))
+        elif (change.model is LabResult and change.action != 'delete' and change.values.get('critical_flag')
+              and (change.action == 'insert' or 'critical_flag' in change.previous)):
+            new_events.append(Event('lab_result', change.values))
+    if new_events:
+        # Without a tailer this process sees every row, in commit order
+        watermark = None
+        if not _app.config['LIVE_POLL_SECONDS']:
+            watermark = dict.fromkeys(EVENT_TYPES, 0)
+            for event in new_events:
+                watermark[event.kind] = max(watermark[event.kind], event.row_id)
+        hub.publish(new_events, watermark)
+
+
+def _select(kind):
+    model = MODELS[kind]
+    columns = [model.id, model.patient_id] + [getattr(model, field) for field in FIELDS[kind]]
+    query = select(*columns)
+    if kind == 'lab_result':
+        query = query.where(LabResult.critical_flag.is_(True))
+    return query, model
+
+
+def latest_cursor():
+    return {kind: db.session.execute(select(func.max(MODELS[kind].id))).scalar() or 0 for kind in EVENT_TYPES}
+
+
+def parse_cursor(value):
+    """Parse a "<vital id>:<lab id>" event id; raises ValueError."""
+    vital_id, lab_id = value.split(':')
+    return {'vital_sign': int(vital_id), 'lab_result': int(lab_id)}
+
+
+def format_cursor(cursor):
+    return f"{cursor['vital_sign']}:{cursor['lab_result']}"
+
+
+def _tail():
+    limit = _app.config['LIVE_REPLAY_LIMIT']
+    while True:
+        time.sleep(_app.config['LIVE_POLL_SECONDS'])
+        if not hub.subscribers:
+            with hub._lock:
+                hub.tailed = None
+            continue
+        with _app.app_context():
+            try:
+                with hub._lock:
+                    seen = dict(hub.tailed) if hub.tailed is not None else None
+                if seen is None:
+                    seen = latest_cursor()
+                for kind in EVENT_TYPES:
+                    query, model = _select(kind)
+                    # Keep going until caught up, or batch ingest leaves the tailer further behind every poll
+                    while True:
+                        rows = db.session.execute(
+                            query.where(model.id > seen[kind]).order_by(model.id).limit(limit)
+                        ).mappings().all()
+                        if rows:
+                            seen[kind] = rows[-1]['id']
+                        hub.publish([Event(kind, dict(row)) for row in rows], dict(seen))
+                        if len(rows) < limit:
+                            break
+                with hub._lock:
+                    if hub.subscribers:
+                        hub.tailed = seen
+            except Exception as e:
+                logging.error(f"Live feed tailer failed: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+def _ensure_tailer():
+    # One tailer per process; a forked worker starts its own.
+    global _tailer_pid
+    with hub._lock:
+        if not _app.config['LIVE_POLL_SECONDS'] or _tailer_pid == os.getpid():
+            return
+        _tailer_pid = os.getpid()
+    threading.Thread(target=_tail, name='live-tailer', daemon=True).start()
+
+
+def _members(codes, unit):
+    """{patient pk: (code, name)} for the requested patients or unit."""
+    query = db.session.query(Patient.id, Patient.patient_id, Patient.first_name, Patient.last_name)
+    if unit == 'icu':
+        query = query.filter(Patient.in_icu.is_(True))
+    else:
+        query = query.filter(Patient.patient_id.in_(codes))
+    return {pk: (code, f"{first_name} {last_name}") for pk, code, first_name, last_name in query}
+
+
+def _replay(cursor, patients, kinds):
+    """The newest LIVE_REPLAY_LIMIT rows of each kind past `cursor` for `patients`, oldest first."""
+    replayed = []
+    for kind in kinds:
+        query, model = _select(kind)
+        rows = db.session.execute(
+            query.where(model.id > cursor[kind], model.patient_id.in_(list(patients)))
+            .order_by(model.id.desc()).limit(current_app.config['LIVE_REPLAY_LIMIT'])
+        ).mappings().all()
+        replayed.extend(Event(kind, dict(row)) for row in reversed(rows))
+    return replayed
+
+
+def _frame(event, cursor, patients):
+    return f"id: {format_cursor(cursor)}\nevent: {event.kind}\ndata: {event.data(patients)}\n\n"
+
+
+def stream(codes, unit, kinds, cursor=None):
+    """SSE response for `codes` or a whole `unit`, resuming after `cursor`; None if the worker is full."""
+    config = current_app.config
+    if not hub.join(config['LIVE_MAX_CONNECTIONS']):
+        return None
+    _ensure_tailer()
+
+    def generate():
+        nonlocal cursor
+        yield f"retry: {config['LIVE_RETRY_MILLISECONDS']}\n\n"
+        patients = _members(codes, unit)
+        refreshed = last_sent = time.monotonic()
+        if cursor is None:
+            cursor = latest_cursor()
+        hub.tail_from(cursor)
+        position = hub.seq
+        pending = _replay(cursor, patients, kinds)
+        watermark = None
+        db.session.close()
+        replayed = set()
+        while True:
+            frames = []
+            for event in pending:
+                key = (event.kind, event.row_id)
+                if event.seq is None:
+                    # Replayed rows come from the database in id order
+                    replayed.add(key)
+                    cursor[event.kind] = max(cursor[event.kind], event.row_id)
+                elif key in replayed or event.kind not in kinds or event.patient_id not in patients:
+                    continue
+                frames.append([event, dict(cursor)])
+            if watermark is not None:
+                # Only the batch's last frame may claim everything up to the mark
+                for kind in EVENT_TYPES:
+                    cursor[kind] = max(cursor[kind], watermark[kind])
+                if frames:
+                    frames[-1][1] = dict(cursor)
+            if frames:
+                yield ''.join(_frame(event, event_cursor, patients) for event, event_cursor in frames)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= config['LIVE_HEARTBEAT_SECONDS']:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+
+            pending, complete, watermark = hub.read(position, config['LIVE_HEARTBEAT_SECONDS'])
+            if pending:
+                position = pending[-1].seq
+            if unit and time.monotonic() - refreshed > config['LIVE_MEMBERSHIP_SECONDS']:
+                patients = _members(codes, unit)
+                refreshed = time.monotonic()
+                db.session.close()
+            if not complete:
+                # Fell behind the ring; catch up from the database. Ring
+                # events the replay already covered are skipped above.
+                replayed = set()
+                pending = _replay(cursor, patients, kinds) + pending
+                db.session.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(hub.leave)
+    return response
+
+
+def stats():
+    return {
+        'subscribers': hub.subscribers,
+        'published': hub.published,
+        'buffered': len(hub._events),
+        'buffer_capacity': hub._events.maxlen,
+        'tailer_running': _tailer_pid == os.getpid(),
+    }
+
+
+def init_app(app):
+    global hub, _app
+    app.config.setdefault('LIVE_BUFFER_EVENTS', 10000)
+    app.config.setdefault('LIVE_MAX_CONNECTIONS', 500)
+    app.config.setdefault('LIVE_HEARTBEAT_SECONDS', 15)
+    app.config.setdefault('LIVE_POLL_SECONDS', 2)
+    app.config.setdefault('LIVE_MEMBERSHIP_SECONDS', 30)
+    app.config.setdefault('LIVE_REPLAY_LIMIT', 1000)
+    app.config.setdefault('LIVE_RETRY_MILLISECONDS', 3000)
+    hub = Hub(app.config['LIVE_BUFFER_EVENTS'])
+    _app = app
@@ -0,0 +1,69 @@
+"""add indexes for hot filters and foreign keys
+
+Revision ID: 3f1c2a9b7d4e
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+Tables are still created by db.create_all() when the app starts, which
+also builds these indexes on a fresh database. This revision brings
+existing databases up to date, so each index is only created if it is
+missing.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d4e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_user_role', 'user', ['role']),
+    ('ix_appointment_date_start_time', 'appointment', ['date', 'start_time']),
+    ('ix_appointment_status_date_start_time', 'appointment', ['status', 'date', 'start_time']),
+    ('ix_appointment_doctor_id_date', 'appointment', ['doctor_id', 'date']),
+    ('ix_appointment_patient_id_date', 'appointment', ['patient_id', 'date']),
+    ('ix_prescription_patient_id', 'prescription', ['patient_id']),
+    ('ix_prescription_prescribing_doctor_id', 'prescription', ['prescribing_doctor_id']),
+    ('ix_prescription_status', 'prescription', ['status']),
+    ('ix_lab_result_critical_flag_acknowledged_date', 'lab_result', ['critical_flag', 'acknowledged', 'date']),
+    ('ix_lab_result_patient_id_date', 'lab_result', ['patient_id', 'date']),
+    ('ix_medical_record_patient_id_date', 'medical_record', ['patient_id', 'date']),
+    ('ix_vital_sign_patient_id_timestamp', 'vital_sign', ['patient_id', 'timestamp']),
+    ('ix_vital_sign_timestamp', 'vital_sign', ['timestamp']),
+    ('ix_notification_patient_id', 'notification', ['patient_id']),
+    ('ix_notification_user_id', 'notification', ['user_id']),
+    ('ix_notification_timestamp', 'notification', ['timestamp']),
+    ('ix_enrollment_program_id_patient_id', 'enrollment', ['program_id', 'patient_id']),
+    ('ix_enrollment_patient_id', 'enrollment', ['patient_id']),
+    ('ix_pending_action_patient_id', 'pending_action', ['patient_id']),
+    ('ix_pending_action_assigned_user_id', 'pending_action', ['assigned_user_id']),
+    ('ix_pending_action_due_date', 'pending_action', ['due_date']),
+    ('ix_audit_log_patient_id', 'audit_log', ['patient_id']),
+    ('ix_audit_log_user_id', 'audit_log', ['user_id']),
+    ('ix_audit_log_timestamp', 'audit_log', ['timestamp']),
+]
+
+
+def _existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    existing = {}
+    for name, table, columns in INDEXES:
+        if table not in existing:
+            existing[table] = _existing_indexes(table)
+        if name not in existing[table]:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,106 @@
+"""split vital sign blood pressure into numeric columns
+
+Revision ID: 8b2e4d6f1a3c
+Revises: 3f1c2a9b7d4e
+Create Date: 2026-10-18 14:00:00.000000
+
+Adds integer systolic/diastolic columns, fills them from the existing
+"120/80" strings, and replaces the (patient_id, timestamp) index with one
+that also covers the series columns. Steps are skipped when they have
+already been applied (e.g. on a database created by db.create_all()).
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a3c'
+down_revision = '3f1c2a9b7d4e'
+branch_labels = None
+depends_on = None
+
+
+SERIES_COLUMNS = ['patient_id', 'timestamp', 'heart_rate', 'oxygen_saturation', 'temperature',
+                  'systolic', 'diastolic']
+BACKFILL_BATCH_SIZE = 5000
+
+# Same rule as models.parse_blood_pressure, copied so the revision doesn't
+# change if the model does
+BLOOD_PRESSURE = re.compile(r'^\s*(\d{2,3})\s*/\s*(\d{2,3})')
+
+
+def parse_blood_pressure(value):
+    match = BLOOD_PRESSURE.match(value or '')
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def _columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('vital_sign')}
+
+
+def _indexes():
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('vital_sign')}
+
+
+def _backfill():
+    bind = op.get_bind()
+    vital_sign = sa.table(
+        'vital_sign',
+        sa.column('id', sa.Integer),
+        sa.column('blood_pressure', sa.String),
+        sa.column('systolic', sa.Integer),
+        sa.column('diastolic', sa.Integer),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(vital_sign.c.id, vital_sign.c.blood_pressure)
+            .where(vital_sign.c.id > last_id, vital_sign.c.blood_pressure.isnot(None))
+            .order_by(vital_sign.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            systolic, diastolic = parse_blood_pressure(row.blood_pressure)
+            if systolic is not None:
+                updates.append({'row_id': row.id, 'systolic': systolic, 'diastolic': diastolic})
+        if updates:
+            bind.execute(
+                vital_sign.update().where(vital_sign.c.id == sa.bindparam('row_id'))
+                .values(systolic=sa.bindparam('systolic'), diastolic=sa.bindparam('diastolic')),
+                updates
+            )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    columns = _columns()
+    if 'systolic' not in columns:
+        op.add_column('vital_sign', sa.Column('systolic', sa.Integer(), nullable=True))
+    if 'diastolic' not in columns:
+        op.add_column('vital_sign', sa.Column('diastolic', sa.Integer(), nullable=True))
+    _backfill()
+
+    indexes = _indexes()
+    if 'ix_vital_sign_series' not in indexes:
+        op.create_index('ix_vital_sign_series', 'vital_sign', SERIES_COLUMNS)
+    if 'ix_vital_sign_patient_id_timestamp' in indexes:
+        op.drop_index('ix_vital_sign_patient_id_timestamp', table_name='vital_sign')
+
+
+def downgrade():
+    indexes = _indexes()
+    if 'ix_vital_sign_patient_id_timestamp' not in indexes:
+        op.create_index('ix_vital_sign_patient_id_timestamp', 'vital_sign', ['patient_id', 'timestamp'])
+    if 'ix_vital_sign_series' in indexes:
+        op.drop_index('ix_vital_sign_series', table_name='vital_sign')
+    with op.batch_alter_table('vital_sign') as batch_op:
+        batch_op.drop_column('diastolic')
+        batch_op.drop_column('systolic')
@@ -0,0 +1,170 @@
+"""numeric lab values and reference ranges
+
+Revision ID: c7d2e5f8a1b4
+Revises: 8b2e4d6f1a3c
+Create Date: 2026-10-18 20:00:00.000000
+
+Adds value_numeric/unit/interpretation to lab_result and the
+lab_reference_range table with the default adult ranges, then parses the
+existing result strings and classifies them against those ranges.
+critical_flag is left as it was on existing rows, so the migration doesn't
+raise a wave of unacknowledged criticals. Steps are skipped when they have
+already been applied (e.g. on a database created by db.create_all()).
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e5f8a1b4'
+down_revision = '8b2e4d6f1a3c'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Same rules and ranges as models.parse_lab_value and labs.DEFAULT_RANGES,
+# copied so the revision doesn't change if they do
+LAB_VALUE = re.compile(r'^\s*[<>]?=?\s*(-?\d+(?:\.\d+)?)\s*([A-Za-z%µμ][^\s(),;]*)?')
+DEFAULT_RANGES = [
+    ('potassium', 'mmol/L', 3.5, 5.0, 2.8, 6.2),
+    ('sodium', 'mmol/L', 135, 145, 120, 160),
+    ('chloride', 'mmol/L', 98, 107, None, None),
+    ('bicarbonate', 'mmol/L', 22, 29, 10, 40),
+    ('creatinine', 'mg/dL', 0.6, 1.3, None, None),
+    ('blood urea nitrogen', 'mg/dL', 7, 20, None, 100),
+    ('blood glucose', 'mg/dL', 70, 99, 40, 400),
+    ('calcium', 'mg/dL', 8.5, 10.5, 6.5, 13.0),
+    ('magnesium', 'mg/dL', 1.7, 2.2, 1.0, 4.7),
+    ('hemoglobin', 'g/dL', 12.0, 17.5, 7.0, 20.0),
+    ('white blood cell count', 'K/uL', 4.5, 11.0, 2.0, 30.0),
+    ('platelet count', 'K/uL', 150, 400, 20, 1000),
+    ('troponin i', 'ng/mL', 0, 0.04, None, 0.4),
+    ('lactate', 'mmol/L', 0.5, 2.2, None, 4.0),
+    ('inr', None, 0.8, 1.2, None, 5.0),
+    ('prothrombin time', 'seconds', 11.0, 13.5, None, 30.0),
+    ('thyroid stimulating hormone', 'mIU/L', 0.4, 4.0, None, None),
+    ('vitamin d level', 'ng/mL', 30, 100, None, None),
+    ('hemoglobin a1c', '%', 4.0, 5.6, None, None),
+    ('immunoglobulin e', 'IU/mL', 0, 100, None, None),
+]
+RANGE_COLUMNS = ('test_name', 'unit', 'low', 'high', 'critical_low', 'critical_high')
+
+lab_reference_range = sa.table(
+    'lab_reference_range', *[sa.column(name) for name in RANGE_COLUMNS]
+)
+
+
+def parse_lab_value(value):
+    match = LAB_VALUE.match(value or '')
+    if not match:
+        return None, None
+    return float(match.group(1)), match.group(2)
+
+
+def _unit_key(unit):
+    return (unit or '').lower().replace('µ', 'u').replace('μ', 'u')
+
+
+def interpret(reference, value, unit):
+    if value is None or reference is None:
+        return None
+    if unit and reference['unit'] and _unit_key(unit) != _unit_key(reference['unit']):
+        return None
+    if reference['critical_low'] is not None and value < reference['critical_low']:
+        return 'LL'
+    if reference['critical_high'] is not None and value > reference['critical_high']:
+        return 'HH'
+    if reference['low'] is not None and value < reference['low']:
+        return 'L'
+    if reference['high'] is not None and value > reference['high']:
+        return 'H'
+    return 'N'
+
+
+def _columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('lab_result')}
+
+
+def _backfill():
+    bind = op.get_bind()
+    lab_result = sa.table(
+        'lab_result',
+        sa.column('id', sa.Integer),
+        sa.column('test_name', sa.String),
+        sa.column('result_value', sa.String),
+        sa.column('value_numeric', sa.Float),
+        sa.column('unit', sa.String),
+        sa.column('interpretation', sa.String),
+    )
+    ranges = {row.test_name: dict(row._mapping) for row in bind.execute(sa.select(lab_reference_range))}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(lab_result.c.id, lab_result.c.test_name, lab_result.c.result_value)
+            .where(lab_result.c.id > last_id, lab_result.c.result_value.isnot(None))
+            .order_by(lab_result.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            value, unit = parse_lab_value(row.result_value)
+            if value is None:
+                continue
+            reference = ranges.get(' '.join((row.test_name or '').lower().split()))
+            unit = unit or (reference['unit'] if reference else None)
+            updates.append({'row_id': row.id, 'value_numeric': value, 'unit': unit,
+                            'interpretation': interpret(reference, value, unit)})
+        if updates:
+            bind.execute(
+                lab_result.update().where(lab_result.c.id == sa.bindparam('row_id')).values(
+                    value_numeric=sa.bindparam('value_numeric'), unit=sa.bindparam('unit'),
+                    interpretation=sa.bindparam('interpretation')
+                ),
+                updates
+            )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('lab_reference_range'):
+        op.create_table(
+            'lab_reference_range',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('test_name', sa.String(length=100), nullable=False),
+            sa.Column('unit', sa.String(length=20), nullable=True),
+            sa.Column('low', sa.Float(), nullable=True),
+            sa.Column('high', sa.Float(), nullable=True),
+            sa.Column('critical_low', sa.Float(), nullable=True),
+            sa.Column('critical_high', sa.Float(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('test_name'),
+        )
+    existing = {row.test_name for row in bind.execute(sa.select(lab_reference_range.c.test_name))}
+    missing = [dict(zip(RANGE_COLUMNS, values)) for values in DEFAULT_RANGES if values[0] not in existing]
+    if missing:
+        bind.execute(lab_reference_range.insert(), missing)
+
+    columns = _columns()
+    if 'value_numeric' not in columns:
+        op.add_column('lab_result', sa.Column('value_numeric', sa.Float(), nullable=True))
+    if 'unit' not in columns:
+        op.add_column('lab_result', sa.Column('unit', sa.String(length=20), nullable=True))
+    if 'interpretation' not in columns:
+        op.add_column('lab_result', sa.Column('interpretation', sa.String(length=2), nullable=True))
+    _backfill()
+
+
+def downgrade():
+    with op.batch_alter_table('lab_result') as batch_op:
+        batch_op.drop_column('interpretation')
+        batch_op.drop_column('unit')
+        batch_op.drop_column('value_numeric')
+    op.drop_table('lab_reference_range')
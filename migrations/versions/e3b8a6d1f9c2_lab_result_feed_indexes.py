@@ -0,0 +1,51 @@
+"""lab result feed indexes
+
+Revision ID: e3b8a6d1f9c2
+Revises: c7d2e5f8a1b4
+Create Date: 2026-10-18 21:00:00.000000
+
+Adds the (date, id) index behind keyset pagination of GET /labresults and a
+partial index over unacknowledged critical results, the nurse station
+queue. The partial index replaces ix_lab_result_critical_flag_acknowledged_date,
+which covered the same queries but grew with the whole result history.
+Each step is skipped when it has already been applied.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8a6d1f9c2'
+down_revision = 'c7d2e5f8a1b4'
+branch_labels = None
+depends_on = None
+
+
+def _existing_indexes():
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('lab_result')}
+
+
+def upgrade():
+    existing = _existing_indexes()
+    if 'ix_lab_result_date_id' not in existing:
+        op.create_index('ix_lab_result_date_id', 'lab_result', ['date', 'id'])
+    if 'ix_lab_result_unacknowledged_critical' not in existing:
+        op.create_index(
+            'ix_lab_result_unacknowledged_critical', 'lab_result', ['date', 'id'],
+            sqlite_where=sa.text('critical_flag = 1 AND acknowledged = 0'),
+            postgresql_where=sa.text('critical_flag AND NOT acknowledged')
+        )
+    if 'ix_lab_result_critical_flag_acknowledged_date' in existing:
+        op.drop_index('ix_lab_result_critical_flag_acknowledged_date', table_name='lab_result')
+
+
+def downgrade():
+    existing = _existing_indexes()
+    if 'ix_lab_result_critical_flag_acknowledged_date' not in existing:
+        op.create_index(
+            'ix_lab_result_critical_flag_acknowledged_date', 'lab_result', ['critical_flag', 'acknowledged', 'date']
+        )
+    for name in ('ix_lab_result_unacknowledged_critical', 'ix_lab_result_date_id'):
+        if name in existing:
+            op.drop_index(name, table_name='lab_result')
@@ -0,0 +1,41 @@
+"""updated_at on patient chart tables
+
+Revision ID: f1a7c3e9b5d2
+Revises: e3b8a6d1f9c2
+Create Date: 2026-10-19 09:00:00.000000
+
+Adds a nullable updated_at to patient, appointment, prescription,
+lab_result and medical_record. It feeds the patient chart ETag, which
+falls back to created_at for rows that haven't been edited since, so
+there is nothing to backfill. Columns are only added if missing.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c3e9b5d2'
+down_revision = 'e3b8a6d1f9c2'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('patient', 'appointment', 'prescription', 'lab_result', 'medical_record')
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    for table in TABLES:
+        if 'updated_at' not in _columns(table):
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        if 'updated_at' in _columns(table):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('updated_at')
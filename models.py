@@ -1,13 +1,55 @@
 from extension import db
 from datetime import datetime
+import math
+import re
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
+def calculate_age(date_of_birth):
+    if date_of_birth:
+        today = datetime.today().date()
+        return today.year - date_of_birth.year - (
+            (today.month, today.day) < (date_of_birth.month, date_of_birth.day)
+        )
+    return None
+
+_BLOOD_PRESSURE = re.compile(r'^\s*(\d{2,3})\s*/\s*(\d{2,3})')
+
+def parse_blood_pressure(value):
+    """Split a reading like "120/80" into (systolic, diastolic); (None, None) if it can't be parsed."""
+    match = _BLOOD_PRESSURE.match(value) if isinstance(value, str) else None
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+_LAB_VALUE = re.compile(r'^\s*[<>]?=?\s*(-?\d+(?:\.\d+)?)\s*([A-Za-z%\u00b5\u03bc][^\s(),;]*)?')
+
+def parse_lab_value(value):
+    """Split a result like "5.4 mmol/L" into (5.4, "mmol/L"); (None, None) unless it starts with a number."""
+    match = _LAB_VALUE.match(value or '')
+    if not match:
+        return None, None
+    # Enough digits overflow to inf, which isn't valid JSON
+    return parse_number(match.group(1)), match.group(2)
+
+def parse_number(value):
+    """float(value) for a measurement that may arrive as a string; None unless it's a finite number."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def lab_test_key(test_name):
+    """Case- and spacing-insensitive key used to match lab results to reference ranges."""
+    return ' '.join((test_name or '').lower().split())
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    role = db.Column(db.String(20), default='staff')
+    role = db.Column(db.String(20), default='staff', index=True)
     specialization = db.Column(db.String(100))
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -45,6 +87,7 @@ class Patient(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     password_hash = db.Column(db.String(128))
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='patient')
@@ -61,12 +104,7 @@ class Patient(db.Model):
     
     @property
     def age(self):
-        if self.date_of_birth:
-            today = datetime.today().date()
-            return today.year - self.date_of_birth.year - (
-                (today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day)
-            )
-        return None
+        return calculate_age(self.date_of_birth)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -75,6 +113,13 @@ class Patient(db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Appointment(db.Model):
+    __table_args__ = (
+        db.Index('ix_appointment_date_start_time', 'date', 'start_time'),
+        db.Index('ix_appointment_status_date_start_time', 'status', 'date', 'start_time'),
+        db.Index('ix_appointment_doctor_id_date', 'doctor_id', 'date'),
+        db.Index('ix_appointment_patient_id_date', 'patient_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -86,21 +131,34 @@ class Appointment(db.Model):
     notes = db.Column(db.Text)
     telemedicine = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
 class Prescription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
     medication_name = db.Column(db.String(100), nullable=False)
     dosage = db.Column(db.String(50))
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
-    prescribing_doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    prescribing_doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     prescribing_doctor_name = db.Column(db.String(100))
     notes = db.Column(db.Text)
-    status = db.Column(db.String(20), default='active')  # active, completed, cancelled
+    status = db.Column(db.String(20), default='active', index=True)  # active, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
 class LabResult(db.Model):
+    __table_args__ = (
+        db.Index('ix_lab_result_patient_id_date', 'patient_id', 'date'),
+        db.Index('ix_lab_result_date_id', 'date', 'id'),
+        # The nurse station queue; stays the size of the queue, not of the history
+        db.Index(
+            'ix_lab_result_unacknowledged_critical', 'date', 'id',
+            sqlite_where=db.text('critical_flag = 1 AND acknowledged = 0'),
+            postgresql_where=db.text('critical_flag AND NOT acknowledged')
+        ),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     test_name = db.Column(db.String(100), nullable=False)
@@ -111,8 +169,30 @@ class LabResult(db.Model):
     ordering_provider = db.Column(db.String(100))
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    value_numeric = db.Column(db.Float)
+    unit = db.Column(db.String(20))
+    interpretation = db.Column(db.String(2))  # LL, L, N, H, HH against the reference range
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    
+    @validates('result_value')
+    def _parse_result_value(self, key, value):
+        self.value_numeric, self.unit = parse_lab_value(value)
+        return value
+
+class LabReferenceRange(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    test_name = db.Column(db.String(100), unique=True, nullable=False)  # lab_test_key() of the test name
+    unit = db.Column(db.String(20))
+    low = db.Column(db.Float)
+    high = db.Column(db.Float)
+    critical_low = db.Column(db.Float)
+    critical_high = db.Column(db.Float)
 
 class MedicalRecord(db.Model):
+    __table_args__ = (
+        db.Index('ix_medical_record_patient_id_date', 'patient_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     diagnosis = db.Column(db.String(200), nullable=False)
@@ -120,24 +200,39 @@ class MedicalRecord(db.Model):
     notes = db.Column(db.Text)
     provider = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
 class VitalSign(db.Model):
+    __table_args__ = (
+        # Covers the series query, so a patient's range is read from the
+        # index alone in timestamp order
+        db.Index('ix_vital_sign_series', 'patient_id', 'timestamp', 'heart_rate', 'oxygen_saturation',
+                 'temperature', 'systolic', 'diastolic'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     heart_rate = db.Column(db.Integer)
     blood_pressure = db.Column(db.String(10))  # e.g., "120/80"
+    systolic = db.Column(db.Integer)  # mmHg, parsed from blood_pressure
+    diastolic = db.Column(db.Integer)  # mmHg, parsed from blood_pressure
     oxygen_saturation = db.Column(db.Float)  # percentage
     temperature = db.Column(db.Float)  # Celsius
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    @validates('blood_pressure')
+    def _split_blood_pressure(self, key, value):
+        self.systolic, self.diastolic = parse_blood_pressure(value)
+        return value
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     message = db.Column(db.Text, nullable=False)
-    notification_type = db.Column(db.String(50))  # appointment, prescription, lab_result, etc.
+    notification_type = db.Column(db.String(50))  # appointment, prescription, lab_result, vital_alert, etc.
     read = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Program(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -148,9 +243,13 @@ class Program(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Enrollment(db.Model):
+    __table_args__ = (
+        db.Index('ix_enrollment_program_id_patient_id', 'program_id', 'patient_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='active')  # active, completed, withdrawn
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -164,11 +263,11 @@ class Medication(db.Model):
 
 class PendingAction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
-    assigned_user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), index=True)
+    assigned_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     action_type = db.Column(db.String(50))  # follow_up, test, consultation, etc.
     description = db.Column(db.Text)
-    due_date = db.Column(db.Date)
+    due_date = db.Column(db.Date, index=True)
     status = db.Column(db.String(20), default='pending')  # pending, in_progress, completed
     priority = db.Column(db.String(20), default='medium')  # low, medium, high
     completed_at = db.Column(db.DateTime)
@@ -178,6 +277,48 @@ class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     action = db.Column(db.String(100), nullable=False)
     details = db.Column(db.Text)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class AggregateCounter(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+class IdSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+class OutboxEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    dispatched_at = db.Column(db.DateTime, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+
+class VitalRollup(db.Model):
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), primary_key=True)
+    resolution = db.Column(db.String(2), primary_key=True)  # 1m, 1h, 1d
+    bucket = db.Column(db.DateTime, primary_key=True)
+    hr_count = db.Column(db.Integer, nullable=False, default=0)
+    hr_sum = db.Column(db.Float)
+    hr_min = db.Column(db.Float)
+    hr_max = db.Column(db.Float)
+    spo2_count = db.Column(db.Integer, nullable=False, default=0)
+    spo2_sum = db.Column(db.Float)
+    spo2_min = db.Column(db.Float)
+    spo2_max = db.Column(db.Float)
+    temp_count = db.Column(db.Integer, nullable=False, default=0)
+    temp_sum = db.Column(db.Float)
+    temp_min = db.Column(db.Float)
+    temp_max = db.Column(db.Float)
+    sbp_count = db.Column(db.Integer, nullable=False, default=0)
+    sbp_sum = db.Column(db.Float)
+    sbp_min = db.Column(db.Float)
+    sbp_max = db.Column(db.Float)
+    dbp_count = db.Column(db.Integer, nullable=False, default=0)
+    dbp_sum = db.Column(db.Float)
+    dbp_min = db.Column(db.Float)
+    dbp_max = db.Column(db.Float)
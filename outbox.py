@@ -0,0 +1,289 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import threading
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, update
+from models import Notification, OutboxEvent
+from extension import db
+import events
+
+# Transactional outbox. Write routes add an OutboxEvent in the same
+# transaction as the row that caused it; a background dispatcher later fans
+# the events out to the registered sinks (the Notification table, and
+# anything else that registers with @sink) and marks them dispatched.
+#
+# The dispatcher is woken by commits that add events, then waits
+# OUTBOX_COALESCE_SECONDS so a burst is handled as one batch. It also polls
+# every OUTBOX_POLL_SECONDS to pick up events committed by other workers.
+# Each batch is claimed, delivered and marked in one transaction. If a sink
+# fails, the batch is redone one event at a time, so only the events that
+# fail again stay pending and use up an attempt; events that fail
+# OUTBOX_MAX_ATTEMPTS times are left for an operator.
+
+_sinks = defaultdict(list)
+_wakeup = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {'dispatched': 0, 'failed_batches': 0, 'last_batch_size': 0, 'last_lag_seconds': None,
+          'last_dispatch_at': None}
+_app = None
+_thread_pid = None
+
+
+def sink(event_type):
+    """Register handler(session, payloads) for a batch of events of `event_type`."""
+    def decorator(handler):
+        _sinks[event_type].append(handler)
+        return handler
+    return decorator
+
+
+def enqueue(event_type, **payload):
+    """Add an event to the current session; it is dispatched once the session commits."""
+    event = OutboxEvent(event_type=event_type, payload=json.dumps(payload, default=str))
+    db.session.add(event)
+    return event
+
+
+def notify(message, notification_type, patient_id=None, user_id=None):
+    return enqueue('notification', patient_id=patient_id, user_id=user_id, message=message,
+                   notification_type=notification_type)
+
+
+def enqueue_many(session, event_type, payloads):
+    """Bulk-insert events from inside a flush, where objects can't be added to the session."""
+    rows = [{
+        'event_type': event_type,
+        'payload': json.dumps(payload, default=str),
+        'created_at': datetime.utcnow(),
+        'attempts': 0,
+    } for payload in payloads]
+    if not rows:
+        return
+    ids = session.connection().execute(
+        insert(OutboxEvent).returning(OutboxEvent.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    for row, pk in zip(rows, ids):
+        row['id'] = pk
+    events.record(session, 'insert', OutboxEvent, rows)
+
+
+@sink('notification')
+def _write_notifications(session, payloads):
+    rows = [{
+        'patient_id': payload.get('patient_id'),
+        'user_id': payload.get('user_id'),
+        'message': payload['message'],
+        'notification_type': payload.get('notification_type'),
+        'read': False,
+        'timestamp': payload['created_at'],
+    } for payload in payloads]
+    ids = session.execute(
+        insert(Notification).returning(Notification.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    for row, pk in zip(rows, ids):
+        row['id'] = pk
+    events.record(session, 'insert', Notification, rows)
+
+
+def _claim(query, now):
+    """Load the events `query` selects and claim them for this dispatcher."""
+    session = db.session
+    if db.engine.dialect.name != 'sqlite':
+        query = query.with_for_update(skip_locked=True)
+    batch = query.all()
+    if batch and db.engine.dialect.name == 'sqlite':
+        # No row locks here, and the SELECT above doesn't begin a write
+        # transaction: claim the rows first, which takes the write lock, so a
+        # dispatcher that read the same rows finds them claimed and skips them
+        claimed = set(session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_([event.id for event in batch]), OutboxEvent.dispatched_at.is_(None))
+            .values(dispatched_at=now)
+            .returning(OutboxEvent.id),
+            execution_options={'synchronize_session': False}
+        ).scalars())
+        batch = [event for event in batch if event.id in claimed]
+    return batch
+
+
+def _deliver(batch, now):
+    """Hand claimed events to their sinks and mark them dispatched, in one transaction."""
+    session = db.session
+    grouped = defaultdict(list)
+    for event in batch:
+        payload = json.loads(event.payload)
+        payload['created_at'] = event.created_at
+        grouped[event.event_type].append(payload)
+    for event_type, payloads in grouped.items():
+        if event_type not in _sinks:
+            logging.warning(f"No outbox sink for {event_type} events")
+        for handler in _sinks.get(event_type, ()):
+            handler(session, payloads)
+    for event in batch:
+        event.dispatched_at = now
+        event.attempts += 1
+    session.commit()
+
+
+def _deliver_each(ids):
+    """Retry a failed batch one event at a time; return (delivered events, last error)."""
+    session = db.session
+    delivered = []
+    error = None
+    for pk in ids:
+        now = datetime.utcnow()
+        batch = _claim(OutboxEvent.query.filter(OutboxEvent.id == pk, OutboxEvent.dispatched_at.is_(None)), now)
+        if not batch:
+            session.rollback()
+            continue
+        try:
+            _deliver(batch, now)
+        except Exception as e:
+            session.rollback()
+            error = e
+            # Only the event that failed uses up an attempt
+            OutboxEvent.query.filter(OutboxEvent.id == pk).update(
+                {'attempts': OutboxEvent.attempts + 1, 'last_error': str(e)}, synchronize_session=False
+            )
+            session.commit()
+        else:
+            delivered.extend(batch)
+    return delivered, error
+
+
+def dispatch_pending(batch_size=None):
+    """Deliver one batch of pending events; return how many were dispatched.
+
+    If the batch fails, its events are retried one at a time so a single
+    bad event doesn't hold back or use up the attempts of the rest; the
+    last error is raised after the healthy ones are delivered.
+    """
+    batch_size = batch_size or _app.config['OUTBOX_BATCH_SIZE']
+    session = db.session
+    now = datetime.utcnow()
+    batch = _claim(OutboxEvent.query.filter(
+        OutboxEvent.dispatched_at.is_(None),
+        OutboxEvent.attempts < _app.config['OUTBOX_MAX_ATTEMPTS']
+    ).order_by(OutboxEvent.id).limit(batch_size), now)
+    if not batch:
+        session.rollback()
+        return 0
+
+    ids = [event.id for event in batch]
+    error = None
+    try:
+        _deliver(batch, now)
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Outbox batch of {len(ids)} events failed, delivering them one at a time: {str(e)}")
+        with _stats_lock:
+            _stats['failed_batches'] += 1
+        batch, error = _deliver_each(ids)
+
+    if batch:
+        with _stats_lock:
+            _stats['dispatched'] += len(batch)
+            _stats['last_batch_size'] = len(batch)
+            _stats['last_lag_seconds'] = round(
+                (now - min(event.created_at for event in batch)).total_seconds(), 3
+            )
+            _stats['last_dispatch_at'] = now.isoformat()
+    if error is not None:
+        logging.error(f"Outbox dispatch failed: {str(error)}")
+        raise error
+    return len(batch)
+
+
+def _run():
+    config = _app.config
+    while True:
+        woken = _wakeup.wait(config['OUTBOX_POLL_SECONDS'])
+        if woken:
+            # Let the rest of a burst commit before draining
+            time.sleep(config['OUTBOX_COALESCE_SECONDS'])
+        _wakeup.clear()
+        with _app.app_context():
+            try:
+                while dispatch_pending() == config['OUTBOX_BATCH_SIZE']:
+                    pass
+            except Exception:
+                time.sleep(config['OUTBOX_POLL_SECONDS'])
+            finally:
+                db.session.remove()
+
+
+def _ensure_dispatcher():
+    # One dispatcher per process; a forked worker starts its own.
+    global _thread_pid
+    if _app is None or not _app.config['OUTBOX_DISPATCHER_ENABLED'] or _thread_pid == os.getpid():
+        return
+    _thread_pid = os.getpid()
+    threading.Thread(target=_run, name='outbox-dispatcher', daemon=True).start()
+
+
+def init_app(app):
+    global _app
+    app.config.setdefault('OUTBOX_DISPATCHER_ENABLED', True)
+    app.config.setdefault('OUTBOX_BATCH_SIZE', 500)
+    app.config.setdefault('OUTBOX_COALESCE_SECONDS', 0.05)
+    app.config.setdefault('OUTBOX_POLL_SECONDS', 5)
+    app.config.setdefault('OUTBOX_MAX_ATTEMPTS', 10)
+    _app = app
+    _ensure_dispatcher()
+
+
+@events.on_commit
+def _wake(changes):
+    if any(change.model is OutboxEvent and change.action == 'insert' for change in changes):
+        _ensure_dispatcher()
+        _wakeup.set()
+
+
+def stats():
+    pending, oldest = db.session.query(
+        func.count(OutboxEvent.id), func.min(OutboxEvent.created_at)
+    ).filter(
+        OutboxEvent.dispatched_at.is_(None),
+        OutboxEvent.attempts < _app.config['OUTBOX_MAX_ATTEMPTS']
+    ).one()
+    with _stats_lock:
+        result = dict(_stats)
+    result['pending'] = pending
+    result['stuck'] = OutboxEvent.query.filter(
+        OutboxEvent.dispatched_at.is_(None),
+        OutboxEvent.attempts >= _app.config['OUTBOX_MAX_ATTEMPTS']
+    ).count()
+    result['lag_seconds'] = round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else 0
+    result['dispatcher_running'] = _thread_pid == os.getpid()
+    return result
+
+
+# CLI commands
+cli = AppGroup('outbox', help='Outbox maintenance commands.')
+
+
+@cli.command('dispatch')
+def dispatch_command():
+    """Deliver all pending outbox events now."""
+    total = 0
+    while True:
+        count = dispatch_pending()
+        total += count
+        if count < _app.config['OUTBOX_BATCH_SIZE']:
+            break
+    click.echo(f"Dispatched {total} events")
+
+
+@cli.command('purge')
+@click.option('--days', default=7, show_default=True, help='Keep dispatched events this many days.')
+def purge_command(days):
+    """Delete dispatched events older than --days."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = OutboxEvent.query.filter(OutboxEvent.dispatched_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} dispatched events")
@@ -0,0 +1,92 @@
+import hashlib
+from sqlalchemy import select, func, desc
+from sqlalchemy.orm import joinedload, load_only
+from models import User, Patient, Appointment, Prescription, LabResult, MedicalRecord
+from extension import db
+
+# Patient chart loading. A chart is the patient row plus capped sections of
+# appointments, prescriptions, lab results and conditions. The patient row
+# and a fingerprint of every section (row count and the latest created_at or
+# updated_at) come back in one statement, which is all a conditional GET
+# needs; the sections themselves are one bounded query each.
+
+SECTION_MODELS = {
+    'appointments': Appointment,
+    'prescriptions': Prescription,
+    'lab_results': LabResult,
+    'conditions': MedicalRecord,
+}
+
+DEFAULT_LIMITS = {
+    'appointments': 50,
+    'prescriptions': 50,
+    'lab_results': 50,
+    'conditions': 100,
+}
+MAX_LIMIT = 500
+
+
+def _section_stats(model):
+    return (
+        select(func.count(model.id)).where(model.patient_id == Patient.id).scalar_subquery(),
+        select(func.max(func.coalesce(model.updated_at, model.created_at))).where(
+            model.patient_id == Patient.id
+        ).scalar_subquery(),
+    )
+
+
+def load_header(patient_id):
+    """Return (patient, section_counts, fingerprint) or None if there is no such patient."""
+    columns = []
+    for model in SECTION_MODELS.values():
+        columns.extend(_section_stats(model))
+    row = db.session.query(Patient, *columns).filter(Patient.patient_id == patient_id).first()
+    if row is None:
+        return None
+
+    patient, stats = row[0], row[1:]
+    counts = {}
+    fingerprint = [str(patient.id), str(patient.updated_at or patient.created_at)]
+    for index, section in enumerate(SECTION_MODELS):
+        count, newest = stats[index * 2], stats[index * 2 + 1]
+        counts[section] = count
+        fingerprint.append(f"{section}:{count}:{newest}")
+    return patient, counts, fingerprint
+
+
+def etag(fingerprint, limits):
+    # Counts change when a row is added or removed, and the latest
+    # created_at/updated_at when one is added or edited (updated_at is set by
+    # the ORM and by Core UPDATEs alike).
+    parts = fingerprint + [f"{section}<={limit}" for section, limit in sorted(limits.items())]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def load_sections(patient, limits):
+    appointments = Appointment.query.options(
+        load_only(Appointment.id, Appointment.date, Appointment.start_time, Appointment.status, Appointment.reason),
+        joinedload(Appointment.doctor, innerjoin=True).load_only(User.username)
+    ).filter(Appointment.patient_id == patient.id).order_by(
+        desc(Appointment.date), desc(Appointment.start_time)
+    ).limit(limits['appointments']).all()
+
+    prescriptions = Prescription.query.filter(Prescription.patient_id == patient.id).order_by(
+        desc(Prescription.created_at), desc(Prescription.id)
+    ).limit(limits['prescriptions']).all()
+
+    lab_results = LabResult.query.filter(LabResult.patient_id == patient.id).order_by(
+        desc(LabResult.date), desc(LabResult.id)
+    ).limit(limits['lab_results']).all()
+
+    conditions = [row.diagnosis for row in db.session.query(MedicalRecord.diagnosis).filter(
+        MedicalRecord.patient_id == patient.id
+    ).group_by(MedicalRecord.diagnosis).order_by(
+        desc(func.max(MedicalRecord.date))
+    ).limit(limits['conditions'])]
+
+    return {
+        'appointments': appointments,
+        'prescriptions': prescriptions,
+        'lab_results': lab_results,
+        'conditions': conditions,
+    }
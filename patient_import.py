@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from models import Patient
+from extension import db
+import events
+import identifiers
+
+# Bulk patient registration from CSV or NDJSON. Rows are parsed lazily from
+# the input stream, validated, and inserted in batches: one multi-row INSERT
+# and one commit per batch, with identifiers reserved in a single block and
+# the temporary password hashed once for the whole batch.
+
+IMPORT_BATCH_SIZE = 2000
+TEMPORARY_PASSWORD = 'TempPassword123'
+
+REQUIRED_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'date_of_birth')
+TEXT_FIELDS = (
+    'first_name', 'last_name', 'email', 'phone', 'gender', 'blood_type', 'allergies',
+    'current_medications', 'insurance_provider', 'policy_number', 'emergency_contact',
+    'isolation_status'
+)
+BOOLEAN_FIELDS = ('in_icu', 'on_ventilator', 'telemedicine_ready', 'is_active')
+
+
+def read_rows(stream, fmt):
+    """Yield (row_number, record, error) for each row of a CSV or NDJSON byte stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(text), start=1):
+            yield number, record, None
+        return
+
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def validate(record):
+    """Return (values, error) for one input record."""
+    missing = [field for field in REQUIRED_FIELDS if not str(record.get(field) or '').strip()]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+
+    values = {}
+    for field in TEXT_FIELDS:
+        value = record.get(field)
+        if value is not None and str(value).strip() != '':
+            values[field] = str(value).strip()
+    for field in BOOLEAN_FIELDS:
+        value = record.get(field)
+        if value is not None and str(value).strip() != '':
+            values[field] = _parse_bool(value)
+
+    try:
+        values['date_of_birth'] = datetime.strptime(str(record['date_of_birth']).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        return None, "Invalid date format for date_of_birth"
+    return values, None
+
+
+def _insert(rows):
+    inserted = db.session.execute(
+        insert(Patient).returning(Patient.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    for values, pk in zip(rows, inserted):
+        values['id'] = pk
+    events.record(db.session, 'insert', Patient, rows)
+
+
+def _row_error(e):
+    """A report message for a row the database refused.
+
+    The exception text holds the INSERT with its parameters (personal
+    details and the password hash), so only the constraint is reported.
+    """
+    if isinstance(e, IntegrityError):
+        detail = str(e.orig).splitlines()[0].lower()
+        # Longest first, so patient.patient_id isn't taken for id
+        for column in sorted(Patient.__table__.columns, key=lambda column: -len(column.name)):
+            if column.name in detail:
+                if 'unique' in detail or 'duplicate' in detail:
+                    return f'Duplicate {column.name}'
+                if 'null' in detail:
+                    return f'Missing {column.name}'
+    return 'Could not be stored'
+
+
+def _insert_batch(batch, report):
+    rows = [values for _, values in batch]
+
+    # Reserve identifiers before the session starts its write transaction.
+    for values, patient_id in zip(rows, identifiers.patient_ids(len(rows))):
+        values['patient_id'] = patient_id
+    password_hash = generate_password_hash(TEMPORARY_PASSWORD)
+    for values in rows:
+        values['password_hash'] = password_hash
+
+    try:
+        _insert(rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Patient import batch failed, retrying row by row: {str(e)}")
+    else:
+        report['imported'] += len(batch)
+        return
+
+    # Find the rows that broke the batch; the rest still go in
+    for number, values in batch:
+        try:
+            _insert([values])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Patient import row {number} failed: {str(e)}")
+            report['failed'] += 1
+            report['errors'].append({'row': number, 'error': _row_error(e)})
+        else:
+            report['imported'] += 1
+
+
+def import_patients(rows, batch_size=IMPORT_BATCH_SIZE):
+    """Import (row_number, record, error) tuples and return the per-row report."""
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    for number, record, error in rows:
+        values = None
+        if error is None:
+            values, error = validate(record)
+        if error:
+            report['failed'] += 1
+            report['errors'].append({'row': number, 'error': error})
+            continue
+        batch.append((number, values))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, report)
+            batch = []
+    if batch:
+        _insert_batch(batch, report)
+    return report
+
+
+def detect_format(content_type, filename=None):
+    if filename:
+        if filename.endswith('.csv'):
+            return 'csv'
+        if filename.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'ndjson'
+    return None
+
+
+# CLI commands
+cli = AppGroup('patients', help='Patient maintenance commands.')
+
+
+@cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def import_command(path, fmt, batch_size):
+    """Bulk import patients from a CSV or NDJSON file."""
+    fmt = fmt or detect_format(None, path)
+    if fmt is None:
+        raise click.ClickException("Cannot tell the file format, pass --format")
+    with open(path, 'rb') as stream:
+        report = import_patients(read_rows(stream, fmt), batch_size)
+    for error in report['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {report['imported']} patients, {report['failed']} failed")
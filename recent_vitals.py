@@ -0,0 +1,323 @@
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+import math
+import threading
+import time
+from sqlalchemy import func, select
+from models import Patient, VitalSign
+from extension import db
+import counters
+import events
+
+# Per-process ring buffers of each active patient's most recent readings,
+# so "the latest K readings for these patients" is answered from memory.
+# A buffer is a fixed-size set of parallel arrays (one per column, NaN where
+# a value is missing) kept in timestamp order; appending overwrites the
+# oldest slot. Buffers are warmed from the database at startup, loaded on
+# first request for a patient who isn't held yet, and extended by this
+# process's VitalSign commits. Readings committed by other workers are
+# picked up by a delta load of new ids at most every
+# RECENT_VITALS_REFRESH_SECONDS. Edits and deletes can't be seen that way,
+# so every flush that updates or deletes a VitalSign bumps the
+# recent_vitals.revision counter; when a refresh sees it move, all buffers
+# are dropped and reloaded on demand.
+#
+# Memory is bounded by RECENT_VITALS_PER_PATIENT x RECENT_VITALS_MAX_PATIENTS:
+# the least recently updated patient is dropped when a new one comes in,
+# discharged patients are dropped as soon as the discharge commits here
+# (or on the next sweep otherwise), and patients without a reading for
+# RECENT_VITALS_IDLE_MINUTES are dropped by the sweep.
+
+# Buffer columns after the id; timestamp is stored as epoch seconds
+COLUMNS = ('timestamp', 'heart_rate', 'oxygen_saturation', 'temperature', 'systolic', 'diastolic')
+INTEGER_COLUMNS = ('heart_rate', 'systolic', 'diastolic')
+NAN = float('nan')
+DELTA_LIMIT = 50000
+REVISION = 'recent_vitals.revision'
+
+
+class RingBuffer:
+    __slots__ = ('ids', 'columns', 'start', 'size', 'updated_at')
+
+    def __init__(self, capacity):
+        self.ids = array('q', bytes(8 * capacity))
+        self.columns = [array('d', bytes(8 * capacity)) for _ in COLUMNS]
+        self.start = 0
+        self.size = 0
+        self.updated_at = time.monotonic()
+
+    def _slot(self, offset):
+        return (self.start + offset) % len(self.ids)
+
+    def append(self, pk, row):
+        """Add (timestamp, *values) for reading `pk`, keeping timestamp order."""
+        capacity = len(self.ids)
+        newest = self._slot(self.size - 1) if self.size else None
+        if newest is not None and pk <= self.ids[newest] and pk in self.ids:
+            return
+        if self.size == capacity and row[0] < self.columns[0][self.start]:
+            return  # Older than everything held
+        if self.size < capacity:
+            slot = self._slot(self.size)
+            self.size += 1
+        else:
+            slot = self.start
+            self.start = self._slot(1)
+        self.ids[slot] = pk
+        for column, value in zip(self.columns, row):
+            column[slot] = value
+        self.updated_at = time.monotonic()
+        if newest is not None and row[0] < self.columns[0][newest]:
+            self._sort()
+
+    def _sort(self):
+        # Late readings are rare; re-lay the buffer out in order from slot 0
+        rows = sorted(
+            (self.columns[0][slot], self.ids[slot], slot)
+            for slot in (self._slot(offset) for offset in range(self.size))
+        )
+        ids = array('q', (pk for _, pk, _ in rows))
+        columns = [array('d', (column[slot] for _, _, slot in rows)) for column in self.columns]
+        self.start = 0
+        self.ids[:self.size] = ids
+        for column, values in zip(self.columns, columns):
+            column[:self.size] = values
+
+    def latest(self, k):
+        """The newest `k` readings as (id, timestamp, *values) tuples, newest first."""
+        rows = []
+        for offset in range(self.size - 1, max(self.size - k, 0) - 1, -1):
+            slot = self._slot(offset)
+            rows.append((self.ids[slot],) + tuple(column[slot] for column in self.columns))
+        return rows
+
+
+_buffers = OrderedDict()
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_config = {}
+_max_id = 0
+_revision = None
+_refreshed_at = 0.0
+_swept_at = 0.0
+
+
+def _row(values):
+    timestamp = values.get('timestamp')
+    return (timestamp.timestamp() if timestamp else NAN,) + tuple(
+        NAN if values.get(name) is None else float(values[name]) for name in COLUMNS[1:]
+    )
+
+
+def _select():
+    return select(VitalSign.id, VitalSign.patient_id, *[getattr(VitalSign, name) for name in COLUMNS])
+
+
+def _load(patient_ids=None, since=None, limit=None):
+    """Buffers for `patient_ids`, or for every active patient with readings since `since`, from the database."""
+    capacity = _config['capacity']
+    rank = func.row_number().over(
+        partition_by=VitalSign.patient_id, order_by=(VitalSign.timestamp.desc(), VitalSign.id.desc())
+    ).label('rank')
+    ranked = _select().add_columns(rank)
+    if patient_ids is not None:
+        ranked = ranked.where(VitalSign.patient_id.in_(patient_ids))
+    else:
+        ranked = ranked.join(Patient, Patient.id == VitalSign.patient_id).where(
+            Patient.is_active.is_(True), VitalSign.timestamp >= since
+        )
+    ranked = ranked.subquery()
+    query = select(*[ranked.c[name] for name in ('id', 'patient_id') + COLUMNS]).where(ranked.c.rank <= capacity)
+
+    buffers = {}
+    for row in db.session.execute(query.order_by(ranked.c.patient_id, ranked.c.timestamp, ranked.c.id)):
+        values = row._mapping
+        buffer = buffers.get(values['patient_id'])
+        if buffer is None:
+            buffer = buffers[values['patient_id']] = RingBuffer(capacity)
+        buffer.append(values['id'], _row(values))
+    if limit is not None and len(buffers) > limit:
+        keep = sorted(buffers, key=lambda pk: buffers[pk].columns[0][buffers[pk]._slot(buffers[pk].size - 1)])
+        buffers = {pk: buffers[pk] for pk in keep[-limit:]}
+    return buffers
+
+
+def _store(buffers):
+    # Caller holds _lock. Least recently updated first, so eviction drops them first.
+    for pk in sorted(buffers, key=lambda pk: buffers[pk].updated_at):
+        _buffers[pk] = buffers[pk]
+        _buffers.move_to_end(pk)
+    while len(_buffers) > _config['max_patients']:
+        _buffers.popitem(last=False)
+
+
+def warm():
+    """Replace the buffers with the recent readings of active patients."""
+    global _max_id, _revision, _refreshed_at, _swept_at
+    since = datetime.now() - timedelta(minutes=_config['idle_minutes'])
+    revision = counters.read([REVISION])[REVISION]
+    max_id = db.session.execute(select(func.max(VitalSign.id))).scalar() or 0
+    buffers = _load(since=since, limit=_config['max_patients'])
+    with _lock:
+        _buffers.clear()
+        _store(buffers)
+        _max_id = max(_max_id, max_id)
+        _revision = revision
+    _refreshed_at = _swept_at = time.monotonic()
+
+
+def _refresh():
+    """Append readings other workers committed, and sweep out idle or discharged patients."""
+    # _max_id only moves here: local commits can land before another
+    # worker's lower ids, and rows already held are skipped by the buffer.
+    global _max_id, _revision, _refreshed_at, _swept_at
+    now = time.monotonic()
+    if now - _refreshed_at < _config['refresh_seconds'] or not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        # Read before the delta, so an edit committed after this is caught next time
+        revision = counters.read([REVISION])[REVISION]
+        if revision != _revision:
+            with _lock:
+                _buffers.clear()
+                _revision = revision
+        rows = db.session.execute(
+            _select().where(VitalSign.id > _max_id).order_by(VitalSign.id).limit(DELTA_LIMIT)
+        ).all()
+        if len(rows) == DELTA_LIMIT:
+            # Far behind (e.g. idle while other workers ingested); start over
+            warm()
+            return
+        with _lock:
+            for row in rows:
+                _append(row._mapping)
+        if rows:
+            _max_id = rows[-1].id
+        _refreshed_at = now
+        if now - _swept_at >= _config['sweep_seconds']:
+            _sweep(now)
+            _swept_at = now
+    finally:
+        _refresh_lock.release()
+
+
+def _sweep(now):
+    idle = _config['idle_minutes'] * 60
+    with _lock:
+        held = list(_buffers)
+        for pk in [pk for pk in held if now - _buffers[pk].updated_at > idle]:
+            del _buffers[pk]
+    if held:
+        discharged = db.session.execute(
+            select(Patient.id).where(Patient.id.in_(held), Patient.is_active.is_(False))
+        ).scalars().all()
+        with _lock:
+            for pk in discharged:
+                _buffers.pop(pk, None)
+
+
+def _append(values):
+    # Caller holds _lock. Patients not held are loaded in full on first request.
+    buffer = _buffers.get(values['patient_id'])
+    if buffer is not None:
+        buffer.append(values['id'], _row(values))
+        _buffers.move_to_end(values['patient_id'])
+
+
+def latest(patient_ids, k):
+    """{patient pk: [reading dict, newest first]} for up to `k` readings per patient."""
+    _refresh()
+    k = min(k, _config['capacity'])
+    with _lock:
+        found = {pk: _buffers[pk].latest(k) for pk in patient_ids if pk in _buffers}
+    missing = [pk for pk in patient_ids if pk not in found]
+    if missing:
+        buffers = _load(patient_ids=missing)
+        for pk in missing:
+            buffers.setdefault(pk, RingBuffer(_config['capacity']))
+        # Only active patients are kept; an empty buffer stops a patient
+        # without readings from being looked up every time
+        active = db.session.execute(
+            select(Patient.id).where(Patient.id.in_(missing), Patient.is_active.is_(True))
+        ).scalars().all()
+        with _lock:
+            _store({pk: buffers[pk] for pk in active})
+        found.update((pk, buffer.latest(k)) for pk, buffer in buffers.items())
+
+    result = {}
+    for pk, rows in found.items():
+        readings = []
+        for row in rows:
+            reading = {'id': row[0], 'timestamp': datetime.fromtimestamp(row[1]).isoformat()}
+            for name, value in zip(COLUMNS[1:], row[2:]):
+                if math.isnan(value):
+                    reading[name] = None
+                else:
+                    reading[name] = int(value) if name in INTEGER_COLUMNS else value
+            reading['blood_pressure'] = (
+                f"{reading['systolic']}/{reading['diastolic']}" if reading['systolic'] is not None else None
+            )
+            readings.append(reading)
+        result[pk] = readings
+    return result
+
+
+def stats():
+    with _lock:
+        patients = len(_buffers)
+        readings = sum(buffer.size for buffer in _buffers.values())
+    capacity = _config['capacity']
+    return {
+        'patients': patients,
+        'readings': readings,
+        'max_patients': _config['max_patients'],
+        'per_patient': capacity,
+        'estimated_bytes': patients * capacity * 8 * (len(COLUMNS) + 1),
+    }
+
+
+@events.on_flush
+def _track_edits(session, changes):
+    edits = sum(1 for change in changes if change.model is VitalSign and change.action != 'insert')
+    if edits:
+        counters.apply_deltas(session.connection(), {REVISION: edits})
+
+
+@events.on_commit
+def _apply(changes):
+    if not _config:
+        return
+    with _lock:
+        for change in changes:
+            values = change.values
+            if change.model is VitalSign:
+                if change.action == 'insert':
+                    _append(values)
+                else:
+                    # Edits and deletes are rare; reload the patient on next request
+                    _buffers.pop(values['patient_id'], None)
+                    _buffers.pop(change.previous.get('patient_id'), None)
+            elif change.model is Patient and (change.action == 'delete' or not values.get('is_active', True)):
+                _buffers.pop(values['id'], None)
+
+
+def init_app(app):
+    app.config.setdefault('RECENT_VITALS_PER_PATIENT', 120)
+    app.config.setdefault('RECENT_VITALS_MAX_PATIENTS', 2000)
+    app.config.setdefault('RECENT_VITALS_REFRESH_SECONDS', 2)
+    app.config.setdefault('RECENT_VITALS_IDLE_MINUTES', 60)
+    app.config.setdefault('RECENT_VITALS_SWEEP_SECONDS', 60)
+    _config.update(
+        capacity=app.config['RECENT_VITALS_PER_PATIENT'],
+        max_patients=app.config['RECENT_VITALS_MAX_PATIENTS'],
+        refresh_seconds=app.config['RECENT_VITALS_REFRESH_SECONDS'],
+        idle_minutes=app.config['RECENT_VITALS_IDLE_MINUTES'],
+        sweep_seconds=app.config['RECENT_VITALS_SWEEP_SECONDS'],
+    )
+    with app.app_context():
+        try:
+            warm()
+        except Exception as e:
+            logging.error(f"Could not warm the recent vitals buffers: {str(e)}")
@@ -0,0 +1,148 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func
+from models import User, Program, Enrollment, Medication, LabReferenceRange
+from extension import db
+import counters
+import events
+
+# Read-mostly snapshot of the small reference tables (users, programs,
+# medications, lab reference ranges), held in each worker as compact records with dict indexes.
+# Any flush touching those tables (or enrollments, which feed the program
+# participant counts) bumps the refdata.version counter in the same
+# transaction. Readers compare it with the snapshot's version at most every
+# REFDATA_CHECK_SECONDS and reload the whole snapshot when it moved; this
+# process's own commits force the next read to check.
+
+VERSION_COUNTER = 'refdata.version'
+TRACKED_MODELS = (User, Program, Enrollment, Medication, LabReferenceRange)
+
+
+class UserRecord:
+    __slots__ = ('id', 'username', 'email', 'role', 'specialization', 'active', 'created_at')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+    # Enough of the Flask-Login user interface for load_user
+    @property
+    def is_active(self):
+        return bool(self.active)
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+
+class ProgramRecord:
+    __slots__ = ('id', 'name', 'description', 'code', 'participant_count')
+
+    def __init__(self, row, participant_count):
+        self.id = row.id
+        self.name = row.name
+        self.description = row.description
+        self.code = row.code
+        self.participant_count = participant_count
+
+
+class MedicationRecord:
+    __slots__ = ('id', 'name', 'quantity', 'low_stock_threshold', 'category')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+
+class LabRangeRecord:
+    __slots__ = ('id', 'test_name', 'unit', 'low', 'high', 'critical_low', 'critical_high')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+
+class Snapshot:
+    def __init__(self, version, users, programs, medications, lab_ranges):
+        self.version = version
+        self.users = users
+        self.users_by_id = {user.id: user for user in users}
+        self.users_by_username = {user.username: user for user in users}
+        self.users_by_role = {}
+        for user in users:
+            self.users_by_role.setdefault(user.role, []).append(user)
+        self.programs = programs
+        self.programs_by_id = {program.id: program for program in programs}
+        self.medications = medications
+        self.medications_by_id = {medication.id: medication for medication in medications}
+        self.lab_ranges = {lab_range.test_name: lab_range for lab_range in lab_ranges}
+
+    def first_user(self, role=None):
+        """The lowest-id user, optionally with `role`; what `.first()` used to return."""
+        users = self.users_by_role.get(role, ()) if role else self.users
+        return users[0] if users else None
+
+
+_snapshot = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _read_version():
+    return counters.read([VERSION_COUNTER])[VERSION_COUNTER]
+
+
+def _load(version):
+    users = [UserRecord(row) for row in db.session.query(
+        *[getattr(User, name) for name in UserRecord.__slots__]
+    ).order_by(User.id)]
+    participants = dict(db.session.query(Enrollment.program_id, func.count(Enrollment.patient_id.distinct()))
+                        .group_by(Enrollment.program_id))
+    programs = [ProgramRecord(row, participants.get(row.id, 0)) for row in db.session.query(
+        Program.id, Program.name, Program.description, Program.code
+    ).order_by(Program.id)]
+    medications = [MedicationRecord(row) for row in db.session.query(
+        *[getattr(Medication, name) for name in MedicationRecord.__slots__]
+    ).order_by(Medication.id)]
+    lab_ranges = [LabRangeRecord(row) for row in db.session.query(
+        *[getattr(LabReferenceRange, name) for name in LabRangeRecord.__slots__]
+    )]
+    return Snapshot(version, users, programs, medications, lab_ranges)
+
+
+def get():
+    """Return the current snapshot, reloading it if the version counter moved."""
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    snapshot = _snapshot
+    if snapshot is not None and now - _checked_at < current_app.config.get('REFDATA_CHECK_SECONDS', 1):
+        return snapshot
+    with _lock:
+        if _snapshot is not snapshot:
+            return _snapshot
+        version = _read_version()
+        if snapshot is None or snapshot.version != version:
+            snapshot = _snapshot = _load(version)
+        _checked_at = now
+    return snapshot
+
+
+@events.on_flush
+def _bump_version(session, changes):
+    if any(change.model in TRACKED_MODELS for change in changes):
+        counters.apply_deltas(session.connection(), {VERSION_COUNTER: 1})
+
+
+@events.on_commit
+def _expire(changes):
+    global _checked_at
+    if any(change.model in TRACKED_MODELS for change in changes):
+        _checked_at = 0.0
@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Patient, VitalRollup, VitalSign, parse_number
+from extension import db
+import events
+
+# Downsampled vitals for charting. Every patient has one vital_rollup row
+# per 1-minute, 1-hour and 1-day bucket holding count/sum/min/max of each
+# metric. Inserted readings are folded in with an upsert from the flush that
+# writes them; updates and deletes recompute the affected days from the raw
+# rows, since a minimum or maximum can't be un-applied. `flask rollups
+# rebuild` recomputes everything from vital_sign. The upsert needs
+# INSERT .. ON CONFLICT, so init_app refuses other databases up front rather
+# than failing every vital sign write.
+
+# Rollup column prefix -> VitalSign column
+METRICS = {
+    'hr': 'heart_rate',
+    'spo2': 'oxygen_saturation',
+    'temp': 'temperature',
+    'sbp': 'systolic',
+    'dbp': 'diastolic',
+}
+RESOLUTIONS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+DEFAULT_POINTS = 300
+UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == '1m':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == '1h':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(readings):
+    """Fold VitalSign value dicts into {(patient_id, resolution, bucket): rollup row}."""
+    buckets = {}
+    for reading in readings:
+        timestamp = reading.get('timestamp')
+        if timestamp is None:
+            continue
+        for resolution in RESOLUTIONS:
+            key = (reading['patient_id'], resolution, bucket_start(timestamp, resolution))
+            row = buckets.get(key)
+            if row is None:
+                row = buckets[key] = {'patient_id': key[0], 'resolution': resolution, 'bucket': key[2]}
+                for prefix in METRICS:
+                    row.update({f'{prefix}_count': 0, f'{prefix}_sum': None, f'{prefix}_min': None,
+                                f'{prefix}_max': None})
+            for prefix, column in METRICS.items():
+                value = parse_number(reading.get(column))
+                if value is None:
+                    continue
+                row[f'{prefix}_count'] += 1
+                row[f'{prefix}_sum'] = value if row[f'{prefix}_sum'] is None else row[f'{prefix}_sum'] + value
+                if row[f'{prefix}_min'] is None or value < row[f'{prefix}_min']:
+                    row[f'{prefix}_min'] = value
+                if row[f'{prefix}_max'] is None or value > row[f'{prefix}_max']:
+                    row[f'{prefix}_max'] = value
+    return buckets
+
+
+def _upsert(connection, rows):
+    if not rows:
+        return
+    statement = UPSERT_DIALECTS[connection.dialect.name](VitalRollup)
+    stored, incoming = VitalRollup.__table__.c, statement.excluded
+    merged = {}
+    for prefix in METRICS:
+        count, total, low, high = (f'{prefix}_{part}' for part in ('count', 'sum', 'min', 'max'))
+        merged[count] = stored[count] + incoming[count]
+        merged[total] = case((incoming[total].is_(None), stored[total]),
+                             (stored[total].is_(None), incoming[total]),
+                             else_=stored[total] + incoming[total])
+        merged[low] = case((incoming[low].is_(None), stored[low]),
+                           (stored[low].is_(None) | (incoming[low] < stored[low]), incoming[low]),
+                           else_=stored[low])
+        merged[high] = case((incoming[high].is_(None), stored[high]),
+                            (stored[high].is_(None) | (incoming[high] > stored[high]), incoming[high]),
+                            else_=stored[high])
+    connection.execute(
+        statement.on_conflict_do_update(index_elements=['patient_id', 'resolution', 'bucket'], set_=merged),
+        rows
+    )
+
+
+def _raw_readings(connection, conditions):
+    columns = [VitalSign.patient_id, VitalSign.timestamp] + [getattr(VitalSign, column) for column in METRICS.values()]
+    return (dict(row._mapping) for row in connection.execute(
+        select(*columns).where(*conditions).execution_options(yield_per=10000)
+    ))
+
+
+def _recompute_days(connection, days):
+    """Rebuild the rollups of the given (patient_id, day) pairs from the raw rows."""
+    for patient_id, day in days:
+        end = day + timedelta(days=1)
+        connection.execute(delete(VitalRollup).where(
+            VitalRollup.patient_id == patient_id, VitalRollup.bucket >= day, VitalRollup.bucket < end
+        ))
+        readings = _raw_readings(connection, [
+            VitalSign.patient_id == patient_id, VitalSign.timestamp >= day, VitalSign.timestamp < end
+        ])
+        _upsert(connection, list(aggregate(readings).values()))
+
+
+@events.on_flush
+def _track_changes(session, changes):
+    inserted = []
+    stale_days = set()
+    for change in changes:
+        if change.model is not VitalSign:
+            continue
+        if change.action == 'insert':
+            inserted.append(change.values)
+            continue
+        for values in (change.values, dict(change.values, **change.previous)):
+            if values.get('timestamp') is not None:
+                stale_days.add((values['patient_id'], bucket_start(values['timestamp'], '1d')))
+    if not (inserted or stale_days):
+        return
+    connection = session.connection()
+    if inserted:
+        _upsert(connection, list(aggregate(inserted).values()))
+    if stale_days:
+        _recompute_days(connection, sorted(stale_days))
+
+
+def rebuild(patient_id=None, chunk_size=50000):
+    """Recompute rollups from vital_sign, for one patient or everyone; return the number of readings."""
+    conditions = [VitalSign.patient_id == patient_id] if patient_id else []
+    with db.engine.begin() as connection:
+        connection.execute(delete(VitalRollup).where(*(
+            [VitalRollup.patient_id == patient_id] if patient_id else []
+        )))
+        # A bucket split across chunks is merged by the upsert
+        readings = _raw_readings(connection, conditions)
+        total = 0
+        chunk = []
+        for reading in readings:
+            chunk.append(reading)
+            if len(chunk) >= chunk_size:
+                _upsert(connection, list(aggregate(chunk).values()))
+                total += len(chunk)
+                chunk = []
+        _upsert(connection, list(aggregate(chunk).values()))
+        total += len(chunk)
+    return total
+
+
+def pick_resolution(start, end, points):
+    """The finest resolution that returns at most `points` buckets for the range."""
+    span = end - start
+    for resolution, width in RESOLUTIONS.items():
+        if span / width <= points:
+            return resolution
+    return '1d'
+
+
+def series(patient_id, start, end, points=DEFAULT_POINTS, resolution=None, metrics=None):
+    """At most `points` buckets from `start`; `truncated` is set if an explicit resolution needed more."""
+    resolution = resolution or pick_resolution(start, end, points)
+    metrics = metrics or list(METRICS)
+    rows = VitalRollup.query.filter(
+        VitalRollup.patient_id == patient_id,
+        VitalRollup.resolution == resolution,
+        VitalRollup.bucket >= bucket_start(start, resolution),
+        VitalRollup.bucket <= end
+    ).order_by(VitalRollup.bucket).limit(points + 1).all()
+    truncated = len(rows) > points
+    rows = rows[:points]
+
+    result = {'resolution': resolution, 'truncated': truncated, 'buckets': [row.bucket.isoformat() for row in rows]}
+    for prefix in metrics:
+        counts = [getattr(row, f'{prefix}_count') for row in rows]
+        sums = [getattr(row, f'{prefix}_sum') for row in rows]
+        result[prefix] = {
+            'count': counts,
+            'avg': [round(total / count, 2) if count else None for total, count in zip(sums, counts)],
+            'min': [getattr(row, f'{prefix}_min') for row in rows],
+            'max': [getattr(row, f'{prefix}_max') for row in rows],
+        }
+    return result
+
+
+def init_app(app):
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        raise RuntimeError(f"Vital rollups need INSERT .. ON CONFLICT, not available on {dialect}")
+
+
+# CLI commands
+cli = AppGroup('rollups', help='Maintain the downsampled vitals rollups.')
+
+
+@cli.command('rebuild')
+@click.option('--patient', 'patient_code', help='Only rebuild this patient (e.g. PT-1001).')
+def rebuild_command(patient_code):
+    """Recompute vital sign rollups from the raw readings."""
+    patient_id = None
+    if patient_code:
+        patient = Patient.query.filter_by(patient_id=patient_code).first()
+        if patient is None:
+            raise click.ClickException(f"Patient not found: {patient_code}")
+        patient_id = patient.id
+    started = datetime.now()
+    total = rebuild(patient_id)
+    click.echo(f"Rolled up {total} readings in {(datetime.now() - started).total_seconds():.1f}s")
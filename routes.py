@@ -1,12 +1,33 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for, abort
+import csv
 from datetime import datetime, date, timedelta
-from sqlalchemy import func, and_, or_, desc, extract
+from sqlalchemy import func, and_, or_, desc, extract, case
+from sqlalchemy.orm import joinedload, load_only
 from models import (
     User, Patient, Appointment, Prescription, LabResult, 
     MedicalRecord, VitalSign, Notification, 
-    Program, Enrollment, Medication, PendingAction, AuditLog
+    Program, Enrollment, Medication, PendingAction, AuditLog, calculate_age, lab_test_key
 )
 from extension import db
+from cache import cached
+from streaming import stream_mode, stream_response
+import cache
+import counters
+import early_warning
+import identifiers
+import labs
+import live
+import outbox
+import patient_chart
+import patient_import
+import recent_vitals
+import refdata
+import rollups
+import scheduling
+import search_index
+import typeahead
+import vital_alerts
+import vitals_ingest
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -73,34 +94,32 @@ def logout():
 
 # Dashboard routes
 @api.route('/dashboard/stats')
+@cached(ttl=5, depends_on=(Patient, Appointment, Prescription, LabResult, VitalSign))
 def dashboard_stats():
-    total_patients = Patient.query.count()
-    todays_appointments = Appointment.query.filter(
-        Appointment.date == date.today(),
-        Appointment.status == 'scheduled'
-    ).count()
-    
-    pending_prescriptions = Prescription.query.filter_by(status='pending').count()
-    critical_labs = LabResult.query.filter_by(critical_flag=True, acknowledged=False).count()
-    
-    avg_heart_rate = db.session.query(func.avg(VitalSign.heart_rate)).scalar() or 72
-    avg_oxygen = db.session.query(func.avg(VitalSign.oxygen_saturation)).scalar() or 98
-    
-    icu_count = Patient.query.filter_by(in_icu=True).count()
-    ventilator_count = Patient.query.filter_by(on_ventilator=True).count()
-    
-    telemedicine_ready = Patient.query.filter_by(telemedicine_ready=True).count()
-    telemedicine_appointments = Appointment.query.filter_by(
-        telemedicine=True,
-        date=date.today()
-    ).count()
+    today = date.today()
+    names = [
+        'patients.total', 'patients.in_icu', 'patients.on_ventilator',
+        'patients.telemedicine_ready', 'patients.isolation',
+        'prescriptions.pending', 'labs.critical_unacknowledged',
+        'vitals.heart_rate.sum', 'vitals.heart_rate.count',
+        'vitals.oxygen.sum', 'vitals.oxygen.count',
+        counters.day_key('appointments.scheduled', today),
+        counters.day_key('appointments.telemedicine', today),
+        counters.day_key('appointments.telemedicine_completed', today),
+    ]
+    stats = counters.read(names)
+    
+    heart_rate_count = stats['vitals.heart_rate.count']
+    oxygen_count = stats['vitals.oxygen.count']
+    avg_heart_rate = (stats['vitals.heart_rate.sum'] / heart_rate_count if heart_rate_count else 0) or 72
+    avg_oxygen = (stats['vitals.oxygen.sum'] / oxygen_count if oxygen_count else 0) or 98
     
     return jsonify({
         'patient_stats': {
-            'total': total_patients,
-            'todays_appointments': todays_appointments,
-            'pending_prescriptions': pending_prescriptions,
-            'critical_labs': critical_labs
+            'total': int(stats['patients.total']),
+            'todays_appointments': int(stats[counters.day_key('appointments.scheduled', today)]),
+            'pending_prescriptions': int(stats['prescriptions.pending']),
+            'critical_labs': int(stats['labs.critical_unacknowledged'])
         },
         'health_metrics': {
             'heart_rate': round(avg_heart_rate),
@@ -109,91 +128,250 @@ def dashboard_stats():
             'bmi': 24.2
         },
         'resource_status': {
-            'icu': {'occupied': icu_count, 'total': 15},
-            'ventilators': {'in_use': ventilator_count, 'total': 12},
-            'isolation_beds': {'occupied': Patient.query.filter(Patient.isolation_status.isnot(None)).count(), 'total': 10}
+            'icu': {'occupied': int(stats['patients.in_icu']), 'total': 15},
+            'ventilators': {'in_use': int(stats['patients.on_ventilator']), 'total': 12},
+            'isolation_beds': {'occupied': int(stats['patients.isolation']), 'total': 10}
         },
         'telemedicine': {
-            'eligible': telemedicine_ready,
-            'scheduled': telemedicine_appointments,
-            'completed': Appointment.query.filter_by(
-                telemedicine=True,
-                status='completed',
-                date=date.today()
-            ).count()
+            'eligible': int(stats['patients.telemedicine_ready']),
+            'scheduled': int(stats[counters.day_key('appointments.telemedicine', today)]),
+            'completed': int(stats[counters.day_key('appointments.telemedicine_completed', today)])
         }
     })
 
+@api.route('/dashboard/early_warning')
+def dashboard_early_warning():
+    risk = request.args.get('risk')
+    if risk and risk not in early_warning.RISK_LEVELS:
+        return jsonify({'success': False, 'message': f"risk must be one of {', '.join(early_warning.RISK_LEVELS)}"}), 400
+    min_score = request.args.get('min_score', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    
+    result = early_warning.get()
+    patients = [
+        patient for patient in result['patients']
+        if patient['score'] >= min_score and (not risk or patient['risk'] == risk)
+    ]
+    return jsonify({
+        'computed_at': result['computed_at'],
+        'summary': result['summary'],
+        'patients': patients[:limit] if limit else patients
+    })
+
 @api.route('/dashboard/appointments')
+@cached(ttl=10, depends_on=(Appointment, Patient, User))
 def dashboard_appointments():
-    appointments = Appointment.query.filter(
+    appointments = Appointment.query.options(*_appointment_listing_options()).filter(
         Appointment.date == date.today()
     ).order_by(Appointment.start_time).all()
     
-    result = []
-    for appt in appointments:
-        result.append({
-            'id': f"A{appt.id:04d}",
-            'time': appt.start_time.strftime('%H:%M'),
-            'patient': appt.patient.name,
-            'doctor': appt.doctor.username,
-            'status': appt.status,
-            'duration': int((appt.end_time.hour * 60 + appt.end_time.minute) - 
-                           (appt.start_time.hour * 60 + appt.start_time.minute)) if appt.end_time else 30,
-            'reason': appt.reason or 'Checkup',
-            'notes': appt.notes or ''
-        })
-    
-    return jsonify(result)
+    return jsonify([_serialize_appointment(appt) for appt in appointments])
+
+def _appointment_listing_options():
+    # Load the patient and doctor names in the same SELECT as the appointments
+    return (
+        load_only(
+            Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.date,
+            Appointment.start_time, Appointment.end_time, Appointment.status,
+            Appointment.reason, Appointment.notes
+        ),
+        joinedload(Appointment.patient, innerjoin=True).load_only(Patient.first_name, Patient.last_name),
+        joinedload(Appointment.doctor, innerjoin=True).load_only(User.username),
+    )
+
+def _serialize_appointment(appt):
+    return {
+        'id': f"A{appt.id:04d}",
+        'time': appt.start_time.strftime('%H:%M'),
+        'patient': appt.patient.name,
+        'doctor': appt.doctor.username,
+        'status': appt.status,
+        'duration': int((appt.end_time.hour * 60 + appt.end_time.minute) - 
+                       (appt.start_time.hour * 60 + appt.start_time.minute)) if appt.end_time else 30,
+        'reason': appt.reason or 'Checkup',
+        'notes': appt.notes or ''
+    }
 
 @api.route('/dashboard/doctors')
+@cached(ttl=30, depends_on=(User, Appointment))
 def dashboard_doctors():
-    doctors = User.query.filter_by(role='doctor', active=True).all()
+    specialty = request.args.get('specialty')
     
-    result = []
-    for doctor in doctors:
-        patient_count = Appointment.query.filter_by(doctor_id=doctor.id).distinct(Appointment.patient_id).count()
-        
-        result.append({
-            'id': doctor.id,
-            'name': f"Dr. {doctor.username}",
-            'specialty': doctor.specialization or 'General Medicine',
-            'patients': patient_count,
-            'rating': 4.8
-        })
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format, expected YYYY-MM-DD'}), 400
+    
+    # Patient counts and utilization cover the same window. A missing bound
+    # runs to or from today; with no window, patients are counted over all
+    # time and utilization is today's.
+    today = date.today()
+    util_start = start or (min(end, today) if end else today)
+    util_end = end or (max(start, today) if start else today)
+    if util_end < util_start:
+        return jsonify({'success': False, 'message': 'end must not be before start'}), 400
+    window = [Appointment.date.between(util_start, util_end)] if start or end else []
+    
+    booked = case(
+        (and_(
+            Appointment.date.between(util_start, util_end),
+            Appointment.status.notin_(('cancelled', 'no-show'))
+        ), _appointment_minutes()),
+        else_=0
+    )
     
-    return jsonify(result)
+    query = db.session.query(
+        User.id,
+        User.username,
+        User.specialization,
+        func.count(func.distinct(Appointment.patient_id)).label('patients'),
+        func.coalesce(func.sum(booked), 0).label('booked_minutes')
+    ).outerjoin(
+        Appointment, and_(Appointment.doctor_id == User.id, *window)
+    ).filter(
+        User.role == 'doctor',
+        User.active == True
+    )
+    
+    if specialty:
+        query = query.filter(
+            func.lower(func.coalesce(User.specialization, 'General Medicine')) == specialty.lower()
+        )
+    
+    rows = query.group_by(User.id, User.username, User.specialization).order_by(User.id).all()
+    
+    days = (util_end - util_start).days + 1
+    scheduled_minutes = days * current_app.config.get('DOCTOR_SCHEDULED_HOURS_PER_DAY', 8) * 60
+    
+    return jsonify([{
+        'id': row.id,
+        'name': f"Dr. {row.username}",
+        'specialty': row.specialization or 'General Medicine',
+        'patients': row.patients,
+        'rating': 4.8,
+        'booked_minutes': round(row.booked_minutes),
+        'scheduled_minutes': scheduled_minutes,
+        'utilization': round(row.booked_minutes / scheduled_minutes, 3) if scheduled_minutes else None
+    } for row in rows])
+
+def _appointment_minutes():
+    # Appointment length in minutes, 30 when no end time was recorded
+    if db.engine.dialect.name == 'sqlite':
+        minutes = (func.julianday(Appointment.end_time) - func.julianday(Appointment.start_time)) * 1440
+    else:
+        minutes = extract('epoch', Appointment.end_time - Appointment.start_time) / 60
+    return func.coalesce(minutes, 30)
 
 # Patient routes
+PATIENTS_PAGE_SIZE = 100
+PATIENTS_MAX_PAGE_SIZE = 1000
+
+# Response field -> (columns it needs, formatter for a result row)
+PATIENT_FIELDS = {
+    'id': ((Patient.patient_id,), lambda row: row.patient_id),
+    'first_name': ((Patient.first_name,), lambda row: row.first_name),
+    'last_name': ((Patient.last_name,), lambda row: row.last_name),
+    'name': ((Patient.first_name, Patient.last_name), lambda row: f"{row.first_name} {row.last_name}"),
+    'email': ((Patient.email,), lambda row: row.email),
+    'phone': ((Patient.phone,), lambda row: row.phone),
+    'date_of_birth': ((Patient.date_of_birth,),
+                      lambda row: row.date_of_birth.isoformat() if row.date_of_birth else None),
+    'age': ((Patient.date_of_birth,), lambda row: calculate_age(row.date_of_birth)),
+    'gender': ((Patient.gender,), lambda row: row.gender),
+    'blood_type': ((Patient.blood_type,), lambda row: row.blood_type),
+    'allergies': ((Patient.allergies,), lambda row: row.allergies),
+    'current_medications': ((Patient.current_medications,), lambda row: row.current_medications),
+    'insurance_provider': ((Patient.insurance_provider,), lambda row: row.insurance_provider),
+    'policy_number': ((Patient.policy_number,), lambda row: row.policy_number),
+    'emergency_contact': ((Patient.emergency_contact,), lambda row: row.emergency_contact),
+    'in_icu': ((Patient.in_icu,), lambda row: row.in_icu),
+    'on_ventilator': ((Patient.on_ventilator,), lambda row: row.on_ventilator),
+    'isolation_status': ((Patient.isolation_status,), lambda row: row.isolation_status),
+    'telemedicine_ready': ((Patient.telemedicine_ready,), lambda row: row.telemedicine_ready),
+    'is_active': ((Patient.is_active,), lambda row: row.is_active),
+    'registered': ((Patient.created_at,),
+                   lambda row: row.created_at.strftime('%b %d, %Y') if row.created_at else None),
+}
+
+def _parse_bool(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+def _patient_list_query():
+    """Build the projected, filtered patient query from the request args.
+
+    Returns (query, fields); raises ValueError for invalid arguments.
+    """
+    requested = request.args.get('fields')
+    fields = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(PATIENT_FIELDS)
+    unknown = [name for name in fields if name not in PATIENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    columns = []
+    for name in fields:
+        for column in PATIENT_FIELDS[name][0]:
+            if column not in columns:
+                columns.append(column)
+    
+    query = db.session.query(Patient.id, *columns)
+    
+    if 'is_active' in request.args:
+        query = query.filter(Patient.is_active == _parse_bool(request.args['is_active']))
+    if 'in_icu' in request.args:
+        query = query.filter(Patient.in_icu == _parse_bool(request.args['in_icu']))
+    isolation_status = request.args.get('isolation_status')
+    if isolation_status == 'any':
+        query = query.filter(Patient.isolation_status.isnot(None))
+    elif isolation_status == 'none':
+        query = query.filter(Patient.isolation_status.is_(None))
+    elif isolation_status:
+        query = query.filter(Patient.isolation_status == isolation_status)
+    
+    return query, fields
+
 @api.route('/patients', methods=['GET'])
 def get_all_patients():
     try:
-        patients = Patient.query.all()
-        return jsonify([
-            {
-                'id': patient.patient_id,
-                'first_name': patient.first_name,
-                'last_name': patient.last_name,
-                'name': f"{patient.first_name} {patient.last_name}",
-                'email': patient.email,
-                'phone': patient.phone,
-                'date_of_birth': patient.date_of_birth.isoformat(),
-                'age': patient.age,
-                'gender': patient.gender,
-                'blood_type': patient.blood_type,
-                'allergies': patient.allergies,
-                'current_medications': patient.current_medications,
-                'insurance_provider': patient.insurance_provider,
-                'policy_number': patient.policy_number,
-                'emergency_contact': patient.emergency_contact,
-                'in_icu': patient.in_icu,
-                'on_ventilator': patient.on_ventilator,
-                'isolation_status': patient.isolation_status,
-                'telemedicine_ready': patient.telemedicine_ready,
-                'is_active': patient.is_active,
-                'registered': patient.created_at.strftime('%b %d, %Y') if patient.created_at else None
-            } for patient in patients
-        ])
+        query, fields = _patient_list_query()
+        limit = min(int(request.args.get('limit', PATIENTS_PAGE_SIZE)), PATIENTS_MAX_PAGE_SIZE)
+        after = int(request.args['after']) if request.args.get('after') else None
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        # Keyset pagination: seek past the last id of the previous page so
+        # every page is an index range scan of the same size.
+        if after is not None:
+            query = query.filter(Patient.id > after)
+        query = query.order_by(Patient.id)
+        
+        formatters = [(name, PATIENT_FIELDS[name][1]) for name in fields]
+        serialize = lambda row: {name: format_value(row) for name, format_value in formatters}
+        
+        mode = stream_mode()
+        if mode:
+            # Streams return every matching row unless a limit is given
+            if 'limit' in request.args:
+                query = query.limit(limit)
+            return stream_response(query, serialize, mode)
+        
+        # Without limit or after, return the whole list as before
+        if 'limit' not in request.args and after is None:
+            return jsonify([serialize(row) for row in query.all()])
+        
+        rows = query.limit(limit + 1).all()
+        response = jsonify([serialize(row) for row in rows[:limit]])
+        
+        if len(rows) > limit:
+            next_cursor = rows[limit - 1].id
+            args = request.args.to_dict()
+            args['after'] = next_cursor
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+            response.headers['Link'] = f'<{url_for(".get_all_patients", _external=True, **args)}>; rel="next"'
+        return response
     except Exception as e:
         logging.error(f"Error fetching patients: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to fetch patients'}), 500
@@ -220,8 +398,7 @@ def add_patient():
 
         dob = datetime.strptime(date_of_birth, '%Y-%m-%d').date()
 
-        last_patient = Patient.query.order_by(desc(Patient.id)).first()
-        new_id = f"PT-{1000 + (last_patient.id if last_patient else 0)}"
+        new_id = identifiers.next_patient_id()
 
         patient = Patient(
             first_name=first_name,
@@ -266,29 +443,65 @@ def add_patient():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@api.route('/patients/import', methods=['POST'])
+def import_patients():
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        fmt = request.args.get('format') or patient_import.detect_format(upload.mimetype, upload.filename)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or patient_import.detect_format(request.mimetype)
+    
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'Send CSV or NDJSON, or pass ?format=csv|ndjson'}), 400
+    
+    try:
+        batch_size = min(int(request.args.get('batch_size', patient_import.IMPORT_BATCH_SIZE)), 10000)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid batch_size'}), 400
+    
+    try:
+        report = patient_import.import_patients(patient_import.read_rows(stream, fmt), max(batch_size, 1))
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Could not read upload: {str(e)}'}), 400
+    
+    logging.info(f"Patient import: {report['imported']} imported, {report['failed']} failed")
+    return jsonify({'success': report['failed'] == 0, **report})
+
+
 @api.route('/patients/<patient_id>')
 def get_patient(patient_id):
-    patient = Patient.query.filter_by(patient_id=patient_id).first_or_404()
-    
-    records = MedicalRecord.query.filter_by(patient_id=patient.id).all()
-    conditions = list(set([record.diagnosis for record in records]))
+    try:
+        limits = {
+            section: max(min(int(request.args.get(f'{section}_limit', default)), patient_chart.MAX_LIMIT), 1)
+            for section, default in patient_chart.DEFAULT_LIMITS.items()
+        }
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Section limits must be integers'}), 400
     
-    appointments = Appointment.query.filter_by(patient_id=patient.id).order_by(
-        desc(Appointment.date)
-    ).all()
+    header = patient_chart.load_header(patient_id)
+    if header is None:
+        abort(404)
+    patient, section_counts, fingerprint = header
     
-    prescriptions = Prescription.query.filter_by(patient_id=patient.id).all()
+    etag = patient_chart.etag(fingerprint, limits)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
     
-    lab_results = LabResult.query.filter_by(patient_id=patient.id).all()
+    sections = patient_chart.load_sections(patient, limits)
     
-    return jsonify({
+    response = jsonify({
         'id': patient.patient_id,
         'first_name': patient.first_name,
         'last_name': patient.last_name,
         'name': f"{patient.first_name} {patient.last_name}",
         'email': patient.email,
         'phone': patient.phone,
-        'date_of_birth': patient.date_of_birth.isoformat(),
+        'date_of_birth': patient.date_of_birth.isoformat() if patient.date_of_birth else None,
         'age': patient.age,
         'gender': patient.gender,
         'blood_type': patient.blood_type,
@@ -298,7 +511,7 @@ def get_patient(patient_id):
         'policy_number': patient.policy_number,
         'emergency_contact': patient.emergency_contact,
         'registered': patient.created_at.strftime('%b %d, %Y') if patient.created_at else None,
-        'conditions': conditions,
+        'conditions': sections['conditions'],
         'appointments': [{
             'id': appt.id,
             'date': appt.date.isoformat(),
@@ -306,7 +519,7 @@ def get_patient(patient_id):
             'doctor': appt.doctor.username,
             'status': appt.status,
             'reason': appt.reason
-        } for appt in appointments],
+        } for appt in sections['appointments']],
         'prescriptions': [{
             'id': rx.id,
             'medication_name': rx.medication_name,
@@ -314,15 +527,18 @@ def get_patient(patient_id):
             'start_date': rx.start_date.isoformat() if rx.start_date else None,
             'end_date': rx.end_date.isoformat() if rx.end_date else None,
             'status': rx.status
-        } for rx in prescriptions],
+        } for rx in sections['prescriptions']],
         'lab_results': [{
             'id': lab.id,
             'test_name': lab.test_name,
             'result_value': lab.result_value,
             'date': lab.date.isoformat() if lab.date else None,
             'critical_flag': lab.critical_flag
-        } for lab in lab_results]
+        } for lab in sections['lab_results']],
+        'section_counts': section_counts
     })
+    response.set_etag(etag)
+    return response
 
 # Appointment routes
 @api.route('/appointments')
@@ -330,7 +546,7 @@ def get_appointments():
     status_filter = request.args.get('status', 'all')
     date_filter = request.args.get('date', 'today')
     
-    query = Appointment.query
+    query = Appointment.query.options(*_appointment_listing_options())
     
     if status_filter != 'all':
         query = query.filter_by(status=status_filter)
@@ -342,21 +558,7 @@ def get_appointments():
     
     appointments = query.order_by(Appointment.date, Appointment.start_time).all()
     
-    result = []
-    for appt in appointments:
-        result.append({
-            'id': f"A{appt.id:04d}",
-            'time': appt.start_time.strftime('%H:%M'),
-            'patient': appt.patient.name,
-            'doctor': appt.doctor.username,
-            'status': appt.status,
-            'duration': int((appt.end_time.hour * 60 + appt.end_time.minute) - 
-                           (appt.start_time.hour * 60 + appt.start_time.minute)) if appt.end_time else 30,
-            'reason': appt.reason or 'Checkup',
-            'notes': appt.notes or ''
-        })
-    
-    return jsonify(result)
+    return jsonify([_serialize_appointment(appt) for appt in appointments])
 
 @api.route('/appointments', methods=['POST'])
 def create_appointment():
@@ -371,20 +573,39 @@ def create_appointment():
     if not patient:
         return jsonify({'success': False, 'message': 'Patient not found'}), 404
     
-    appointment_date = datetime.strptime(data.get('date'), '%Y-%m-%d').date()
-    start_time = datetime.strptime(data.get('time'), '%H:%M').time()
+    try:
+        appointment_date = datetime.strptime(data.get('date') or '', '%Y-%m-%d').date()
+        start_time = datetime.strptime(data.get('time') or '', '%H:%M').time()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date or time, expected YYYY-MM-DD and HH:MM'}), 400
     
     duration = data.get('duration', 30)
     end_time = (datetime.combine(date.today(), start_time) + timedelta(minutes=duration)).time()
-    
-    # Use a default doctor since we don't have authentication
-    default_doctor = User.query.filter_by(role='doctor').first()
-    if not default_doctor:
-        return jsonify({'success': False, 'message': 'No doctor available'}), 404
+    start, end = scheduling.to_minutes(start_time), scheduling.to_minutes(start_time) + duration
+    
+    error = scheduling.outside_hours(start, end)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    if data.get('doctor_id'):
+        doctor = next(iter(scheduling.doctors(doctor_id=data['doctor_id'])), None)
+        if not doctor:
+            return jsonify({'success': False, 'message': 'Doctor not found'}), 404
+        conflict = scheduling.find_conflict(doctor.id, appointment_date, start, end)
+        if conflict:
+            return jsonify({
+                'success': False,
+                'message': f'Dr. {doctor.username} is already booked at that time',
+                'conflicting_appointment_id': conflict
+            }), 409
+    else:
+        doctor = scheduling.assign_doctor(appointment_date, start, end, data.get('specialty'))
+        if not doctor:
+            return jsonify({'success': False, 'message': 'No doctor available at that time'}), 409
     
     appointment = Appointment(
         patient_id=patient.id,
-        doctor_id=default_doctor.id,
+        doctor_id=doctor.id,
         date=appointment_date,
         start_time=start_time,
         end_time=end_time,
@@ -396,20 +617,71 @@ def create_appointment():
     
     try:
         db.session.add(appointment)
-        db.session.commit()
-        
-        notification = Notification(
-            patient_id=patient.id,
-            message=f"New appointment scheduled with Dr. {default_doctor.username} on {appointment_date} at {start_time}",
-            notification_type='appointment'
+        outbox.notify(
+            f"New appointment scheduled with Dr. {doctor.username} on {appointment_date} at {start_time}",
+            'appointment', patient_id=patient.id
         )
-        db.session.add(notification)
         db.session.commit()
         
-        return jsonify({'success': True, 'appointment_id': appointment.id})
+        return jsonify({'success': True, 'appointment_id': appointment.id, 'doctor_id': doctor.id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# Fields a batch request can set once for all of its items
+BATCH_SHARED_FIELDS = ('patient_id', 'doctor_id', 'specialty', 'duration', 'reason', 'notes', 'telemedicine', 'status')
+
+@api.route('/appointments/batch', methods=['POST'])
+def create_appointments_batch():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+    shared = {field: data[field] for field in BATCH_SHARED_FIELDS if field in data}
+    
+    try:
+        if data.get('recurrence'):
+            items = scheduling.expand_recurrence(dict(data['recurrence']))
+        else:
+            items = data.get('items') or []
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if not isinstance(items, list):
+        return jsonify({'success': False, 'message': 'items must be a list'}), 400
+    if not items:
+        return jsonify({'success': False, 'message': 'Provide items or a recurrence rule'}), 400
+    if len(items) > scheduling.MAX_BATCH_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'A batch is limited to {scheduling.MAX_BATCH_SIZE} appointments'
+        }), 400
+    
+    results, planned = scheduling.plan_batch([
+        dict(shared, **item) if isinstance(item, dict) else item for item in items
+    ])
+    failed = len(results) - len(planned)
+    # By default the batch is all or nothing; atomic=false books the valid items
+    if not planned or (failed and data.get('atomic', True)):
+        conflict = any(result['status'] == 'conflict' for result in results)
+        return jsonify({'success': False, 'created': 0, 'failed': failed, 'results': results}), 409 if conflict else 400
+    
+    appointments = [Appointment(**values) for _, values, _ in planned]
+    try:
+        db.session.add_all(appointments)
+        for appointment, (_, _, doctor) in zip(appointments, planned):
+            outbox.notify(
+                f"New appointment scheduled with Dr. {doctor.username} on {appointment.date} at {appointment.start_time}",
+                'appointment', patient_id=appointment.patient_id
+            )
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
+        logging.error(f"Batch appointment creation failed: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
+    
+    for appointment, (index, _, _) in zip(appointments, planned):
+        results[index].update(status='created', appointment_id=appointment.id)
+    
+    return jsonify({'success': failed == 0, 'created': len(planned), 'failed': failed, 'results': results})
 
 @api.route('/appointments/<int:appointment_id>', methods=['PUT'])
 def update_appointment(appointment_id):
@@ -428,6 +700,30 @@ def update_appointment(appointment_id):
             duration = data.get('duration', 30)
             appointment.end_time = (datetime.combine(date.today(), appointment.start_time) + 
                                  timedelta(minutes=duration)).time()
+        if data.get('doctor_id'):
+            doctor = next(iter(scheduling.doctors(doctor_id=data['doctor_id'])), None)
+            if not doctor:
+                db.session.rollback()
+                return jsonify({'success': False, 'message': 'Doctor not found'}), 404
+            appointment.doctor_id = doctor.id
+        
+        # Re-check the slot when the appointment moves or is reactivated
+        if appointment.status not in scheduling.INACTIVE_STATUSES and {'date', 'time', 'doctor_id', 'status'} & set(data):
+            start = scheduling.to_minutes(appointment.start_time)
+            end = scheduling.to_minutes(appointment.end_time) if appointment.end_time else start + scheduling.DEFAULT_DURATION
+            error = scheduling.outside_hours(start, end) if 'time' in data else None
+            if error:
+                db.session.rollback()
+                return jsonify({'success': False, 'message': error}), 400
+            conflict = scheduling.find_conflict(appointment.doctor_id, appointment.date, start, end,
+                                                ignore=appointment.id)
+            if conflict:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': 'The doctor is already booked at that time',
+                    'conflicting_appointment_id': conflict
+                }), 409
         
         db.session.commit()
         
@@ -449,31 +745,60 @@ def delete_appointment(appointment_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+FREE_SLOTS_MAX_DAYS = 31
+
+@api.route('/schedule/free_slots')
+def schedule_free_slots():
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else date.today()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else start
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format, expected YYYY-MM-DD'}), 400
+    if end < start:
+        return jsonify({'success': False, 'message': 'end must not be before start'}), 400
+    if (end - start).days >= FREE_SLOTS_MAX_DAYS:
+        return jsonify({'success': False, 'message': f'Range is limited to {FREE_SLOTS_MAX_DAYS} days'}), 400
+    
+    duration = request.args.get('duration', 30, type=int)
+    if duration <= 0:
+        return jsonify({'success': False, 'message': 'duration must be positive'}), 400
+    
+    candidates = scheduling.doctors(request.args.get('specialty'), request.args.get('doctor_id', type=int))
+    return jsonify(scheduling.free_slots(candidates, start, end, duration))
+
 # Prescription routes
 @api.route('/prescriptions')
 def get_prescriptions():
     patient_id = request.args.get('patient_id')
     
+    query = Prescription.query.options(
+        joinedload(Prescription.patient).load_only(Patient.patient_id, Patient.first_name, Patient.last_name),
+        joinedload(Prescription.prescribing_doctor).load_only(User.username)
+    )
     if patient_id:
-        prescriptions = Prescription.query.filter_by(patient_id=patient_id).all()
-    else:
-        prescriptions = Prescription.query.all()
+        query = query.filter_by(patient_id=patient_id)
+    query = query.order_by(Prescription.id)
     
-    result = []
-    for rx in prescriptions:
-        result.append({
-            'id': rx.id,
-            'patient_id': rx.patient.patient_id,
-            'patient_name': rx.patient.name,
-            'medication_name': rx.medication_name,
-            'dosage': rx.dosage,
-            'start_date': rx.start_date.isoformat() if rx.start_date else None,
-            'end_date': rx.end_date.isoformat() if rx.end_date else None,
-            'status': rx.status,
-            'prescribing_doctor': rx.prescribing_doctor
-        })
+    mode = stream_mode()
+    if mode:
+        return stream_response(query, _serialize_prescription, mode)
     
-    return jsonify(result)
+    return jsonify([_serialize_prescription(rx) for rx in query.all()])
+
+def _serialize_prescription(rx):
+    return {
+        'id': rx.id,
+        'patient_id': rx.patient.patient_id,
+        'patient_name': rx.patient.name,
+        'medication_name': rx.medication_name,
+        'dosage': rx.dosage,
+        'start_date': rx.start_date.isoformat() if rx.start_date else None,
+        'end_date': rx.end_date.isoformat() if rx.end_date else None,
+        'status': rx.status,
+        'prescribing_doctor': rx.prescribing_doctor_name or (
+            rx.prescribing_doctor.username if rx.prescribing_doctor else None
+        )
+    }
 
 @api.route('/prescriptions', methods=['POST'])
 def create_prescription():
@@ -487,7 +812,7 @@ def create_prescription():
     end_date = datetime.strptime(data.get('end_date'), '%Y-%m-%d').date() if data.get('end_date') else None
     
     # Use a default doctor since we don't have authentication
-    default_doctor = User.query.filter_by(role='doctor').first()
+    default_doctor = refdata.get().first_user('doctor')
     if not default_doctor:
         return jsonify({'success': False, 'message': 'No doctor available'}), 404
     
@@ -497,21 +822,15 @@ def create_prescription():
         dosage=data.get('dosage'),
         start_date=start_date,
         end_date=end_date,
-        prescribing_doctor=default_doctor.username,
+        prescribing_doctor_id=default_doctor.id,
+        prescribing_doctor_name=f"Dr. {default_doctor.username}",
         notes=data.get('notes', ''),
         status=data.get('status', 'active')
     )
     
     try:
         db.session.add(prescription)
-        db.session.commit()
-        
-        notification = Notification(
-            patient_id=patient.id,
-            message=f"New prescription for {data.get('medication_name')}",
-            notification_type='prescription'
-        )
-        db.session.add(notification)
+        outbox.notify(f"New prescription for {data.get('medication_name')}", 'prescription', patient_id=patient.id)
         db.session.commit()
         
         return jsonify({'success': True})
@@ -543,33 +862,110 @@ def update_prescription(prescription_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Lab results routes
+LAB_RESULTS_PAGE_SIZE = 100
+LAB_RESULTS_MAX_PAGE_SIZE = 1000
+
 @api.route('/labresults')
 def get_lab_results():
-    patient_id = request.args.get('patient_id')
-    critical_only = request.args.get('critical', False)
-    
-    query = LabResult.query
-    
-    if patient_id:
-        patient = Patient.query.filter_by(patient_id=patient_id).first()
-        if patient:
-            query = query.filter_by(patient_id=patient.id)
-    
-    if critical_only:
-        query = query.filter_by(critical_flag=True)
+    try:
+        limit = min(int(request.args.get('limit', LAB_RESULTS_PAGE_SIZE)), LAB_RESULTS_MAX_PAGE_SIZE)
+        after = labs.parse_cursor(request.args['after']) if request.args.get('after') else None
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    results = query.order_by(desc(LabResult.date)).all()
+    try:
+        # The patient is joined rather than looked up, so an unknown
+        # patient_id gives an empty page instead of every result
+        query = db.session.query(
+            LabResult.id, LabResult.test_name, LabResult.result_value, LabResult.value_numeric,
+            LabResult.unit, LabResult.interpretation, LabResult.date, LabResult.critical_flag,
+            LabResult.acknowledged, Patient.patient_id, Patient.first_name, Patient.last_name
+        ).join(Patient, Patient.id == LabResult.patient_id)
+        
+        patient_id = request.args.get('patient_id')
+        if patient_id:
+            query = query.filter(Patient.patient_id == patient_id)
+        # critical + unacknowledged_only is the nurse station queue, served
+        # by the partial index ix_lab_result_unacknowledged_critical
+        if _parse_bool(request.args.get('critical', '')):
+            query = query.filter(LabResult.critical_flag == True)
+        if _parse_bool(request.args.get('unacknowledged_only', '')):
+            query = query.filter(LabResult.acknowledged == False)
+        
+        # Without limit or after, return every result as before
+        newest_first = (desc(LabResult.date).nulls_last(), desc(LabResult.id))
+        if 'limit' not in request.args and after is None:
+            rows = query.order_by(*newest_first).all()
+            limit = len(rows)
+        elif after is None:
+            rows = query.order_by(*newest_first).limit(limit + 1).all()
+        else:
+            # Keyset pagination on (date, id), newest first; undated
+            # results follow the dated ones, newest id first
+            after_date, after_id = after
+            rows = []
+            if after_date is not None:
+                rows = query.filter(
+                    LabResult.date <= after_date,
+                    or_(LabResult.date < after_date, LabResult.id < after_id)
+                ).order_by(*newest_first).limit(limit + 1).all()
+            if len(rows) <= limit:
+                undated = query.filter(LabResult.date.is_(None))
+                if after_date is None:
+                    undated = undated.filter(LabResult.id < after_id)
+                rows += undated.order_by(desc(LabResult.id)).limit(limit + 1 - len(rows)).all()
+        
+        response = jsonify([{
+            'id': row.id,
+            'patient_id': row.patient_id,
+            'patient_name': f"{row.first_name} {row.last_name}",
+            'test_name': row.test_name,
+            'result_value': row.result_value,
+            'value': row.value_numeric,
+            'unit': row.unit,
+            'interpretation': row.interpretation,
+            'date': row.date.isoformat() if row.date else None,
+            'critical_flag': row.critical_flag,
+            'acknowledged': row.acknowledged
+        } for row in rows[:limit]])
+        
+        if len(rows) > limit:
+            next_cursor = labs.format_cursor(rows[limit - 1].date, rows[limit - 1].id)
+            args = request.args.to_dict()
+            args['after'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for(".get_lab_results", _external=True, **args)}>; rel="next"'
+        return response
+    except Exception as e:
+        logging.error(f"Error fetching lab results: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to fetch lab results'}), 500
+
+@api.route('/labresults/acknowledge', methods=['POST'])
+def acknowledge_lab_results():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'success': False, 'message': 'ids must be a non-empty list'}), 400
+    if len(ids) > labs.MAX_ACKNOWLEDGE:
+        return jsonify({'success': False, 'message': f'At most {labs.MAX_ACKNOWLEDGE} results per request'}), 413
+    try:
+        # int() would truncate 2.7 to 2 and take true for 1
+        if any(isinstance(pk, (bool, float)) for pk in ids):
+            raise ValueError()
+        ids = [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'ids must be integers'}), 400
     
-    return jsonify([{
-        'id': result.id,
-        'patient_id': result.patient.patient_id,
-        'patient_name': result.patient.name,
-        'test_name': result.test_name,
-        'result_value': result.result_value,
-        'date': result.date.isoformat() if result.date else None,
-        'critical_flag': result.critical_flag,
-        'acknowledged': result.acknowledged
-    } for result in results])
+    try:
+        acknowledged = labs.acknowledge(ids)
+        db.session.commit()
+        return jsonify({'success': True, 'acknowledged': len(acknowledged), 'ids': acknowledged})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error acknowledging lab results: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 @api.route('/labresults', methods=['POST'])
 def create_lab_result():
@@ -580,52 +976,155 @@ def create_lab_result():
         return jsonify({'success': False, 'message': 'Patient not found'}), 404
     
     # Use a default provider since we don't have authentication
-    default_provider = User.query.filter_by(role='doctor').first()
+    default_provider = refdata.get().first_user('doctor')
     if not default_provider:
         return jsonify({'success': False, 'message': 'No provider available'}), 404
     
+    result_value = data.get('result_value')
+    if result_value is None and data.get('value') is not None:
+        result_value = f"{data['value']} {data['unit']}" if data.get('unit') else str(data['value'])
     lab_result = LabResult(
         patient_id=patient.id,
         test_name=data.get('test_name'),
-        result_value=data.get('result_value'),
+        result_value=result_value,
         date=datetime.strptime(data.get('date'), '%Y-%m-%d').date() if data.get('date') else date.today(),
         critical_flag=data.get('critical_flag', False),
         notes=data.get('notes', ''),
         ordering_provider=default_provider.username
     )
+    if data.get('unit'):
+        lab_result.unit = data['unit']
+    labs.apply_to(lab_result)
     
     try:
         db.session.add(lab_result)
-        db.session.commit()
-        
         if lab_result.critical_flag:
-            notification = Notification(
-                patient_id=patient.id,
-                message=f"Critical lab result for {data.get('test_name')}: {data.get('result_value')}",
-                notification_type='lab_result'
+            outbox.notify(
+                f"Critical lab result for {data.get('test_name')}: {data.get('result_value')}",
+                'lab_result', patient_id=patient.id
             )
-            db.session.add(notification)
-            db.session.commit()
+        db.session.commit()
         
-        return jsonify({'success': True})
+        return jsonify({
+            'success': True,
+            'id': lab_result.id,
+            'value': lab_result.value_numeric,
+            'unit': lab_result.unit,
+            'interpretation': lab_result.interpretation,
+            'critical_flag': lab_result.critical_flag
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@api.route('/labresults/batch', methods=['POST'])
+def create_lab_results_batch():
+    try:
+        records = list(vitals_ingest.read_records(request.get_data(as_text=True), request.content_type))
+    except (ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'message': f'Invalid body: {str(e)}'}), 400
+    if not records:
+        return jsonify({'success': False, 'message': 'No results given'}), 400
+    if len(records) > labs.MAX_BATCH_SIZE:
+        return jsonify({'success': False, 'message': f'At most {labs.MAX_BATCH_SIZE} results per request'}), 413
+    
+    default_provider = refdata.get().first_user('doctor')
+    # Other patient_id values are rejected per row by labs.prepare
+    codes = {str(record['patient_id']) for _, record in records
+             if isinstance(record, dict) and isinstance(record.get('patient_id'), (str, int))}
+    patient_ids = vitals_ingest.patient_ids.resolve(codes)
+    rows, errors = labs.prepare(records, patient_ids, default_provider.username if default_provider else None)
+    
+    try:
+        labs.insert_results(rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Lab result batch failed: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'inserted': len(rows),
+        'critical': sum(1 for row in rows if row['critical_flag']),
+        'abnormal': sum(1 for row in rows if row['interpretation'] not in (None, 'N')),
+        'errors': errors
+    })
+
+@api.route('/labresults/trend')
+def get_lab_trend():
+    patient = Patient.query.options(load_only(Patient.id)).filter_by(
+        patient_id=request.args.get('patient_id')
+    ).first()
+    if not patient:
+        return jsonify({'success': False, 'message': 'Patient not found'}), 404
+    test_name = request.args.get('test_name')
+    if not test_name:
+        return jsonify({'success': False, 'message': 'test_name is required'}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format, expected YYYY-MM-DD'}), 400
+    
+    # A patient's results are few; the (patient_id, date) index narrows to
+    # them, and names are matched in Python to collapse spacing like lab_test_key
+    query = db.session.query(
+        LabResult.test_name, LabResult.date, LabResult.value_numeric, LabResult.unit, LabResult.interpretation,
+        LabResult.critical_flag
+    ).filter(
+        LabResult.patient_id == patient.id,
+        LabResult.value_numeric.isnot(None)
+    )
+    if start:
+        query = query.filter(LabResult.date >= start)
+    if end:
+        query = query.filter(LabResult.date <= end)
+    rows = [row for row in query.order_by(LabResult.date, LabResult.id)
+            if lab_test_key(row.test_name) == lab_test_key(test_name)]
+    
+    reference = refdata.get().lab_ranges.get(lab_test_key(test_name))
+    return jsonify({
+        'patient_id': request.args.get('patient_id'),
+        'test_name': test_name,
+        'unit': reference.unit if reference else next((row.unit for row in rows if row.unit), None),
+        'reference': {
+            'low': reference.low, 'high': reference.high,
+            'critical_low': reference.critical_low, 'critical_high': reference.critical_high
+        } if reference else None,
+        'dates': [row.date.isoformat() if row.date else None for row in rows],
+        'values': [row.value_numeric for row in rows],
+        'units': [row.unit for row in rows],
+        'interpretation': [row.interpretation for row in rows],
+        'critical': [bool(row.critical_flag) for row in rows]
+    })
+
 # Medical record routes
 @api.route('/medical_records')
 def get_medical_records():
     patient_id = request.args.get('patient_id')
     
-    query = MedicalRecord.query
+    query = MedicalRecord.query.options(
+        joinedload(MedicalRecord.patient, innerjoin=True).load_only(
+            Patient.patient_id, Patient.first_name, Patient.last_name
+        )
+    )
     if patient_id:
         patient = Patient.query.filter_by(patient_id=patient_id).first()
         if patient:
             query = query.filter_by(patient_id=patient.id)
     
-    records = query.order_by(desc(MedicalRecord.date)).all()
+    query = query.order_by(desc(MedicalRecord.date))
     
-    return jsonify([{
+    mode = stream_mode()
+    if mode:
+        return stream_response(query, _serialize_medical_record, mode)
+    
+    return jsonify([_serialize_medical_record(record) for record in query.all()])
+
+def _serialize_medical_record(record):
+    return {
         'id': record.id,
         'patient_id': record.patient.patient_id,
         'patient_name': record.patient.name,
@@ -633,7 +1132,7 @@ def get_medical_records():
         'date': record.date.isoformat() if record.date else None,
         'notes': record.notes,
         'provider': record.provider
-    } for record in records])
+    }
 
 @api.route('/medical_records', methods=['POST'])
 def create_medical_record():
@@ -644,7 +1143,7 @@ def create_medical_record():
         return jsonify({'success': False, 'message': 'Patient not found'}), 404
     
     # Use a default provider since we don't have authentication
-    default_provider = User.query.filter_by(role='doctor').first()
+    default_provider = refdata.get().first_user('doctor')
     if not default_provider:
         return jsonify({'success': False, 'message': 'No provider available'}), 404
     
@@ -670,24 +1169,133 @@ def create_medical_record():
 def get_vital_signs():
     patient_id = request.args.get('patient_id')
     
-    query = VitalSign.query
+    query = VitalSign.query.options(
+        joinedload(VitalSign.patient, innerjoin=True).load_only(
+            Patient.patient_id, Patient.first_name, Patient.last_name
+        )
+    )
     if patient_id:
         patient = Patient.query.filter_by(patient_id=patient_id).first()
         if patient:
             query = query.filter_by(patient_id=patient.id)
     
-    vital_signs = query.order_by(desc(VitalSign.timestamp)).all()
+    query = query.order_by(desc(VitalSign.timestamp))
     
-    return jsonify([{
+    mode = stream_mode()
+    if mode:
+        return stream_response(query, _serialize_vital_sign, mode)
+    
+    return jsonify([_serialize_vital_sign(vital) for vital in query.all()])
+
+def _serialize_vital_sign(vital):
+    return {
         'id': vital.id,
         'patient_id': vital.patient.patient_id,
         'patient_name': vital.patient.name,
         'heart_rate': vital.heart_rate,
         'blood_pressure': vital.blood_pressure,
+        'systolic': vital.systolic,
+        'diastolic': vital.diastolic,
         'oxygen_saturation': vital.oxygen_saturation,
         'temperature': vital.temperature,
         'timestamp': vital.timestamp.isoformat()
-    } for vital in vital_signs])
+    }
+
+VITAL_SERIES_DAYS = 7
+VITAL_SERIES_MAX_POINTS = 10000
+
+# Response array -> VitalSign column
+VITAL_SERIES_COLUMNS = {
+    'hr': VitalSign.heart_rate,
+    'spo2': VitalSign.oxygen_saturation,
+    'temp': VitalSign.temperature,
+    'sbp': VitalSign.systolic,
+    'dbp': VitalSign.diastolic,
+}
+
+@api.route('/vital_signs/series')
+def get_vital_sign_series():
+    patient = Patient.query.options(load_only(Patient.id)).filter_by(
+        patient_id=request.args.get('patient_id')
+    ).first()
+    if not patient:
+        return jsonify({'success': False, 'message': 'Patient not found'}), 404
+    
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        start = (datetime.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=VITAL_SERIES_DAYS))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid start or end, expected ISO 8601'}), 400
+    limit = max(min(request.args.get('limit', VITAL_SERIES_MAX_POINTS, type=int), VITAL_SERIES_MAX_POINTS), 1)
+    
+    # Served from ix_vital_sign_series without touching the table
+    rows = db.session.query(VitalSign.timestamp, *VITAL_SERIES_COLUMNS.values()).filter(
+        VitalSign.patient_id == patient.id,
+        VitalSign.timestamp >= start,
+        VitalSign.timestamp <= end
+    ).order_by(VitalSign.timestamp).limit(limit + 1).all()
+    
+    truncated = len(rows) > limit
+    columns = list(zip(*rows[:limit])) or [()] * (len(VITAL_SERIES_COLUMNS) + 1)
+    series = {
+        'patient_id': request.args.get('patient_id'),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': min(len(rows), limit),
+        'truncated': truncated,
+        'timestamps': [timestamp.isoformat() for timestamp in columns[0]],
+    }
+    for name, values in zip(VITAL_SERIES_COLUMNS, columns[1:]):
+        series[name] = list(values)
+    return jsonify(series)
+
+RECENT_VITALS_DEFAULT = 10
+
+@api.route('/vital_signs/latest')
+def get_latest_vital_signs():
+    codes = [code for code in request.args.get('patient_id', '').split(',') if code]
+    if not codes:
+        return jsonify({'success': False, 'message': 'patient_id is required'}), 400
+    k = max(request.args.get('k', RECENT_VITALS_DEFAULT, type=int), 1)
+    resolved = vitals_ingest.patient_ids.resolve(set(codes))
+    readings = recent_vitals.latest([resolved[code] for code in codes if code in resolved], k)
+    return jsonify({
+        'readings': {code: readings.get(resolved[code], []) for code in codes if code in resolved},
+        'not_found': [code for code in codes if code not in resolved]
+    })
+
+ROLLUP_MAX_POINTS = 5000
+
+@api.route('/vital_signs/rollup')
+def get_vital_sign_rollup():
+    patient = Patient.query.options(load_only(Patient.id)).filter_by(
+        patient_id=request.args.get('patient_id')
+    ).first()
+    if not patient:
+        return jsonify({'success': False, 'message': 'Patient not found'}), 404
+    
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        start = (datetime.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=VITAL_SERIES_DAYS))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid start or end, expected ISO 8601'}), 400
+    if end <= start:
+        return jsonify({'success': False, 'message': 'end must be after start'}), 400
+    
+    points = min(max(request.args.get('points', rollups.DEFAULT_POINTS, type=int), 1), ROLLUP_MAX_POINTS)
+    resolution = request.args.get('resolution')
+    if resolution and resolution not in rollups.RESOLUTIONS:
+        return jsonify({'success': False, 'message': f"resolution must be one of {', '.join(rollups.RESOLUTIONS)}"}), 400
+    metrics = request.args.get('metrics')
+    metrics = metrics.split(',') if metrics else None
+    if metrics and any(metric not in rollups.METRICS for metric in metrics):
+        return jsonify({'success': False, 'message': f"metrics must be among {', '.join(rollups.METRICS)}"}), 400
+    
+    result = rollups.series(patient.id, start, end, points, resolution, metrics)
+    result.update(patient_id=request.args.get('patient_id'), start=start.isoformat(), end=end.isoformat())
+    return jsonify(result)
 
 @api.route('/vital_signs', methods=['POST'])
 def create_vital_sign():
@@ -697,10 +1305,17 @@ def create_vital_sign():
     if not patient:
         return jsonify({'success': False, 'message': 'Patient not found'}), 404
     
+    blood_pressure = data.get('blood_pressure')
+    if not blood_pressure and data.get('systolic') and data.get('diastolic'):
+        try:
+            blood_pressure = f"{int(data['systolic'])}/{int(data['diastolic'])}"
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'systolic and diastolic must be whole numbers'}), 400
+    
     vital_sign = VitalSign(
         patient_id=patient.id,
         heart_rate=data.get('heart_rate'),
-        blood_pressure=data.get('blood_pressure'),
+        blood_pressure=blood_pressure,
         oxygen_saturation=data.get('oxygen_saturation'),
         temperature=data.get('temperature'),
         timestamp=datetime.strptime(data.get('timestamp'), '%Y-%m-%dT%H:%M:%S') if data.get('timestamp') else datetime.now()
@@ -715,19 +1330,96 @@ def create_vital_sign():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@api.route('/vital_signs/batch', methods=['POST'])
+def ingest_vital_signs():
+    try:
+        records = list(vitals_ingest.read_records(request.get_data(as_text=True), request.mimetype))
+    except (ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'message': f'Could not read readings: {str(e)}'}), 400
+    
+    max_rows = current_app.config['VITALS_MAX_REQUEST_ROWS']
+    if len(records) > max_rows:
+        return jsonify({'success': False, 'message': f'A request is limited to {max_rows} readings'}), 413
+    
+    rows, errors = vitals_ingest.prepare(records)
+    if not rows:
+        return jsonify({'success': False, 'accepted': 0, 'rejected': len(errors), 'errors': errors[:100]}), 400
+    
+    try:
+        vitals_ingest.writer.submit(rows)
+    except vitals_ingest.QueueFull:
+        response = jsonify({'success': False, 'message': 'Ingestion queue is full, retry shortly'})
+        response.headers['Retry-After'] = str(current_app.config['VITALS_RETRY_AFTER_SECONDS'])
+        return response, 503
+    
+    return jsonify({
+        'success': not errors,
+        'accepted': len(rows),
+        'rejected': len(errors),
+        'errors': errors[:100]
+    }), 202
+
+@api.route('/vital_signs/batch/stats')
+def vital_sign_ingest_stats():
+    return jsonify(vitals_ingest.writer.stats())
+
+@api.route('/vital_signs/alerts/stats')
+def vital_alert_stats():
+    return jsonify(vital_alerts.stats())
+
+# Live feed routes
+@api.route('/live/stream')
+def live_stream():
+    codes = [code for code in request.args.get('patient_id', '').split(',') if code]
+    unit = request.args.get('unit')
+    if unit and unit != 'icu':
+        return jsonify({'success': False, 'message': 'unit must be icu'}), 400
+    if not (codes or unit):
+        return jsonify({'success': False, 'message': 'patient_id or unit is required'}), 400
+    
+    kinds = request.args.get('types')
+    kinds = kinds.split(',') if kinds else list(live.EVENT_TYPES)
+    if any(kind not in live.EVENT_TYPES for kind in kinds):
+        return jsonify({'success': False, 'message': f"types must be among {', '.join(live.EVENT_TYPES)}"}), 400
+    
+    # EventSource sends Last-Event-ID on reconnect; first connects can pass it as a parameter
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        cursor = live.parse_cursor(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid Last-Event-ID'}), 400
+    
+    response = live.stream(codes, unit, kinds, cursor)
+    if response is None:
+        return jsonify({'success': False, 'message': 'Too many live connections, retry shortly'}), 503, {
+            'Retry-After': str(current_app.config['LIVE_HEARTBEAT_SECONDS'])
+        }
+    return response
+
+@api.route('/live/stats')
+def live_stats():
+    return jsonify(live.stats())
+
 # Notification routes
 @api.route('/notifications')
 def get_notifications():
     # Get all notifications since we don't have user authentication
-    notifications = Notification.query.order_by(desc(Notification.timestamp)).all()
+    query = Notification.query.order_by(desc(Notification.timestamp))
     
-    return jsonify([{
+    mode = stream_mode()
+    if mode:
+        return stream_response(query, _serialize_notification, mode)
+    
+    return jsonify([_serialize_notification(note) for note in query.all()])
+
+def _serialize_notification(note):
+    return {
         'id': note.id,
         'message': note.message,
         'timestamp': note.timestamp.isoformat(),
         'read': note.read,
         'type': note.notification_type
-    } for note in notifications])
+    }
 
 @api.route('/notifications/<int:notification_id>/read', methods=['POST'])
 def mark_notification_read(notification_id):
@@ -743,6 +1435,7 @@ def mark_notification_read(notification_id):
 
 # Analytics routes
 @api.route('/analytics/patient_stats')
+@cached(ttl=30, depends_on=(Patient, Appointment, MedicalRecord))
 def patient_analytics():
     monthly_stats = db.session.query(
         extract('year', Patient.created_at).label('year'),
@@ -778,14 +1471,14 @@ def patient_analytics():
 # Health program routes
 @api.route('/programs')
 def get_programs():
-    programs = Program.query.all()
+    programs = refdata.get().programs
     
     return jsonify([{
         'id': program.id,
         'name': program.name,
         'description': program.description,
         'code': program.code,
-        'participant_count': len(program.patients)
+        'participant_count': program.participant_count
     } for program in programs])
 
 @api.route('/programs/<int:program_id>/enroll', methods=['POST'])
@@ -793,7 +1486,8 @@ def enroll_patient(program_id):
     data = request.get_json()
     patient_id = data.get('patient_id')
     
-    program = Program.query.get_or_404(program_id)
+    if program_id not in refdata.get().programs_by_id:
+        abort(404)
     patient = Patient.query.filter_by(patient_id=patient_id).first()
     
     if not patient:
@@ -824,7 +1518,7 @@ def enroll_patient(program_id):
 # Medication inventory routes
 @api.route('/medications/inventory')
 def get_medication_inventory():
-    medications = Medication.query.all()
+    medications = refdata.get().medications
     
     return jsonify([{
         'id': med.id,
@@ -881,7 +1575,7 @@ def create_pending_action():
         return jsonify({'success': False, 'message': 'Patient not found'}), 404
     
     # Use a default user since we don't have authentication
-    default_user = User.query.first()
+    default_user = refdata.get().first_user()
     if not default_user:
         return jsonify({'success': False, 'message': 'No user available'}), 404
     
@@ -897,14 +1591,7 @@ def create_pending_action():
     
     try:
         db.session.add(action)
-        db.session.commit()
-        
-        notification = Notification(
-            user_id=default_user.id,
-            message=f"New pending action: {data.get('description')}",
-            notification_type='pending_action'
-        )
-        db.session.add(notification)
+        outbox.notify(f"New pending action: {data.get('description')}", 'pending_action', user_id=default_user.id)
         db.session.commit()
         
         return jsonify({'success': True})
@@ -946,42 +1633,90 @@ def search():
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'all')
     
+    kinds = list(search_index.KINDS) if search_type == 'all' else [search_type]
+    if any(kind not in search_index.KINDS for kind in kinds):
+        return jsonify({'success': False, 'message': f'Unknown search type: {search_type}'}), 400
+    
+    matches = search_index.search(query, kinds, limit=10)
     results = []
     
-    if search_type in ['all', 'patients']:
-        patients = Patient.query.filter(
-            or_(
-                Patient.name.ilike(f'%{query}%'),
-                Patient.patient_id.ilike(f'%{query}%')
-            )
-        ).limit(10).all()
+    if 'patients' in matches:
+        patients = {p.id: p for p in Patient.query.options(
+            load_only(Patient.patient_id, Patient.first_name, Patient.last_name,
+                      Patient.date_of_birth, Patient.gender)
+        ).filter(Patient.id.in_(matches['patients']))}
         results.extend([{
             'type': 'patient',
             'id': p.patient_id,
             'name': p.name,
             'details': f'Age: {p.age}, Gender: {p.gender}'
-        } for p in patients])
+        } for p in (patients.get(pk) for pk in matches['patients']) if p])
     
-    if search_type in ['all', 'appointments']:
-        appointments = Appointment.query.join(Patient).filter(
-            or_(
-                Patient.name.ilike(f'%{query}%'),
-                Appointment.reason.ilike(f'%{query}%')
-            )
-        ).limit(10).all()
+    if 'appointments' in matches:
+        appointments = {appt.id: appt for appt in Appointment.query.options(
+            load_only(Appointment.id, Appointment.date, Appointment.start_time, Appointment.reason),
+            joinedload(Appointment.patient, innerjoin=True).load_only(Patient.first_name, Patient.last_name)
+        ).filter(Appointment.id.in_(matches['appointments']))}
         results.extend([{
             'type': 'appointment',
             'id': f"A{appt.id:04d}",
             'name': appt.patient.name,
             'details': f"{appt.date} {appt.start_time.strftime('%H:%M')} - {appt.reason}"
-        } for appt in appointments])
+        } for appt in (appointments.get(pk) for pk in matches['appointments']) if appt])
+    
+    if 'records' in matches:
+        records = {record.id: record for record in MedicalRecord.query.options(
+            load_only(MedicalRecord.id, MedicalRecord.date, MedicalRecord.diagnosis),
+            joinedload(MedicalRecord.patient, innerjoin=True).load_only(
+                Patient.patient_id, Patient.first_name, Patient.last_name
+            )
+        ).filter(MedicalRecord.id.in_(matches['records']))}
+        results.extend([{
+            'type': 'medical_record',
+            'id': record.id,
+            'patient_id': record.patient.patient_id,
+            'name': record.patient.name,
+            'details': f"{record.date} - {record.diagnosis}"
+        } for record in (records.get(pk) for pk in matches['records']) if record])
     
     return jsonify(results)
 
+@api.route('/search/typeahead')
+def search_typeahead():
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    
+    matches = typeahead.lookup(query, limit)
+    if matches is None:
+        # Index unavailable or over its memory budget
+        ids = search_index.search(query, ['patients'], limit)['patients']
+        patients = {p.id: p for p in Patient.query.options(
+            load_only(Patient.patient_id, Patient.first_name, Patient.last_name)
+        ).filter(Patient.id.in_(ids))}
+        matches = [(pk, patients[pk].patient_id, patients[pk].name) for pk in ids if pk in patients]
+    
+    return jsonify([{
+        'type': 'patient',
+        'id': patient_id,
+        'name': name
+    } for _, patient_id, name in matches])
+
+@api.route('/search/typeahead/stats')
+def typeahead_stats():
+    return jsonify(typeahead.stats())
+
+@api.route('/outbox/stats')
+def outbox_stats():
+    return jsonify(outbox.stats())
+
+@api.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
 @api.route('/user/profile')
 def get_user_profile():
     # Return a default user profile since we don't have authentication
-    default_user = User.query.first()
+    default_user = refdata.get().first_user()
     if not default_user:
         return jsonify({'error': 'No user available'}), 404
         
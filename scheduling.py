@@ -0,0 +1,336 @@
+import bisect
+from datetime import datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from models import Appointment, Patient, User
+from extension import db
+import refdata
+
+# Doctor availability. Each doctor's bookings for a day are held as intervals
+# (minutes since midnight) sorted by start, with a running maximum of the end
+# times, so an overlap check is one bisect: only intervals starting before
+# the new end can overlap, and they do iff the largest end among them is
+# past the new start.
+#
+# Schedules are loaded per request from the (doctor_id, date) index. Before
+# a booking checks them it takes a lock (see lock()) that is held until the
+# booking commits, so two workers can't both see a slot as free and commit
+# into it.
+
+INACTIVE_STATUSES = ('cancelled', 'no-show')
+DEFAULT_DURATION = 30
+MAX_BATCH_SIZE = 500
+FREQUENCIES = {'daily': 1, 'weekly': 7}
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+class DaySchedule:
+    """One doctor's active appointments on one day."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []
+
+    def add(self, start, end, appointment_id=None):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, appointment_id)
+        self.max_ends.insert(i, 0)
+        for j in range(i, len(self.ends)):
+            self.max_ends[j] = max(self.ends[j], self.max_ends[j - 1] if j else 0)
+
+    def overlapping(self, start, end, ignore=None):
+        """Return the position of an interval overlapping [start, end), or None."""
+        i = bisect.bisect_left(self.starts, end)
+        if i == 0 or self.max_ends[i - 1] <= start:
+            return None
+        for j in range(i - 1, -1, -1):
+            if self.ends[j] > start and (ignore is None or self.ids[j] != ignore):
+                return j
+            if j and self.max_ends[j - 1] <= start:
+                break
+        return None
+
+    def conflict(self, start, end, ignore=None):
+        """Return the id of an appointment overlapping [start, end), or None."""
+        position = self.overlapping(start, end, ignore)
+        return self.ids[position] if position is not None else None
+
+    @property
+    def booked_minutes(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def free_slots(self, opening, closing, duration, step):
+        return [start for start in range(opening, closing - duration + 1, step)
+                if self.overlapping(start, start + duration) is None]
+
+
+def clinic_hours():
+    """(opening, closing, slot step) in minutes, from the app config."""
+    config = current_app.config
+    opening = to_minutes(time.fromisoformat(config.get('CLINIC_OPENING_TIME', '08:00')))
+    closing = to_minutes(time.fromisoformat(config.get('CLINIC_CLOSING_TIME', '17:00')))
+    return opening, closing, config.get('SCHEDULE_SLOT_MINUTES', 15)
+
+
+def outside_hours(start, end):
+    """Return an error message if [start, end) is not within clinic hours."""
+    opening, closing, _ = clinic_hours()
+    if end <= start:
+        return 'Appointment must end after it starts'
+    if start < opening or end > closing:
+        return f'Appointments must fall between {to_time(opening):%H:%M} and {to_time(closing):%H:%M}'
+    return None
+
+
+def doctors(specialty=None, doctor_id=None):
+    """Active doctors from the reference-data snapshot, by id."""
+    found = [user for user in refdata.get().users_by_role.get('doctor', ()) if user.active]
+    if doctor_id is not None:
+        # Ids from JSON may be strings; the database query this replaced coerced them
+        try:
+            doctor_id = int(doctor_id)
+        except (TypeError, ValueError):
+            return []
+        found = [user for user in found if user.id == doctor_id]
+    if specialty:
+        found = [user for user in found
+                 if (user.specialization or 'General Medicine').lower() == specialty.lower()]
+    return found
+
+
+def lock(doctor_ids):
+    """Serialize bookings for these doctors until the current transaction ends."""
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        # pysqlite doesn't BEGIN before a SELECT and a SELECT takes no lock,
+        # so take the write lock up front; other bookings wait for the commit.
+        # Already in a write transaction means the lock is already held.
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        return
+    # Row locks on the doctors: new appointments have no rows to lock yet
+    db.session.query(User.id).filter(User.id.in_(doctor_ids)).order_by(User.id).with_for_update().all()
+
+
+def load(doctor_ids, start_date, end_date):
+    """Return {(doctor_id, date): DaySchedule} for the doctors' active appointments in the range."""
+    rows = db.session.query(
+        Appointment.id, Appointment.doctor_id, Appointment.date, Appointment.start_time, Appointment.end_time
+    ).filter(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.date.between(start_date, end_date),
+        or_(Appointment.status.is_(None), Appointment.status.notin_(INACTIVE_STATUSES))
+    ).order_by(Appointment.start_time)
+
+    schedules = {}
+    for row in rows:
+        start = to_minutes(row.start_time)
+        end = to_minutes(row.end_time) if row.end_time else start + DEFAULT_DURATION
+        schedule = schedules.setdefault((row.doctor_id, row.date), DaySchedule())
+        schedule.add(start, max(end, start + 1), row.id)
+    return schedules
+
+
+def find_conflict(doctor_id, day, start, end, ignore=None):
+    """Return the id of the doctor's appointment overlapping [start, end) on `day`, or None."""
+    lock([doctor_id])
+    schedule = load([doctor_id], day, day).get((doctor_id, day))
+    return schedule.conflict(start, end, ignore) if schedule else None
+
+
+def pick_doctor(candidates, schedules, day, start, end):
+    """Return the candidate free over [start, end) with the fewest booked minutes that day, or None."""
+    best = None
+    for doctor in candidates:
+        schedule = schedules.get((doctor.id, day), DaySchedule())
+        if schedule.overlapping(start, end) is not None:
+            continue
+        load_key = (schedule.booked_minutes, len(schedule.starts), doctor.id)
+        if best is None or load_key < best[0]:
+            best = (load_key, doctor)
+    return best[1] if best else None
+
+
+def assign_doctor(day, start, end, specialty=None):
+    """Return the free doctor with the fewest booked minutes that day, or None."""
+    candidates = doctors(specialty)
+    if not candidates:
+        return None
+    lock([doctor.id for doctor in candidates])
+    return pick_doctor(candidates, load([doctor.id for doctor in candidates], day, day), day, start, end)
+
+
+def free_slots(candidates, start_date, end_date, duration):
+    """Return free slot start times per doctor and day."""
+    opening, closing, step = clinic_hours()
+    schedules = load([doctor.id for doctor in candidates], start_date, end_date)
+    results = []
+    for doctor in candidates:
+        day = start_date
+        while day <= end_date:
+            schedule = schedules.get((doctor.id, day), DaySchedule())
+            slots = schedule.free_slots(opening, closing, duration, step)
+            if slots:
+                results.append({
+                    'doctor_id': doctor.id,
+                    'doctor_name': f"Dr. {doctor.username}",
+                    'specialty': doctor.specialization or 'General Medicine',
+                    'date': day.isoformat(),
+                    'slots': [to_time(slot).strftime('%H:%M') for slot in slots]
+                })
+            day += timedelta(days=1)
+    return results
+
+
+def expand_recurrence(rule):
+    """Return one batch item per occurrence of a recurrence rule.
+
+    The rule has start_date, time, frequency ('daily' or 'weekly'), an
+    optional interval, either count or until, and for weekly rules optional
+    weekdays (e.g. ['mon', 'wed', 'fri']). Raises ValueError if it is invalid.
+    """
+    try:
+        start = datetime.strptime(rule.get('start_date') or '', '%Y-%m-%d').date()
+        until = datetime.strptime(rule['until'], '%Y-%m-%d').date() if rule.get('until') else None
+    except ValueError:
+        raise ValueError('Invalid recurrence date, expected YYYY-MM-DD')
+    frequency = rule.get('frequency', 'weekly')
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+    interval = int(rule.get('interval', 1))
+    count = int(rule['count']) if rule.get('count') else None
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError('interval and count must be positive')
+    if count is None and until is None:
+        raise ValueError('Recurrence needs a count or an until date')
+    weekdays = rule.get('weekdays')
+    if weekdays and frequency != 'weekly':
+        raise ValueError('weekdays only apply to weekly recurrences')
+    try:
+        offsets = sorted({WEEKDAYS.index(day.lower()[:3]) for day in weekdays}) if weekdays else None
+    except (AttributeError, ValueError):
+        raise ValueError(f"weekdays must be names like {', '.join(WEEKDAYS)}")
+
+    # Walk one period (a day or a week) at a time; stop one past the batch
+    # limit so the caller can reject oversized rules.
+    step = timedelta(days=FREQUENCIES[frequency] * interval)
+    period = start - timedelta(days=start.weekday()) if offsets else start
+    dates = []
+    while len(dates) <= MAX_BATCH_SIZE:
+        candidates = [period + timedelta(days=offset) for offset in offsets] if offsets else [period]
+        candidates = [day for day in candidates if day >= start and (until is None or day <= until)]
+        if count is not None:
+            candidates = candidates[:count - len(dates)]
+        dates.extend(candidates)
+        period += step
+        if (count is not None and len(dates) >= count) or (until and period > until):
+            break
+
+    shared = {key: value for key, value in rule.items()
+              if key not in ('start_date', 'until', 'frequency', 'interval', 'count', 'weekdays')}
+    return [dict(shared, date=day.isoformat()) for day in dates]
+
+
+def plan_batch(items):
+    """Validate batch items against the schedule in one pass.
+
+    Returns (results, planned): one result dict per item, and for the items
+    that can be booked a list of (index, Appointment values, doctor). Items
+    are checked in order against the stored schedule and the items before
+    them, so a batch can't double-book itself. Items created as cancelled or
+    no-show don't take a slot.
+    """
+    results = []
+    parsed = []
+    for index, item in enumerate(items):
+        result = {'index': index, 'status': 'ok'}
+        results.append(result)
+        if not isinstance(item, dict):
+            result.update(status='invalid', message='Expected an object')
+            continue
+        try:
+            day = datetime.strptime(item.get('date') or '', '%Y-%m-%d').date()
+            start_time = datetime.strptime(item.get('time') or '', '%H:%M').time()
+            duration = int(item.get('duration', DEFAULT_DURATION))
+        except (TypeError, ValueError):
+            result.update(status='invalid', message='Invalid date, time or duration')
+            continue
+        result.update(date=day.isoformat(), time=start_time.strftime('%H:%M'))
+        start = to_minutes(start_time)
+        error = outside_hours(start, start + duration)
+        if error:
+            result.update(status='invalid', message=error)
+            continue
+        parsed.append((index, item, day, start_time, start, start + duration))
+
+    if not parsed:
+        return results, []
+
+    # Everything the batch needs, loaded once
+    patient_codes = {str(item.get('patient_id') or '') for _, item, *_ in parsed}
+    patients = {patient.patient_id: patient for patient in
+                Patient.query.filter(Patient.patient_id.in_(patient_codes))}
+    candidates = doctors()
+    by_id = {doctor.id: doctor for doctor in candidates}
+    days = [day for _, _, day, *_ in parsed]
+    lock(list(by_id))
+    schedules = load(list(by_id), min(days), max(days))
+
+    planned = []
+    for index, item, day, start_time, start, end in parsed:
+        result = results[index]
+        patient = patients.get(str(item.get('patient_id') or ''))
+        if patient is None:
+            result.update(status='invalid', message='Patient not found')
+            continue
+
+        active = item.get('status', 'scheduled') not in INACTIVE_STATUSES
+        if item.get('doctor_id'):
+            doctor = next(iter(doctors(doctor_id=item['doctor_id'])), None)
+            if doctor is None:
+                result.update(status='invalid', message='Doctor not found')
+                continue
+            schedule = schedules.get((doctor.id, day), DaySchedule()) if active else DaySchedule()
+            position = schedule.overlapping(start, end)
+            if position is not None:
+                result.update(status='conflict', message=f'Dr. {doctor.username} is already booked at that time')
+                # Slots taken earlier in the batch have no appointment id yet
+                if schedule.ids[position] is not None:
+                    result['conflicting_appointment_id'] = schedule.ids[position]
+                continue
+        else:
+            specialty = (item.get('specialty') or '').lower()
+            matching = [doctor for doctor in candidates
+                        if not specialty or (doctor.specialization or 'General Medicine').lower() == specialty]
+            doctor = pick_doctor(matching, schedules if active else {}, day, start, end)
+            if doctor is None:
+                result.update(status='conflict', message='No doctor available at that time')
+                continue
+
+        if active:
+            schedules.setdefault((doctor.id, day), DaySchedule()).add(start, end)
+        result['doctor_id'] = doctor.id
+        planned.append((index, {
+            'patient_id': patient.id,
+            'doctor_id': doctor.id,
+            'date': day,
+            'start_time': start_time,
+            'end_time': to_time(end),
+            'status': item.get('status', 'scheduled'),
+            'reason': item.get('reason', ''),
+            'notes': item.get('notes', ''),
+            'telemedicine': bool(item.get('telemedicine', False)),
+        }, doctor))
+    return results, planned
@@ -0,0 +1,166 @@
+import logging
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text, desc, or_
+from models import Patient, Appointment, MedicalRecord
+from extension import db
+import events
+
+# Full-text search over patient names and ids, appointment reasons and
+# diagnoses, backed by a SQLite FTS5 table with the trigram tokenizer so
+# that any substring of three or more characters matches. Each document's
+# rowid encodes its kind and source row (id * 4 + kind), which keeps
+# updates and deletes to a rowid lookup. Flush events keep the index in
+# the same transaction as the rows it mirrors.
+#
+# Databases without FTS5 (or queries shorter than a trigram) fall back to
+# LIKE filters on the source tables.
+
+PATIENT, APPOINTMENT, RECORD = 0, 1, 2
+KINDS = {'patients': PATIENT, 'appointments': APPOINTMENT, 'records': RECORD}
+MIN_QUERY_LENGTH = 3
+
+_available = False
+
+
+def init_app(app):
+    global _available
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        try:
+            with db.engine.begin() as conn:
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+                )).first()
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+                    "USING fts5(patient_id, name, body, tokenize = 'trigram')"
+                ))
+        except Exception as e:
+            logging.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+            return
+        _available = True
+        if not exists:
+            reindex()
+
+
+def _document(model, values):
+    if model is Patient:
+        return (values['id'] * 4 + PATIENT, values.get('patient_id'),
+                f"{values.get('first_name') or ''} {values.get('last_name') or ''}".strip(), None)
+    if model is Appointment:
+        return values['id'] * 4 + APPOINTMENT, None, None, values.get('reason')
+    if model is MedicalRecord:
+        return values['id'] * 4 + RECORD, None, None, values.get('diagnosis')
+    return None
+
+
+@events.on_flush
+def _sync(session, changes):
+    if not _available:
+        return
+    rowids = []
+    inserts = []
+    for change in changes:
+        if change.model not in (Patient, Appointment, MedicalRecord) or change.values.get('id') is None:
+            continue
+        rowid, patient_id, name, body = _document(change.model, change.values)
+        # Always clear the rowid first, which also drops leftovers from rows
+        # removed outside the ORM.
+        rowids.append({'rowid': rowid})
+        if change.action != 'delete':
+            inserts.append({'rowid': rowid, 'patient_id': patient_id, 'name': name, 'body': body})
+    if not rowids:
+        return
+    conn = session.connection()
+    conn.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), rowids)
+    if inserts:
+        conn.execute(text(
+            "INSERT INTO search_index (rowid, patient_id, name, body) VALUES (:rowid, :patient_id, :name, :body)"
+        ), inserts)
+
+
+def reindex():
+    """Rebuild the whole index from the source tables."""
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM search_index"))
+        conn.execute(text(
+            "INSERT INTO search_index (rowid, patient_id, name, body) "
+            "SELECT id * 4 + :kind, patient_id, first_name || ' ' || last_name, NULL FROM patient"
+        ), {'kind': PATIENT})
+        conn.execute(text(
+            "INSERT INTO search_index (rowid, patient_id, name, body) "
+            "SELECT id * 4 + :kind, NULL, NULL, reason FROM appointment WHERE reason IS NOT NULL AND reason != ''"
+        ), {'kind': APPOINTMENT})
+        conn.execute(text(
+            "INSERT INTO search_index (rowid, patient_id, name, body) "
+            "SELECT id * 4 + :kind, NULL, NULL, diagnosis FROM medical_record"
+        ), {'kind': RECORD})
+        conn.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+        return conn.execute(text("SELECT COUNT(*) FROM search_index")).scalar()
+
+
+def _match_expression(query):
+    # A single quoted phrase: trigram matching treats it as a substring.
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _fts_ids(query, kind, limit):
+    # bm25 weights follow the column order: patient_id, name, body
+    rows = db.session.execute(text(
+        "SELECT rowid FROM search_index WHERE search_index MATCH :query AND rowid % 4 = :kind "
+        "ORDER BY bm25(search_index, 5.0, 10.0, 1.0) LIMIT :limit"
+    ), {'query': _match_expression(query), 'kind': kind, 'limit': limit})
+    return [row.rowid // 4 for row in rows]
+
+
+def _like_ids(query, kind, limit):
+    pattern = f'%{query}%'
+    if kind == PATIENT:
+        rows = db.session.query(Patient.id).filter(or_(
+            Patient.patient_id.ilike(pattern),
+            (Patient.first_name + ' ' + Patient.last_name).ilike(pattern)
+        ))
+    elif kind == APPOINTMENT:
+        rows = db.session.query(Appointment.id).filter(Appointment.reason.ilike(pattern))
+    else:
+        rows = db.session.query(MedicalRecord.id).filter(MedicalRecord.diagnosis.ilike(pattern))
+    return [row.id for row in rows.limit(limit)]
+
+
+def search(query, kinds, limit=10):
+    """Return {kind: [row ids, best match first]} for each requested kind."""
+    query = query.strip()
+    if not query:
+        return {kind: [] for kind in kinds}
+    find = _fts_ids if _available and len(query) >= MIN_QUERY_LENGTH else _like_ids
+
+    results = {}
+    patient_ids = find(query, PATIENT, limit) if 'patients' in kinds or 'appointments' in kinds else []
+    if 'patients' in kinds:
+        results['patients'] = patient_ids
+    if 'appointments' in kinds:
+        # Appointments whose reason matches, then those of matching patients
+        ids = find(query, APPOINTMENT, limit)
+        if len(ids) < limit and patient_ids:
+            ids += [row.id for row in db.session.query(Appointment.id).filter(
+                Appointment.patient_id.in_(patient_ids),
+                Appointment.id.notin_(ids)
+            ).order_by(desc(Appointment.date)).limit(limit - len(ids))]
+        results['appointments'] = ids
+    if 'records' in kinds:
+        results['records'] = find(query, RECORD, limit)
+    return results
+
+
+# CLI commands
+cli = AppGroup('search', help='Maintain the full-text search index.')
+
+
+@cli.command('reindex')
+def reindex_command():
+    """Rebuild the search index from scratch."""
+    if not _available:
+        raise click.ClickException("Full-text search is not available on this database")
+    click.echo(f"Indexed {reindex()} documents")
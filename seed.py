@@ -15,6 +15,8 @@ from models import (
     AuditLog,
 )
 from app import app
+import labs
+import search_index
 
 
 def seed_database():
@@ -585,6 +587,8 @@ def seed_database():
         db.session.add(prescription)
 
     # -------------------- LAB RESULTS --------------------
+    # Ranges first, so the results below are classified against them
+    labs.load_default_ranges()
     lab_results = [
         # Original lab results
         LabResult(
@@ -703,7 +707,7 @@ def seed_database():
     ]
 
     for lab_result in lab_results:
-        db.session.add(lab_result)
+        db.session.add(labs.apply_to(lab_result))
 
     # -------------------- MEDICAL RECORDS --------------------
     medical_records = [
@@ -1364,6 +1368,10 @@ def seed_database():
 
     # -------------------- FINAL COMMIT --------------------
     db.session.commit()
+
+    # drop_all leaves the full-text table in place, so rebuild it
+    if search_index._available:
+        search_index.reindex()
     print("Database seeded successfully with users, patients, appointments, prescriptions, lab results, medical records, vital signs, programs, enrollments, medications, notifications, and audit logs!")
 
 
@@ -0,0 +1,50 @@
+from flask import Response, current_app, request, stream_with_context
+
+# Streaming responses for large list endpoints. Rows are pulled from the
+# database in batches with yield_per and encoded batch by batch, so neither
+# the ORM objects nor the encoded body are ever held in memory all at once.
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+BATCH_SIZE = 500
+
+
+def stream_mode():
+    """Return 'ndjson', 'json' or None for the current request."""
+    stream = request.args.get('stream', '').lower()
+    if stream == 'ndjson' or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    if stream in ('1', 'true', 'json'):
+        return 'json'
+    return None
+
+
+def stream_response(query, serialize, mode, batch_size=BATCH_SIZE):
+    dumps = current_app.json.dumps
+
+    def generate_ndjson():
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append(dumps(serialize(row)))
+            if len(batch) >= batch_size:
+                yield '\n'.join(batch) + '\n'
+                batch = []
+        if batch:
+            yield '\n'.join(batch) + '\n'
+
+    def generate_json():
+        yield '['
+        separator = ''
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append(dumps(serialize(row)))
+            if len(batch) >= batch_size:
+                yield separator + ','.join(batch)
+                separator = ','
+                batch = []
+        if batch:
+            yield separator + ','.join(batch)
+        yield ']'
+
+    if mode == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
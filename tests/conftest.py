@@ -0,0 +1,66 @@
+import os
+import threading
+import pytest
+from sqlalchemy import delete, event, insert
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # app.py configures itself at import, so point it at a scratch database first
+    path = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_statements(app):
+    """Return a context manager that counts the SQL statements run on this thread."""
+    from extension import db
+
+    class Counter:
+        def __init__(self):
+            self.count = 0
+            self._thread = threading.get_ident()
+
+        def _count(self, conn, cursor, statement, parameters, context, executemany):
+            # The outbox dispatcher and other background threads share the engine
+            if threading.get_ident() == self._thread:
+                self.count += 1
+
+        def __enter__(self):
+            with app.app_context():
+                self._engine = db.engine
+            event.listen(self._engine, 'before_cursor_execute', self._count)
+            return self
+
+        def __exit__(self, *exc):
+            event.remove(self._engine, 'before_cursor_execute', self._count)
+
+    return Counter
+
+
+@pytest.fixture
+def seed_patients(app):
+    """Return seed(count, **columns): replace all patients with PT-000001.. PT-<count>."""
+    from extension import db
+    from models import Appointment, Patient
+
+    def seed(count, **columns):
+        with app.app_context():
+            db.session.execute(delete(Appointment))
+            db.session.execute(delete(Patient))
+            db.session.execute(insert(Patient), [
+                dict({'id': i, 'patient_id': f'PT-{i:06d}', 'first_name': f'First{i}', 'last_name': f'Last{i}'},
+                     **columns)
+                for i in range(1, count + 1)
+            ])
+            db.session.commit()
+
+    return seed
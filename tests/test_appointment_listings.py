@@ -0,0 +1,49 @@
+from datetime import date, time
+from sqlalchemy import delete, insert
+from extension import db
+from models import Appointment, Patient, User
+
+
+def _seed_appointments(app, count):
+    """Replace every appointment with `count` for today, spread over distinct patients and doctors."""
+    with app.app_context():
+        db.session.execute(delete(Appointment))
+        db.session.execute(delete(Patient))
+        db.session.execute(delete(User))
+        doctors = max(count // 20, 1)
+        db.session.execute(insert(User), [
+            {'id': i, 'username': f'doctor{i}', 'email': f'doctor{i}@example.com', 'role': 'doctor'}
+            for i in range(1, doctors + 1)
+        ])
+        db.session.execute(insert(Patient), [
+            {'id': i, 'patient_id': f'PT-{i:06d}', 'first_name': f'First{i}', 'last_name': f'Last{i}'}
+            for i in range(1, count + 1)
+        ])
+        db.session.execute(insert(Appointment), [
+            {'patient_id': i, 'doctor_id': i % doctors + 1, 'date': date.today(),
+             'start_time': time(8 + i % 10, i % 60), 'status': 'scheduled'}
+            for i in range(1, count + 1)
+        ])
+        db.session.commit()
+
+
+def _statements_for(app, client, count_statements, url, count):
+    _seed_appointments(app, count)
+    with count_statements() as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(response.get_json()) == count
+    return counter.count
+
+
+def test_appointment_listing_statement_count_is_constant(app, client, count_statements):
+    small = _statements_for(app, client, count_statements, '/api/appointments?date=all', 10)
+    large = _statements_for(app, client, count_statements, '/api/appointments?date=all', 10000)
+    assert small == large == 1
+
+
+def test_appointment_listing_includes_names(app, client):
+    _seed_appointments(app, 3)
+    appointments = client.get('/api/appointments?date=today').get_json()
+    assert {appointment['patient'] for appointment in appointments} == {'First1 Last1', 'First2 Last2', 'First3 Last3'}
+    assert all(appointment['doctor'] == 'doctor1' for appointment in appointments)
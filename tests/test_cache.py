@@ -0,0 +1,45 @@
+from extension import db
+from models import Patient
+import cache
+import counters
+
+
+def _fresh_stats(app, seed_patients):
+    seed_patients(3)
+    with app.app_context():
+        # seed_patients writes through Core, which neither counters nor the cache see
+        counters.rebuild()
+    cache._backend.invalidate({'dashboard_stats'})
+
+
+def test_a_write_evicts_cached_responses(app, client, seed_patients):
+    _fresh_stats(app, seed_patients)
+    before = client.get('/api/dashboard/stats').get_json()
+    hits = cache.stats()['hits']
+    assert client.get('/api/dashboard/stats').get_json() == before
+    assert cache.stats()['hits'] == hits + 1
+
+    response = client.post('/api/patients', json={
+        'first_name': 'Ada', 'last_name': 'Cached', 'email': 'ada@example.com',
+        'phone': '555-0100', 'date_of_birth': '1980-01-02',
+    })
+    assert response.get_json()['success']
+
+    after = client.get('/api/dashboard/stats').get_json()
+    assert after['patient_stats']['total'] == before['patient_stats']['total'] + 1
+
+
+def test_a_rolled_back_write_keeps_the_generation(app, client, seed_patients):
+    _fresh_stats(app, seed_patients)
+    client.get('/api/dashboard/stats')
+    generation = cache._backend.generation('dashboard_stats')
+    hits = cache.stats()['hits']
+
+    with app.app_context():
+        db.session.add(Patient(patient_id='PT-000100', first_name='Ada', last_name='Rollback'))
+        db.session.flush()
+        db.session.rollback()
+
+    assert cache._backend.generation('dashboard_stats') == generation
+    client.get('/api/dashboard/stats')
+    assert cache.stats()['hits'] == hits + 1
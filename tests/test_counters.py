@@ -0,0 +1,54 @@
+from datetime import date, time
+from extension import db
+from models import Appointment, LabResult, Patient, Prescription, VitalSign
+import counters
+
+
+def test_counters_follow_inserts_updates_and_deletes(app, seed_patients):
+    seed_patients(3)
+    with app.app_context():
+        # seed_patients writes through Core, which counters never see
+        counters.rebuild()
+
+        patient = Patient(patient_id='PT-000100', first_name='Ada', last_name='Counter', in_icu=True)
+        db.session.add(patient)
+        db.session.flush()
+        day = date(2031, 5, 6)
+        db.session.add_all([
+            Appointment(patient_id=patient.id, doctor_id=1, date=day, start_time=time(9), telemedicine=True),
+            Appointment(patient_id=1, doctor_id=1, date=day, start_time=time(10)),
+            Prescription(patient_id=patient.id, medication_name='Aspirin', status='pending'),
+            LabResult(patient_id=patient.id, test_name='Potassium', critical_flag=True),
+            VitalSign(patient_id=patient.id, heart_rate=80, oxygen_saturation=97.5),
+            VitalSign(patient_id=1, heart_rate=64),
+        ])
+        db.session.commit()
+
+        patient.in_icu = False
+        patient.on_ventilator = True
+        patient.isolation_status = 'contact'
+        appointment = Appointment.query.filter_by(patient_id=patient.id).one()
+        appointment.status = 'completed'
+        LabResult.query.filter_by(patient_id=patient.id).one().acknowledged = True
+        Prescription.query.filter_by(patient_id=patient.id).one().status = 'active'
+        VitalSign.query.filter_by(patient_id=1).one().heart_rate = 70
+        db.session.commit()
+
+        db.session.delete(Appointment.query.filter_by(patient_id=1).one())
+        db.session.delete(VitalSign.query.filter_by(patient_id=patient.id).one())
+        db.session.delete(Patient.query.filter_by(patient_id='PT-000002').one())
+        db.session.commit()
+
+        assert counters.check() == {}
+        live = counters.compute()
+        assert counters.read(list(live)) == live
+        assert live['patients.total'] == 3
+        assert live[counters.day_key('appointments.telemedicine_completed', day)] == 1
+        assert live['vitals.heart_rate.sum'] == 70
+
+        db.session.query(VitalSign).delete()
+        db.session.query(LabResult).delete()
+        db.session.query(Prescription).delete()
+        db.session.query(Appointment).delete()
+        db.session.commit()
+        counters.rebuild()
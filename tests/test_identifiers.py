@@ -0,0 +1,31 @@
+import threading
+from extension import db
+from identifiers import BlockAllocator
+from models import IdSequence
+
+
+def test_workers_reserve_disjoint_blocks(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'TEST_BLOCK_SIZE', 7)
+    with app.app_context():
+        db.session.query(IdSequence).filter_by(name='test_sequence').delete()
+        db.session.commit()
+
+    # Two allocators on one sequence stand in for two worker processes
+    workers = [BlockAllocator('test_sequence', lambda conn: 1, 'TEST_BLOCK_SIZE') for _ in range(2)]
+    allocated = [[] for _ in workers]
+
+    def allocate(index):
+        with app.app_context():
+            for count in (1, 3, 10, 1, 5) * 4:
+                allocated[index].extend(workers[index].allocate(count))
+
+    threads = [threading.Thread(target=allocate, args=(index,)) for index in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    first, second = (set(values) for values in allocated)
+    assert len(first) == len(allocated[0]) == 80
+    assert len(second) == len(allocated[1]) == 80
+    assert not first & second
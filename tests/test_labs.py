@@ -0,0 +1,102 @@
+from datetime import date
+import pytest
+from sqlalchemy import insert
+from extension import db
+from models import LabResult
+
+
+def test_lab_batch_rejects_a_scalar_body(app, client):
+    response = client.post('/api/labresults/batch', json=5)
+    assert response.status_code == 400
+
+
+def test_lab_batch_reports_unhashable_patient_ids_per_row(app, seed_patients, client):
+    seed_patients(1)
+    response = client.post('/api/labresults/batch', json=[
+        {'patient_id': ['PT-000001'], 'test_name': 'Glucose', 'value': 5.4},
+        {'patient_id': 'PT-000001', 'test_name': 'Glucose', 'value': 5.4},
+    ])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['inserted'] == 1
+    assert [error['row'] for error in body['errors']] == [1]
+
+
+def test_lab_trend_matches_names_like_lab_test_key(app, seed_patients, client):
+    seed_patients(1)
+    with app.app_context():
+        db.session.query(LabResult).delete()
+        db.session.commit()
+    client.post('/api/labresults/batch', json=[
+        {'patient_id': 'PT-000001', 'test_name': 'Blood  Glucose', 'value': 5.4, 'date': '2031-03-04'},
+        {'patient_id': 'PT-000001', 'test_name': 'blood glucose', 'value': 6.1, 'date': '2031-03-05'},
+    ])
+    response = client.get('/api/labresults/trend?patient_id=PT-000001&test_name=Blood%20glucose')
+    assert response.get_json()['values'] == [5.4, 6.1]
+
+
+@pytest.fixture
+def seed_results(app, seed_patients):
+    def seed(dates):
+        seed_patients(1)
+        with app.app_context():
+            db.session.query(LabResult).delete()
+            db.session.execute(insert(LabResult), [
+                {'id': i, 'patient_id': 1, 'test_name': 'Glucose', 'result_value': '5.4', 'date': day}
+                for i, day in enumerate(dates, start=1)
+            ])
+            db.session.commit()
+
+    return seed
+
+
+def test_lab_results_are_unpaginated_by_default(seed_results, client):
+    seed_results([date(2031, 3, 4)] * 150)
+    response = client.get('/api/labresults')
+    assert len(response.get_json()) == 150
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_lab_result_pages_reach_undated_results(seed_results, client):
+    seed_results([date(2031, 3, 4), None, date(2031, 3, 5), None, date(2031, 3, 4)])
+    seen = []
+    url = '/api/labresults?limit=2'
+    while url:
+        response = client.get(url)
+        seen += [result['id'] for result in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/labresults?limit=2&after={cursor}' if cursor else None
+    assert seen == [3, 5, 1, 4, 2]
+
+
+def test_acknowledge_rejects_fractional_ids(app, client):
+    response = client.post('/api/labresults/acknowledge', json={'ids': [2.7]})
+    assert response.status_code == 400
+
+
+def test_malformed_compact_lab_batch_is_a_400(client):
+    response = client.post('/api/labresults/batch', data='{"columns": ["patient_id", "value"], "rows": [5]}',
+                           content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', ['NaN', '1e999', '"nan"', '"abc"'])
+def test_non_finite_lab_values_are_rejected_per_row(seed_patients, client, value):
+    seed_patients(1)
+    body = (f'[{{"patient_id": "PT-000001", "test_name": "Glucose", "value": {value}}},'
+            ' {"patient_id": "PT-000001", "test_name": "Glucose", "value": 5.4}]')
+    response = client.post('/api/labresults/batch', data=body, content_type='application/json')
+    result = response.get_json()
+    assert response.status_code == 200
+    assert result['inserted'] == 1
+    assert [error['row'] for error in result['errors']] == [1]
+
+
+def test_overlong_lab_result_value_is_not_stored_as_infinity(seed_patients, client):
+    seed_patients(1)
+    response = client.post('/api/labresults', json={
+        'patient_id': 'PT-000001', 'test_name': 'Glucose', 'result_value': '9' * 400
+    })
+    assert response.status_code == 200
+    listed = client.get('/api/labresults?patient_id=PT-000001')
+    assert 'Infinity' not in listed.get_data(as_text=True)
@@ -0,0 +1,34 @@
+import live
+
+
+def _frame_ids(chunk):
+    return [line[len('id: '):] for line in chunk.decode().splitlines() if line.startswith('id: ')]
+
+
+def test_resume_cursor_does_not_pass_rows_still_to_come(app, client, seed_patients, monkeypatch):
+    seed_patients(1)
+    monkeypatch.setitem(app.config, 'LIVE_POLL_SECONDS', 0)
+    monkeypatch.setitem(app.config, 'LIVE_HEARTBEAT_SECONDS', 0.05)
+    # Earlier tests' rows are still in the shared ring, and publishes skip ids it holds
+    monkeypatch.setattr(live, 'hub', live.Hub(app.config['LIVE_BUFFER_EVENTS']))
+    with app.app_context():
+        start = live.latest_cursor()
+
+    response = client.get('/api/live/stream?patient_id=PT-000001', buffered=False)
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).startswith(b'retry:')
+        assert next(chunks) == b': keepalive\n\n'
+
+        # This worker commits a row and publishes it before another worker's
+        # lower id turns up through the tailer
+        local, remote = start['vital_sign'] + 2, start['vital_sign'] + 1
+        live.hub.publish([live.Event('vital_sign', {'id': local, 'patient_id': 1})])
+        live.hub.publish([live.Event('vital_sign', {'id': remote, 'patient_id': 1})],
+                         {'vital_sign': local, 'lab_result': start['lab_result']})
+
+        first, second = _frame_ids(next(chunks))
+        assert live.parse_cursor(first)['vital_sign'] < remote
+        assert live.parse_cursor(second)['vital_sign'] == local
+    finally:
+        response.close()
@@ -0,0 +1,55 @@
+import pytest
+from extension import db
+from models import Notification, OutboxEvent
+import outbox
+
+
+@outbox.sink('test_event')
+def _fail_on_poison(session, payloads):
+    if any(payload.get('poison') for payload in payloads):
+        raise RuntimeError('poison event')
+
+
+def _dispatch_by_hand(monkeypatch):
+    """Keep the background dispatcher idle and return the real dispatch_pending."""
+    dispatch = outbox.dispatch_pending
+    monkeypatch.setattr(outbox, 'dispatch_pending', lambda batch_size=None: 0)
+    return dispatch
+
+
+def test_dispatch_delivers_notifications(app, seed_patients, monkeypatch):
+    seed_patients(1)
+    dispatch = _dispatch_by_hand(monkeypatch)
+    with app.app_context():
+        db.session.query(OutboxEvent).delete()
+        db.session.query(Notification).delete()
+        db.session.commit()
+        outbox.notify('Lab result ready', 'lab_result', patient_id=1)
+        db.session.commit()
+
+        assert dispatch() == 1
+        assert [n.message for n in Notification.query.filter_by(patient_id=1)] == ['Lab result ready']
+        event = OutboxEvent.query.one()
+        assert event.dispatched_at is not None and event.attempts == 1
+        db.session.remove()
+
+
+def test_a_failing_event_uses_up_only_its_own_attempts(app, monkeypatch):
+    dispatch = _dispatch_by_hand(monkeypatch)
+    with app.app_context():
+        db.session.query(OutboxEvent).delete()
+        db.session.commit()
+        for i in range(5):
+            outbox.enqueue('test_event', n=i, poison=i == 2)
+        db.session.commit()
+
+        # The healthy events go out before the failure is raised
+        with pytest.raises(RuntimeError):
+            dispatch()
+        events = {event.id: event for event in OutboxEvent.query.order_by(OutboxEvent.id)}
+        poison = [event for event in events.values() if '"poison": true' in event.payload]
+        healthy = [event for event in events.values() if event not in poison]
+        assert [(event.dispatched_at is None, event.attempts) for event in poison] == [(True, 1)]
+        assert all(event.dispatched_at is not None and event.attempts == 1 for event in healthy)
+        assert len(healthy) == 4
+        db.session.remove()
@@ -0,0 +1,36 @@
+from datetime import date
+from extension import db
+from models import Prescription
+
+
+def test_chart_etag_changes_when_a_row_is_edited(app, seed_patients, client):
+    seed_patients(1)
+    with app.app_context():
+        prescription = Prescription(patient_id=1, medication_name='Amoxicillin', dosage='250mg',
+                                    start_date=date.today(), status='active')
+        db.session.add(prescription)
+        db.session.commit()
+        prescription_id = prescription.id
+
+    first = client.get('/api/patients/PT-000001')
+    assert client.get('/api/patients/PT-000001', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    with app.app_context():
+        db.session.get(Prescription, prescription_id).dosage = '500mg'
+        db.session.commit()
+    second = client.get('/api/patients/PT-000001', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['prescriptions'][0]['dosage'] == '500mg'
+
+
+def test_chart_section_limits_are_at_least_one(app, seed_patients, client):
+    seed_patients(1)
+    with app.app_context():
+        db.session.add_all([
+            Prescription(patient_id=1, medication_name=name, start_date=date.today(), status='active')
+            for name in ('Amoxicillin', 'Ibuprofen')
+        ])
+        db.session.commit()
+    response = client.get('/api/patients/PT-000001?prescriptions_limit=-5')
+    assert response.status_code == 200
+    assert len(response.get_json()['prescriptions']) == 1
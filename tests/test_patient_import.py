@@ -0,0 +1,22 @@
+from extension import db
+from models import Patient
+import identifiers
+import patient_import
+
+
+def _record(i):
+    return {'first_name': f'New{i}', 'last_name': 'Patient', 'email': f'new{i}@example.com',
+            'phone': '555-0100', 'date_of_birth': '1980-01-01'}
+
+
+def test_failed_batch_reports_only_the_bad_rows(app, seed_patients, monkeypatch):
+    seed_patients(1)
+    # The second row gets an identifier that is already taken
+    monkeypatch.setattr(identifiers, 'patient_ids', lambda count: ['PT-900001', 'PT-000001', 'PT-900003'][:count])
+    with app.app_context():
+        report = patient_import.import_patients((i, _record(i), None) for i in range(1, 4))
+        names = sorted(first for (first,) in db.session.query(Patient.first_name).filter(Patient.last_name == 'Patient'))
+    assert report['imported'] == 2
+    assert report['failed'] == 1
+    assert report['errors'] == [{'row': 2, 'error': 'Duplicate patient_id'}]
+    assert names == ['New1', 'New3']
@@ -0,0 +1,14 @@
+
+def test_patient_list_is_unpaginated_by_default(app, seed_patients, client):
+    seed_patients(150)
+    response = client.get('/api/patients')
+    assert len(response.get_json()) == 150
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_patient_list_pages_with_limit(app, seed_patients, client):
+    seed_patients(150)
+    first = client.get('/api/patients?limit=100')
+    assert len(first.get_json()) == 100
+    second = client.get(f"/api/patients?limit=100&after={first.headers['X-Next-Cursor']}")
+    assert len(second.get_json()) == 50
+    assert 'X-Next-Cursor' not in second.headers
@@ -0,0 +1,46 @@
+from sqlalchemy import insert, update
+from extension import db
+from models import Medication
+import counters
+import refdata
+
+
+def test_a_committed_change_is_seen_by_the_next_read(app, monkeypatch):
+    # Only a commit from this process should force the next read to check
+    monkeypatch.setitem(app.config, 'REFDATA_CHECK_SECONDS', 3600)
+    with app.app_context():
+        refdata.get()
+        medication = Medication(name='Refdata Aspirin', quantity=5)
+        db.session.add(medication)
+        db.session.commit()
+        assert refdata.get().medications_by_id[medication.id].name == 'Refdata Aspirin'
+
+        medication.quantity = 50
+        db.session.commit()
+        assert refdata.get().medications_by_id[medication.id].quantity == 50
+
+        db.session.delete(medication)
+        db.session.commit()
+        assert medication.id not in refdata.get().medications_by_id
+
+
+def test_another_workers_change_is_seen_after_the_check_interval(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'REFDATA_CHECK_SECONDS', 0)
+    with app.app_context():
+        refdata.get()
+        # Another worker's commit never runs this process's hooks, only bumps the version
+        medication_id = db.session.execute(
+            insert(Medication).values(name='Refdata Heparin').returning(Medication.id)
+        ).scalar_one()
+        counters.apply_deltas(db.session.connection(), {refdata.VERSION_COUNTER: 1})
+        db.session.commit()
+        assert refdata.get().medications_by_id[medication_id].name == 'Refdata Heparin'
+
+        db.session.execute(update(Medication).where(Medication.id == medication_id).values(quantity=3))
+        counters.apply_deltas(db.session.connection(), {refdata.VERSION_COUNTER: 1})
+        db.session.commit()
+        assert refdata.get().medications_by_id[medication_id].quantity == 3
+
+        db.session.query(Medication).filter_by(id=medication_id).delete()
+        counters.apply_deltas(db.session.connection(), {refdata.VERSION_COUNTER: 1})
+        db.session.commit()
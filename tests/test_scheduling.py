@@ -0,0 +1,81 @@
+import threading
+from datetime import date
+from sqlalchemy import delete, insert
+from extension import db
+from models import Appointment, Patient, User
+import events
+
+
+def _seed_doctor_and_patient(app):
+    with app.app_context():
+        db.session.execute(delete(Appointment))
+        db.session.execute(delete(Patient))
+        db.session.execute(delete(User))
+        doctors = [{'id': 1, 'username': 'house', 'email': 'house@example.com', 'role': 'doctor', 'active': True}]
+        db.session.execute(insert(User), doctors)
+        # Reported like any bulk insert, so the reference-data snapshot reloads
+        events.record(db.session, 'insert', User, doctors)
+        db.session.execute(insert(Patient), [
+            {'id': 1, 'patient_id': 'PT-000001', 'first_name': 'First1', 'last_name': 'Last1'}
+        ])
+        db.session.commit()
+
+
+def test_concurrent_bookings_of_one_slot_admit_one(app):
+    _seed_doctor_and_patient(app)
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/appointments', json={
+            'patient_id': 'PT-000001', 'doctor_id': 1, 'date': '2031-03-04', 'time': '10:00', 'duration': 30
+        })
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=book) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] + [409] * 7
+    with app.app_context():
+        assert Appointment.query.filter_by(doctor_id=1, date=date(2031, 3, 4)).count() == 1
+
+
+def test_batch_reports_non_object_items(app, client):
+    _seed_doctor_and_patient(app)
+    response = client.post('/api/appointments/batch', json={
+        'patient_id': 'PT-000001', 'doctor_id': 1, 'atomic': False,
+        'items': [{'date': '2031-03-05', 'time': '09:00'}, 'not an item', 7]
+    })
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['created', 'invalid', 'invalid']
+
+
+def test_cancelled_batch_items_do_not_take_the_slot(app, client):
+    _seed_doctor_and_patient(app)
+    response = client.post('/api/appointments/batch', json={
+        'patient_id': 'PT-000001', 'doctor_id': 1,
+        'items': [
+            {'date': '2031-03-06', 'time': '09:00', 'status': 'cancelled'},
+            {'date': '2031-03-06', 'time': '09:00'},
+        ]
+    })
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['created', 'created']
+
+
+def test_doctor_id_may_be_a_string(app, client):
+    _seed_doctor_and_patient(app)
+    response = client.post('/api/appointments', json={
+        'patient_id': 'PT-000001', 'doctor_id': '1', 'date': '2031-03-07', 'time': '10:00'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['doctor_id'] == 1
+    response = client.post('/api/appointments', json={
+        'patient_id': 'PT-000001', 'doctor_id': '1', 'date': '2031-03-07', 'time': '10:15'
+    })
+    assert response.status_code == 409
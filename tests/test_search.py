@@ -0,0 +1,17 @@
+from sqlalchemy import delete, insert
+from extension import db
+from models import Appointment, Patient
+import search_index
+
+
+def test_name_matches_rank_above_patient_id_matches(app):
+    with app.app_context():
+        db.session.execute(delete(Appointment))
+        db.session.execute(delete(Patient))
+        db.session.execute(insert(Patient), [
+            {'id': 1, 'patient_id': 'PT-ROSA1', 'first_name': 'Alan', 'last_name': 'Smith'},
+            {'id': 2, 'patient_id': 'PT-000002', 'first_name': 'Rosa', 'last_name': 'Diaz'},
+        ])
+        db.session.commit()
+        search_index.reindex()
+        assert search_index.search('rosa', ['patients'])['patients'] == [2, 1]
@@ -0,0 +1,16 @@
+import typeahead
+
+
+def test_index_is_rebuilt_after_going_over_budget(app, seed_patients, monkeypatch):
+    seed_patients(50, last_name='Typeahead')
+    with app.app_context():
+        monkeypatch.setitem(typeahead._config, 'refresh_seconds', 0)
+        monkeypatch.setitem(typeahead._config, 'rebuild_seconds', 0)
+
+        monkeypatch.setitem(typeahead._config, 'max_bytes', 1024)
+        assert typeahead.build() is None
+        assert typeahead.lookup('first1') is None
+
+        # Once the budget allows it again, the next lookup rebuilds the index
+        monkeypatch.setitem(typeahead._config, 'max_bytes', 64 * 1024 * 1024)
+        assert [patient_id for _, patient_id, _ in typeahead.lookup('first10')] == ['PT-000010']
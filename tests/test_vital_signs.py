@@ -0,0 +1,150 @@
+from datetime import datetime
+import json
+import pytest
+from sqlalchemy import update
+from extension import db
+from models import VitalRollup, VitalSign
+import counters
+import recent_vitals
+import vital_alerts
+import vitals_ingest
+
+
+def test_non_numeric_blood_pressure_is_rejected(app, seed_patients, client):
+    seed_patients(1)
+    response = client.post('/api/vital_signs', json={
+        'patient_id': 'PT-000001', 'systolic': 'abc', 'diastolic': 80
+    })
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_series_limit_is_at_least_one(app, seed_patients, client):
+    seed_patients(1)
+    with app.app_context():
+        db.session.query(VitalSign).delete()
+        db.session.commit()
+    for minute in range(3):
+        response = client.post('/api/vital_signs', json={
+            'patient_id': 'PT-000001', 'systolic': 120, 'diastolic': 80,
+            'timestamp': f'2031-03-04T10:0{minute}:00'
+        })
+        assert response.status_code == 200
+    response = client.get('/api/vital_signs/series?patient_id=PT-000001'
+                          '&start=2031-03-04T00:00:00&end=2031-03-05T00:00:00&limit=-1')
+    body = response.get_json()
+    assert body['count'] == 1
+    assert body['truncated'] is True
+
+
+def test_failed_writer_chunk_is_salvaged_and_dead_lettered(app, seed_patients, tmp_path):
+    seed_patients(1)
+    writer = vitals_ingest.Writer(app)
+    writer.retry_delay = 0
+    writer.dead_letter_path = str(tmp_path / 'dead.ndjson')
+    rows = [
+        {'patient_id': 1, 'timestamp': datetime(2031, 3, 4, 10, 0), 'heart_rate': 70},
+        {'patient_id': 1, 'timestamp': 'not a timestamp', 'heart_rate': 71},
+        {'patient_id': 1, 'timestamp': datetime(2031, 3, 4, 10, 2), 'heart_rate': 72},
+    ]
+    with app.app_context():
+        db.session.query(VitalSign).delete()
+        db.session.commit()
+        writer._write(rows)
+        written = sorted(rate for rate, in db.session.query(VitalSign.heart_rate))
+        db.session.remove()
+    assert written == [70, 72]
+    assert writer.stats()['failed'] == 1
+    assert writer.stats()['failed_chunks'] == 1
+    dead = [json.loads(line) for line in open(writer.dead_letter_path)]
+    assert [row['heart_rate'] for row in dead] == [71]
+
+
+def test_explicit_rollup_resolution_keeps_the_point_budget(app, seed_patients, client):
+    seed_patients(1)
+    with app.app_context():
+        db.session.query(VitalSign).delete()
+        db.session.query(VitalRollup).delete()
+        db.session.commit()
+    for minute in range(12):
+        client.post('/api/vital_signs', json={
+            'patient_id': 'PT-000001', 'heart_rate': 70 + minute, 'timestamp': f'2031-03-04T10:{minute:02d}:00'
+        })
+    response = client.get('/api/vital_signs/rollup?patient_id=PT-000001&resolution=1m&points=10'
+                          '&start=2031-03-04T00:00:00&end=2031-03-05T00:00:00')
+    body = response.get_json()
+    assert body['resolution'] == '1m'
+    assert len(body['buckets']) == 10
+    assert body['truncated'] is True
+    assert body['hr']['max'][0] == 70
+
+
+def test_recent_vitals_drop_readings_edited_by_another_worker(app, seed_patients, client, monkeypatch):
+    seed_patients(1)
+    with app.app_context():
+        db.session.query(VitalSign).delete()
+        db.session.commit()
+    monkeypatch.setitem(recent_vitals._config, 'refresh_seconds', 0)
+    client.post('/api/vital_signs', json={'patient_id': 'PT-000001', 'heart_rate': 70})
+    response = client.get('/api/vital_signs/latest?patient_id=PT-000001&k=1')
+    assert response.get_json()['readings']['PT-000001'][0]['heart_rate'] == 70
+
+    # What another worker's edit leaves behind: the row change and the revision bump
+    with app.app_context():
+        db.session.execute(update(VitalSign).values(heart_rate=75))
+        counters.apply_deltas(db.session.connection(), {recent_vitals.REVISION: 1})
+        db.session.commit()
+    response = client.get('/api/vital_signs/latest?patient_id=PT-000001&k=1')
+    assert response.get_json()['readings']['PT-000001'][0]['heart_rate'] == 75
+
+
+def test_string_measurements_are_coerced_for_alerting(app, seed_patients, client):
+    seed_patients(1)
+    response = client.post('/api/vital_signs', json={'patient_id': 'PT-000001', 'heart_rate': '80'})
+    assert response.status_code == 200
+
+
+def test_alert_state_changes_only_when_the_readings_commit(app, seed_patients, monkeypatch):
+    seed_patients(1)
+    detector = vital_alerts.Detector(dict(app.config, VITAL_ALERT_TRIGGER=1))
+    monkeypatch.setattr(vital_alerts, 'detector', detector)
+    with app.app_context():
+        db.session.add(VitalSign(patient_id=1, heart_rate=190, timestamp=datetime(2031, 3, 4, 10, 0)))
+        db.session.flush()
+        db.session.rollback()
+        assert detector.stats()['alerts'] == 0
+        assert 1 not in detector.states
+
+        db.session.add(VitalSign(patient_id=1, heart_rate=190, timestamp=datetime(2031, 3, 4, 10, 0)))
+        db.session.commit()
+        assert detector.stats()['alerts'] == 1
+        assert detector.states[1].open[vital_alerts.METRICS.index('heart_rate')]
+        db.session.remove()
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('{"columns": 5, "rows": [[1]]}', 'application/json'),
+    ('{"columns": ["patient_id", "hr"], "rows": [5]}', 'application/json'),
+    ('{"columns": ["patient_id", "hr"], "rows": 5}', 'application/json'),
+    ('5', 'application/json'),
+])
+def test_malformed_vitals_batch_is_a_400(client, body, content_type):
+    response = client.post('/api/vital_signs/batch', data=body, content_type=content_type)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('reading', [
+    '{"patient_id": "PT-000001", "hr": 1e999}',
+    '{"patient_id": "PT-000001", "temp": NaN}',
+    '{"patient_id": "PT-000001", "hr": 1e12}',
+    '{"patient_id": "PT-000001", "hr": 70, "ts": 1e20}',
+    '{"patient_id": "PT-000001", "hr": 70, "ts": "yesterday"}',
+])
+def test_bad_vitals_values_are_rejected_per_row(seed_patients, client, reading):
+    seed_patients(1)
+    body = reading + '\n{"patient_id": "PT-000001", "hr": 70}\n'
+    response = client.post('/api/vital_signs/batch', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 202
+    result = response.get_json()
+    assert result['accepted'] == 1
+    assert [error['row'] for error in result['errors']] == [1]
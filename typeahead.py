@@ -0,0 +1,245 @@
+from array import array
+import bisect
+import logging
+import sys
+import threading
+import time
+import unicodedata
+from models import Patient
+from extension import db
+import events
+
+# Per-process prefix index for patient typeahead. Every patient contributes
+# a few normalized terms (first name, last name, full name, patient id and
+# its digits) to one sorted list, with the owning pks in a parallel array;
+# a lookup is a bisect to the first term >= the prefix followed by a short
+# forward scan.
+#
+# The index is built from a projection query at startup and kept current
+# from this process's Patient commits. Other workers' writes are picked up
+# by a periodic delta load of new ids and a slower full rebuild. If the
+# estimated size goes over TYPEAHEAD_MEMORY_MB the index is dropped and
+# callers fall back to the database; the build is retried every
+# TYPEAHEAD_REBUILD_SECONDS in case it fits again.
+
+SCAN_FACTOR = 8
+
+
+def normalize(value):
+    value = value or ''
+    if not value.isascii():
+        value = unicodedata.normalize('NFKD', value)
+        value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.lower().split())
+
+
+def _terms(patient_id, first_name, last_name):
+    first, last = normalize(first_name), normalize(last_name)
+    terms = {first, last, f"{first} {last}".strip(), normalize(patient_id)}
+    digits = ''.join(ch for ch in patient_id or '' if ch.isdigit())
+    if digits:
+        terms.add(digits)
+    terms.discard('')
+    return terms
+
+
+class PrefixIndex:
+    """Sorted terms with a parallel array of patient pks, ordered by (term, pk)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.terms = []
+        self.pks = array('q')
+        self.patients = {}
+        self.bytes = 0
+        self.max_id = 0
+        self.over_budget = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(patient_id, first_name, last_name, terms):
+        # Rough footprint: the stored strings and dict entry, plus a string,
+        # list slot and array slot per term.
+        size = sys.getsizeof(patient_id) + sys.getsizeof(first_name) + sys.getsizeof(last_name) + 180
+        for term in terms:
+            size += sys.getsizeof(term) + 16
+        return size
+
+    def _position(self, term, pk):
+        i = bisect.bisect_left(self.terms, term)
+        while i < len(self.terms) and self.terms[i] == term and self.pks[i] < pk:
+            i += 1
+        return i
+
+    def _remove(self, pk):
+        entry = self.patients.pop(pk, None)
+        if entry is None:
+            return
+        terms = _terms(*entry)
+        for term in terms:
+            i = self._position(term, pk)
+            if i < len(self.terms) and self.terms[i] == term and self.pks[i] == pk:
+                del self.terms[i]
+                del self.pks[i]
+        self.bytes -= self._size(*entry, terms)
+
+    def _add(self, pk, patient_id, first_name, last_name):
+        entry = (patient_id, first_name, last_name)
+        terms = _terms(*entry)
+        for term in terms:
+            i = self._position(term, pk)
+            self.terms.insert(i, term)
+            self.pks.insert(i, pk)
+        self.patients[pk] = entry
+        self.bytes += self._size(*entry, terms)
+        self.max_id = max(self.max_id, pk)
+        if self.bytes > self.max_bytes:
+            self.over_budget = True
+
+    def load(self, rows):
+        """Fill an empty index from (id, patient_id, first_name, last_name) rows."""
+        pairs = []
+        for pk, patient_id, first_name, last_name in rows:
+            entry = (patient_id, first_name, last_name)
+            terms = _terms(*entry)
+            pairs.extend((term, pk) for term in terms)
+            self.patients[pk] = entry
+            self.bytes += self._size(*entry, terms)
+            self.max_id = max(self.max_id, pk)
+            if self.bytes > self.max_bytes:
+                self.over_budget = True
+                return
+        pairs.sort()
+        self.terms = [term for term, _ in pairs]
+        self.pks = array('q', (pk for _, pk in pairs))
+
+    def upsert(self, pk, patient_id, first_name, last_name):
+        with self._lock:
+            self._remove(pk)
+            self._add(pk, patient_id, first_name, last_name)
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def lookup(self, prefix, limit):
+        """Return [(pk, patient_id, name)] for patients with a term starting with `prefix`."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self.terms, prefix)
+            end = min(len(self.terms), i + limit * SCAN_FACTOR)
+            while i < end and len(results) < limit:
+                if not self.terms[i].startswith(prefix):
+                    break
+                pk = self.pks[i]
+                if pk not in seen:
+                    seen.add(pk)
+                    patient_id, first_name, last_name = self.patients[pk]
+                    results.append((pk, patient_id, f"{first_name} {last_name}"))
+                i += 1
+        return results
+
+
+_index = None
+_config = {}
+_loaded_at = 0.0
+_built_at = 0.0
+_refresh_lock = threading.Lock()
+
+
+def _projection():
+    return db.session.query(Patient.id, Patient.patient_id, Patient.first_name, Patient.last_name)
+
+
+def build():
+    """Build a fresh index from the database and swap it in."""
+    global _index, _loaded_at, _built_at
+    index = PrefixIndex(_config['max_bytes'])
+    index.load(_projection().order_by(Patient.id).yield_per(5000))
+    if index.over_budget:
+        logging.warning(
+            f"Typeahead index exceeds {_config['max_bytes'] // (1024 * 1024)}MB, falling back to the database"
+        )
+        index = None
+    _index = index
+    _loaded_at = _built_at = time.monotonic()
+    return index
+
+
+def _refresh():
+    """Load patients other workers created since the last check; rebuild on the slow interval."""
+    global _loaded_at
+    now = time.monotonic()
+    if now - _loaded_at < _config['refresh_seconds'] or not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        if now - _built_at >= _config['rebuild_seconds']:
+            build()
+            return
+        index = _index
+        if index is None:
+            return
+        for row in _projection().filter(Patient.id > index.max_id).order_by(Patient.id):
+            index.upsert(*row)
+        _loaded_at = now
+    finally:
+        _refresh_lock.release()
+
+
+def init_app(app):
+    app.config.setdefault('TYPEAHEAD_MEMORY_MB', 64)
+    app.config.setdefault('TYPEAHEAD_REFRESH_SECONDS', 10)
+    app.config.setdefault('TYPEAHEAD_REBUILD_SECONDS', 600)
+    _config.update(
+        max_bytes=app.config['TYPEAHEAD_MEMORY_MB'] * 1024 * 1024,
+        refresh_seconds=app.config['TYPEAHEAD_REFRESH_SECONDS'],
+        rebuild_seconds=app.config['TYPEAHEAD_REBUILD_SECONDS'],
+    )
+    with app.app_context():
+        build()
+
+
+def lookup(prefix, limit=10):
+    """Return [(pk, patient_id, name)], or None if the index is not available."""
+    _refresh()
+    index = _index
+    if index is None or index.over_budget:
+        return None
+    return index.lookup(prefix, limit)
+
+
+def stats():
+    index = _index
+    if index is None:
+        return {'available': False}
+    return {
+        'available': not index.over_budget,
+        'patients': len(index.patients),
+        'terms': len(index.terms),
+        'estimated_bytes': index.bytes,
+        'budget_bytes': index.max_bytes,
+    }
+
+
+@events.on_commit
+def _apply(changes):
+    global _index, _built_at
+    index = _index
+    if index is None:
+        return
+    for change in changes:
+        if change.model is not Patient:
+            continue
+        values = change.values
+        if change.action == 'delete':
+            index.remove(values['id'])
+        else:
+            index.upsert(values['id'], values['patient_id'], values['first_name'], values['last_name'])
+    if index.over_budget:
+        logging.warning("Typeahead index went over its memory budget, falling back to the database")
+        _index = None
+        _built_at = time.monotonic()
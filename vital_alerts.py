@@ -0,0 +1,283 @@
+from array import array
+import bisect
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import math
+import threading
+from models import Patient, VitalSign, parse_number
+import early_warning
+import events
+import outbox
+
+# Online anomaly detection on incoming vital signs. Each patient has a fixed
+# handful of numbers per metric: an EWMA mean and variance, the previous
+# value and its time, and the alert state. A reading is abnormal when it
+# falls in a band that scores 3 on the early-warning scale, sits more than
+# VITAL_ALERT_Z standard deviations from the patient's own recent mean, or
+# moves faster than RATE_LIMITS allow.
+#
+# Hysteresis keeps a deteriorating patient from producing an alert per
+# reading: an alert opens after VITAL_ALERT_TRIGGER consecutive abnormal
+# readings of a metric, stays open until VITAL_ALERT_CLEAR consecutive
+# normal ones, and the same metric can't alert again within
+# VITAL_ALERT_COOLDOWN_SECONDS.
+#
+# Detection runs in the flush that inserts the readings, so it covers single
+# POSTs and the batch writer alike, and alerts are added to the outbox in
+# the same transaction; the outbox dispatcher writes the `vital_alert`
+# notifications in batches. State is per process. A transaction works on
+# copies of its patients' state, which replace the detector's only once it
+# commits: a rolled-back write leaves no alert marked open without its
+# notification. Two transactions for the same patient at once (rare; the
+# batch writer is a single thread) both start from the committed state and
+# the later commit wins.
+
+METRICS = ('heart_rate', 'oxygen_saturation', 'temperature', 'systolic', 'diastolic')
+LABELS = {
+    'heart_rate': 'Heart rate',
+    'oxygen_saturation': 'SpO2',
+    'temperature': 'Temperature',
+    'systolic': 'Systolic pressure',
+    'diastolic': 'Diastolic pressure',
+}
+# Largest change per minute not flagged on its own
+RATE_LIMITS = {'heart_rate': 40, 'oxygen_saturation': 6, 'temperature': 1.0, 'systolic': 40, 'diastolic': 30}
+# Floor for the standard deviation, so a very steady signal doesn't make every wobble an outlier
+MIN_STD = {'heart_rate': 3, 'oxygen_saturation': 1, 'temperature': 0.2, 'systolic': 5, 'diastolic': 4}
+
+
+def _red_band(metric, value):
+    if metric not in early_warning.BANDS:
+        return False
+    bounds, points = early_warning.BANDS[metric]
+    return points[bisect.bisect_left(bounds, value)] == 3
+
+
+class PatientState:
+    __slots__ = ('mean', 'var', 'last', 'last_at', 'count', 'abnormal', 'normal', 'open', 'alerted_at')
+
+    def __init__(self):
+        size = len(METRICS)
+        self.mean = array('d', bytes(8 * size))
+        self.var = array('d', bytes(8 * size))
+        self.last = array('d', bytes(8 * size))
+        self.last_at = array('d', bytes(8 * size))
+        self.count = array('l', bytes(array('l').itemsize * size))
+        self.abnormal = array('l', bytes(array('l').itemsize * size))
+        self.normal = array('l', bytes(array('l').itemsize * size))
+        self.open = array('b', bytes(size))
+        self.alerted_at = array('d', [-math.inf] * size)
+
+    def copy(self):
+        state = PatientState.__new__(PatientState)
+        for name in self.__slots__:
+            setattr(state, name, array(getattr(self, name).typecode, getattr(self, name)))
+        return state
+
+
+class Staged:
+    """One transaction's state changes, applied to the detector when it commits."""
+
+    def __init__(self):
+        self.states = {}
+        self.readings = 0
+        self.abnormal = 0
+        self.alerts = 0
+
+    def merge(self, other):
+        self.states.update(other.states)
+        self.readings += other.readings
+        self.abnormal += other.abnormal
+        self.alerts += other.alerts
+
+
+class Detector:
+    def __init__(self, config):
+        self.alpha = config['VITAL_ALERT_ALPHA']
+        self.z_limit = config['VITAL_ALERT_Z']
+        self.warmup = config['VITAL_ALERT_WARMUP']
+        self.trigger = config['VITAL_ALERT_TRIGGER']
+        self.clear = config['VITAL_ALERT_CLEAR']
+        self.cooldown = config['VITAL_ALERT_COOLDOWN_SECONDS']
+        self.max_patients = config['VITAL_ALERT_MAX_PATIENTS']
+        self.states = OrderedDict()
+        self.readings = 0
+        self.abnormal = 0
+        self.alerts = 0
+        self._lock = threading.Lock()
+
+    def _state(self, patient_id, staged, parent):
+        state = staged.states.get(patient_id) or parent.states.get(patient_id)
+        if state is None:
+            with self._lock:
+                state = self.states.get(patient_id)
+                state = state.copy() if state is not None else PatientState()
+        elif patient_id not in staged.states:
+            state = state.copy()
+        staged.states[patient_id] = state
+        return state
+
+    def commit(self, staged):
+        with self._lock:
+            for patient_id, state in staged.states.items():
+                self.states[patient_id] = state
+                self.states.move_to_end(patient_id)
+            while len(self.states) > self.max_patients:
+                self.states.popitem(last=False)
+            self.readings += staged.readings
+            self.abnormal += staged.abnormal
+            self.alerts += staged.alerts
+
+    def _check(self, state, i, metric, value, at):
+        """Return why `value` is abnormal, or None; then fold it into the statistics."""
+        reason = None
+        if _red_band(metric, value):
+            reason = 'outside the safe range'
+        elif state.count[i] >= self.warmup:
+            std = max(math.sqrt(state.var[i]), MIN_STD[metric])
+            z = (value - state.mean[i]) / std
+            if abs(z) > self.z_limit:
+                reason = f"{abs(z):.1f} SD {'above' if z > 0 else 'below'} recent mean {state.mean[i]:.1f}"
+        if reason is None and state.count[i] and at > state.last_at[i]:
+            change = value - state.last[i]
+            rate = abs(change) / max((at - state.last_at[i]) / 60, 1)
+            if rate > RATE_LIMITS[metric]:
+                reason = f"{'up' if change > 0 else 'down'} {abs(change):g} from {state.last[i]:g}"
+
+        if state.count[i]:
+            diff = value - state.mean[i]
+            increment = self.alpha * diff
+            state.mean[i] += increment
+            state.var[i] = (1 - self.alpha) * (state.var[i] + diff * increment)
+        else:
+            state.mean[i] = value
+        state.count[i] += 1
+        if at >= state.last_at[i]:
+            state.last[i] = value
+            state.last_at[i] = at
+        return reason
+
+    def observe(self, patient_id, at, values, staged, parent):
+        """Feed one reading ({metric: value}, `at` in epoch seconds) into `staged`; return the alerts it opens."""
+        alerts = []
+        state = self._state(patient_id, staged, parent)
+        staged.readings += 1
+        for i, metric in enumerate(METRICS):
+            value = parse_number(values.get(metric))
+            if value is None:
+                continue
+            reason = self._check(state, i, metric, value, at)
+            if reason is None:
+                state.abnormal[i] = 0
+                state.normal[i] += 1
+                if state.open[i] and state.normal[i] >= self.clear:
+                    state.open[i] = 0
+                continue
+            staged.abnormal += 1
+            state.normal[i] = 0
+            state.abnormal[i] += 1
+            if (not state.open[i] and state.abnormal[i] >= self.trigger
+                    and at - state.alerted_at[i] >= self.cooldown):
+                state.open[i] = 1
+                state.alerted_at[i] = at
+                staged.alerts += 1
+                alerts.append((patient_id, metric, value, reason))
+        return alerts
+
+    def observe_many(self, readings, parent=None):
+        """Feed VitalSign value dicts, oldest first per patient; return (alerts opened, staged state).
+
+        `parent` holds earlier changes of the same transaction; pass the
+        result to commit() once the readings are stored.
+        """
+        staged = Staged()
+        parent = parent or Staged()
+        alerts = []
+        ordered = sorted(
+            (reading for reading in readings
+             if isinstance(reading.get('timestamp'), datetime) and reading.get('patient_id') is not None),
+            key=lambda reading: reading['timestamp']
+        )
+        for reading in ordered:
+            alerts.extend(self.observe(reading['patient_id'], reading['timestamp'].timestamp(), reading,
+                                       staged, parent))
+        return alerts, staged
+
+    def stats(self):
+        return {
+            'patients': len(self.states),
+            'readings': self.readings,
+            'abnormal_values': self.abnormal,
+            'alerts': self.alerts,
+        }
+
+
+detector = None
+
+
+def _message(metric, value, reason):
+    return f"{LABELS[metric]} {value:g}: {reason}"
+
+
+def _transaction_state(session):
+    """The Staged changes of the session's current transaction, applied when it commits."""
+    info = events.transaction_info(session)
+    staged = info.get('vital_alerts')
+    if staged is None:
+        staged = info['vital_alerts'] = Staged()
+        events.after_commit(session, lambda: detector.commit(staged))
+    return staged
+
+
+@events.on_flush
+def _detect(session, changes):
+    if detector is None:
+        return
+    readings = [change.values for change in changes if change.model is VitalSign and change.action == 'insert']
+    if not readings:
+        return
+    # Alerting must never fail the write of the readings themselves
+    try:
+        parent = _transaction_state(session)
+        alerts, staged = detector.observe_many(readings, parent)
+        if alerts:
+            outbox.enqueue_many(session, 'notification', [{
+                'patient_id': patient_id,
+                'user_id': None,
+                'message': _message(metric, value, reason),
+                'notification_type': 'vital_alert',
+            } for patient_id, metric, value, reason in alerts])
+        parent.merge(staged)
+    except Exception:
+        logging.exception("Vital sign alert detection failed")
+
+
+@events.on_commit
+def _forget(changes):
+    if detector is None:
+        return
+    with detector._lock:
+        for change in changes:
+            if change.model is Patient and (change.action == 'delete' or not change.values.get('is_active', True)):
+                detector.states.pop(change.values['id'], None)
+
+
+def stats():
+    if detector is None:
+        return {'enabled': False}
+    with detector._lock:
+        return dict(detector.stats(), enabled=True)
+
+
+def init_app(app):
+    global detector
+    app.config.setdefault('VITAL_ALERTS_ENABLED', True)
+    app.config.setdefault('VITAL_ALERT_ALPHA', 0.1)
+    app.config.setdefault('VITAL_ALERT_Z', 4.0)
+    app.config.setdefault('VITAL_ALERT_WARMUP', 20)
+    app.config.setdefault('VITAL_ALERT_TRIGGER', 2)
+    app.config.setdefault('VITAL_ALERT_CLEAR', 3)
+    app.config.setdefault('VITAL_ALERT_COOLDOWN_SECONDS', 300)
+    app.config.setdefault('VITAL_ALERT_MAX_PATIENTS', 20000)
+    detector = Detector(app.config) if app.config['VITAL_ALERTS_ENABLED'] else None
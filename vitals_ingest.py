@@ -0,0 +1,311 @@
+from collections import OrderedDict
+from datetime import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from models import Patient, VitalSign, parse_blood_pressure, parse_number
+from extension import db
+import events
+
+# Batch ingestion for bedside monitor readings. Requests are parsed and
+# validated in the request thread, patient codes are resolved through a
+# per-process cache, and the rows are handed to a bounded queue. One writer
+# thread per process drains the queue and bulk-inserts up to
+# VITALS_WRITE_BATCH_SIZE rows per transaction, so many small requests share
+# a commit. When the queue is full the request is refused and the monitor
+# gateway is told to retry, instead of piling up work the database can't
+# absorb.
+#
+# Readings have already been acknowledged with a 202 by the time they are
+# written, so a chunk that fails is retried with backoff, then written one
+# row at a time; rows that still fail are appended to the dead-letter file
+# (VITALS_DEAD_LETTER_PATH, one JSON object of VitalSign columns per line)
+# for replay rather than dropped.
+
+# Accepted input names -> VitalSign column
+FIELDS = {
+    'hr': 'heart_rate', 'heart_rate': 'heart_rate',
+    'spo2': 'oxygen_saturation', 'oxygen_saturation': 'oxygen_saturation',
+    'temp': 'temperature', 'temperature': 'temperature',
+    'sbp': 'systolic', 'systolic': 'systolic',
+    'dbp': 'diastolic', 'diastolic': 'diastolic',
+}
+INTEGER_COLUMNS = ('heart_rate', 'systolic', 'diastolic')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PatientIdMap:
+    """LRU map from patient codes (PT-1001) to primary keys."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, codes):
+        """Return {code: pk} for the codes that exist, querying only the misses."""
+        found = {}
+        missing = []
+        with self._lock:
+            for code in codes:
+                pk = self._entries.get(code)
+                if pk is None:
+                    missing.append(code)
+                else:
+                    self._entries.move_to_end(code)
+                    found[code] = pk
+        if missing:
+            rows = db.session.query(Patient.patient_id, Patient.id).filter(Patient.patient_id.in_(missing)).all()
+            with self._lock:
+                for code, pk in rows:
+                    self._entries[code] = pk
+                    found[code] = pk
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return found
+
+    def forget(self, codes):
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+
+
+patient_ids = PatientIdMap()
+
+
+@events.on_commit
+def _forget_patients(changes):
+    codes = set()
+    for change in changes:
+        if change.model is Patient and change.action != 'insert':
+            codes.add(change.values.get('patient_id'))
+            codes.add(change.previous.get('patient_id'))
+    codes.discard(None)
+    if codes:
+        patient_ids.forget(codes)
+
+
+def _timestamp(value):
+    if value is None:
+        return datetime.now()
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(value)
+    except (OverflowError, OSError, ValueError):
+        raise ValueError(f'Invalid timestamp: {value}')
+
+
+def _reading(record):
+    """Return (patient code, VitalSign values) for one input record; raises ValueError."""
+    code = record.get('patient_id')
+    if not code:
+        raise ValueError('Missing patient_id')
+    values = {'timestamp': _timestamp(record.get('timestamp', record.get('ts')))}
+    for name, column in FIELDS.items():
+        value = record.get(name)
+        if value is not None:
+            number = parse_number(value)
+            if number is None:
+                raise ValueError(f'{name} must be a finite number')
+            if column in INTEGER_COLUMNS and abs(number) >= 2 ** 31:
+                raise ValueError(f'{name} is out of range')
+            values[column] = int(number) if column in INTEGER_COLUMNS else number
+    if record.get('blood_pressure'):
+        values['blood_pressure'] = str(record['blood_pressure'])
+        values['systolic'], values['diastolic'] = parse_blood_pressure(values['blood_pressure'])
+    elif values.get('systolic') is not None and values.get('diastolic') is not None:
+        values['blood_pressure'] = f"{values['systolic']}/{values['diastolic']}"
+    if len(values) == 1:
+        raise ValueError('No measurements in reading')
+    return str(code), values
+
+
+def read_records(body, content_type):
+    """Yield (row_number, record) from an NDJSON body or a compact {columns, rows} JSON body."""
+    if 'ndjson' in (content_type or ''):
+        for number, line in enumerate(body.splitlines(), start=1):
+            if line.strip():
+                yield number, json.loads(line)
+        return
+    payload = json.loads(body)
+    if isinstance(payload, list):
+        yield from enumerate(payload, start=1)
+        return
+    columns = payload.get('columns') if isinstance(payload, dict) else None
+    if not columns:
+        raise ValueError('Expected NDJSON, a JSON array, or {"columns": [...], "rows": [...]}')
+    rows = payload.get('rows') or []
+    if not (isinstance(columns, list) and all(isinstance(column, str) for column in columns)):
+        raise ValueError('columns must be a list of names')
+    if not (isinstance(rows, list) and all(isinstance(row, list) for row in rows)):
+        raise ValueError('rows must be a list of lists')
+    shared = {key: value for key, value in payload.items() if key not in ('columns', 'rows')}
+    for number, row in enumerate(rows, start=1):
+        yield number, dict(shared, **dict(zip(columns, row)))
+
+
+def prepare(records):
+    """Validate records and resolve patients; return (rows, errors)."""
+    parsed = []
+    errors = []
+    for number, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError('Expected an object')
+            parsed.append((number,) + _reading(record))
+        except (TypeError, ValueError) as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    resolved = patient_ids.resolve({code for _, code, _ in parsed})
+    rows = []
+    for number, code, values in parsed:
+        pk = resolved.get(code)
+        if pk is None:
+            errors.append({'row': number, 'error': f'Patient not found: {code}'})
+            continue
+        values['patient_id'] = pk
+        rows.append(values)
+    errors.sort(key=lambda error: error['row'])
+    return rows, errors
+
+
+class Writer:
+    """Single background writer fed by a bounded queue of row lists."""
+
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['VITALS_QUEUE_MAX_BATCHES'])
+        self.batch_size = app.config['VITALS_WRITE_BATCH_SIZE']
+        self.retries = app.config['VITALS_WRITE_RETRIES']
+        self.retry_delay = app.config['VITALS_WRITE_RETRY_SECONDS']
+        self.dead_letter_path = app.config['VITALS_DEAD_LETTER_PATH']
+        self.written = 0
+        self.failed = 0
+        self.failed_chunks = 0
+        self.commits = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            raise QueueFull()
+
+    def _ensure_started(self):
+        # One writer per process; a forked worker starts its own.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='vitals-writer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            pending = [self.queue.get()]
+            size = len(pending[0])
+            # Combine whatever else is already queued into this transaction
+            while size < self.batch_size:
+                try:
+                    rows = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(rows)
+                size += len(rows)
+            rows = [row for chunk in pending for row in chunk]
+            with self.app.app_context():
+                try:
+                    self._write(rows)
+                finally:
+                    db.session.remove()
+            for _ in pending:
+                self.queue.task_done()
+
+    def _write(self, rows):
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                try:
+                    self._insert(chunk)
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    error = e
+            else:
+                self.failed_chunks += 1
+                logging.error(f"Vitals write of {len(chunk)} readings failed, writing them one at a time: {str(error)}")
+                self._salvage(chunk)
+
+    def _insert(self, chunk):
+        ids = db.session.execute(
+            insert(VitalSign).returning(VitalSign.id, sort_by_parameter_order=True), chunk
+        ).scalars().all()
+        events.record(db.session, 'insert', VitalSign, [dict(row, id=pk) for row, pk in zip(chunk, ids)])
+        db.session.commit()
+        self.written += len(chunk)
+        self.commits += 1
+
+    def _salvage(self, chunk):
+        """Write a failed chunk row by row and dead-letter the rows that still fail."""
+        dead = []
+        for row in chunk:
+            try:
+                self._insert([row])
+            except Exception as e:
+                db.session.rollback()
+                dead.append(dict(row, error=str(e)))
+        if not dead:
+            return
+        self.failed += len(dead)
+        try:
+            with open(self.dead_letter_path, 'a') as f:
+                f.writelines(json.dumps(row, default=str) + '\n' for row in dead)
+            logging.error(f"{len(dead)} vitals readings could not be written, see {self.dead_letter_path}")
+        except OSError as e:
+            logging.error(f"{len(dead)} vitals readings could not be written or dead-lettered: {str(e)}")
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            'queued_batches': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'written': self.written,
+            'failed': self.failed,
+            'failed_chunks': self.failed_chunks,
+            'commits': self.commits,
+        }
+
+
+writer = None
+
+
+def init_app(app):
+    global writer
+    app.config.setdefault('VITALS_QUEUE_MAX_BATCHES', 64)
+    app.config.setdefault('VITALS_WRITE_BATCH_SIZE', 5000)
+    app.config.setdefault('VITALS_MAX_REQUEST_ROWS', 10000)
+    app.config.setdefault('VITALS_RETRY_AFTER_SECONDS', 1)
+    app.config.setdefault('VITALS_WRITE_RETRIES', 3)
+    app.config.setdefault('VITALS_WRITE_RETRY_SECONDS', 0.5)
+    app.config.setdefault('VITALS_DEAD_LETTER_PATH', os.path.join(app.instance_path, 'vitals_dead_letter.ndjson'))
+    os.makedirs(app.instance_path, exist_ok=True)
+    writer = Writer(app)